@@ -1,32 +1,253 @@
 import requests
-from typing import List, Dict, Iterator
-import json
+from requests.adapters import HTTPAdapter
+from typing import List, Dict, Iterable, Iterator, Optional, Tuple, Union
+from concurrent.futures import ThreadPoolExecutor
+import os
+import re
+import threading
+import time
+import weakref
+import zlib
+
+from json_codec import get_codec
+from metrics import get_metrics
+
+# Size of the chunks a streamed request body is sent in
+UPLOAD_CHUNK_SIZE = 64 * 1024
+# Environment variable that overrides the API base URL, e.g. to point at stub_server.py
+BASE_URL_ENV = "BATCHFORGE_BASE_URL"
+# Matches the batch ID in a path, so metrics are labelled by route rather than by batch
+_BATCH_ID_PATTERN = re.compile(r"^/messages/batches/[^/]+")
+
+# Open clients, the final connection counts of closed ones, and the metrics registries the
+# api_connections_* gauges are collected for; each registry gets one collector for all clients
+_open_clients: "weakref.WeakSet[APIClient]" = weakref.WeakSet()
+_closed_connection_stats = {"requests": 0, "opened": 0, "reused": 0}
+_gauge_registries: weakref.WeakSet = weakref.WeakSet()
+_clients_lock = threading.Lock()
+
+def _connection_gauges() -> Dict[str, float]:
+    """Returns the connection counts of all clients, open and closed, as gauges for the metrics export."""
+    with _clients_lock:
+        totals = dict(_closed_connection_stats)
+        clients = list(_open_clients)
+    for client in clients:
+        for key, value in client.connection_stats().items():
+            totals[key] += value
+    return {f"api_connections_{key}": value for key, value in totals.items()}
+
+def resolve_base_url(base_url: Optional[str] = None) -> str:
+    """
+    Returns the API base URL to use: the given one, else the BATCHFORGE_BASE_URL
+    environment variable, else APIClient.BASE_URL.
+
+    :param base_url: Explicit base URL, including the version path (e.g. 'http://127.0.0.1:8000/v1')
+    :return: Base URL without a trailing slash
+    """
+    return (base_url or os.getenv(BASE_URL_ENV) or APIClient.BASE_URL).rstrip("/")
+
+def build_headers(api_key: str) -> Dict[str, str]:
+    """
+    Returns the headers sent with every Message Batches API request.
+
+    :param api_key: Anthropic API key
+    :return: Dictionary of headers
+    """
+    return {
+        "x-api-key": api_key,
+        "anthropic-version": "2023-06-01",
+        "anthropic-beta": "message-batches-2024-09-24",
+        "content-type": "application/json"
+    }
 
 class APIClient:
     BASE_URL = "https://api.anthropic.com/v1"
-    
-    def __init__(self, api_key: str):
+
+    def __init__(self, api_key: str, pool_connections: int = 10, pool_maxsize: int = 10,
+                 pool_block: bool = False, keep_alive: bool = True,
+                 timeout: Union[float, Tuple[float, float]] = (10.0, 60.0),
+                 gzip_uploads: bool = False, base_url: Optional[str] = None):
+        """
+        Creates a client that reuses pooled keep-alive connections across all calls.
+
+        The underlying session is shared by every method and is safe to use from
+        several threads at once; the connection pool is the only shared state.
+
+        :param api_key: Anthropic API key
+        :param pool_connections: Number of per-host connection pools to keep cached
+        :param pool_maxsize: Maximum number of connections kept open per host
+        :param pool_block: If True, never open more than pool_maxsize connections per host
+                           and make callers wait for a free one instead
+        :param keep_alive: If False, ask the server to close the connection after each call
+        :param timeout: Request timeout in seconds, or a (connect, read) tuple
+        :param gzip_uploads: If True, gzip-compress streamed batch creation bodies
+        :param base_url: API base URL (default: BATCHFORGE_BASE_URL if set, else BASE_URL)
+        """
         self.api_key = api_key
-        self.headers = {
-            "x-api-key": self.api_key,
-            "anthropic-version": "2023-06-01",
-            "anthropic-beta": "message-batches-2024-09-24",
-            "content-type": "application/json"
+        self.BASE_URL = resolve_base_url(base_url)
+        self.timeout = timeout
+        self.gzip_uploads = gzip_uploads
+        self.headers = build_headers(self.api_key)
+        if not keep_alive:
+            self.headers["connection"] = "close"
+
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        self._adapter = HTTPAdapter(pool_connections=pool_connections,
+                                    pool_maxsize=pool_maxsize,
+                                    pool_block=pool_block)
+        self.session.mount("https://", self._adapter)
+        self.session.mount("http://", self._adapter)
+        self.codec = get_codec()
+        self.metrics = get_metrics()
+        with _clients_lock:
+            _open_clients.add(self)
+            register = self.metrics not in _gauge_registries
+            _gauge_registries.add(self.metrics)
+        if register:
+            self.metrics.add_collector(_connection_gauges)
+
+    def __enter__(self) -> "APIClient":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Closes all pooled connections."""
+        # Closing drops the pools and their counts, so keep the final counts for the metrics export
+        with _clients_lock:
+            if self in _open_clients:
+                _open_clients.discard(self)
+                for key, value in self.connection_stats().items():
+                    _closed_connection_stats[key] += value
+        self.session.close()
+
+    def connection_stats(self) -> Dict[str, int]:
+        """
+        Returns how many connections were opened and how many requests reused one.
+
+        Counts cover the per-host pools currently held by the client.
+
+        :return: Dictionary with 'requests', 'opened' and 'reused' counts
+        """
+        pools = self._adapter.poolmanager.pools
+        opened = 0
+        total_requests = 0
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            opened += pool.num_connections
+            total_requests += pool.num_requests
+        return {
+            "requests": total_requests,
+            "opened": opened,
+            "reused": max(total_requests - opened, 0)
         }
 
-    def create_batch(self, batch: List[Dict]) -> Dict:
+    @staticmethod
+    def _endpoint(method: str, path: str) -> str:
+        """Returns the route of a request for metric labels, e.g. 'GET /messages/batches/{id}'."""
+        return f"{method} {_BATCH_ID_PATTERN.sub('/messages/batches/{id}', path)}"
+
+    def _count_sent(self, chunks: Iterable[bytes], endpoint: str) -> Iterator[bytes]:
+        """Passes a streamed request body through, counting its bytes."""
+        for chunk in chunks:
+            self.metrics.increment("api_sent_bytes_total", len(chunk), endpoint=endpoint)
+            yield chunk
+
+    def _request(self, method: str, path: str, **kwargs) -> requests.Response:
+        """
+        Sends a request through the pooled session and raises on HTTP errors.
+
+        :param method: HTTP method
+        :param path: Path relative to BASE_URL
+        :return: The response object
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        if not self.metrics.enabled:
+            response = self.session.request(method, f"{self.BASE_URL}{path}", **kwargs)
+            response.raise_for_status()
+            return response
+
+        endpoint = self._endpoint(method, path)
+        data = kwargs.get("data")
+        if isinstance(data, (bytes, str)):
+            self.metrics.increment("api_sent_bytes_total", len(data), endpoint=endpoint)
+        elif data is not None:
+            kwargs["data"] = self._count_sent(data, endpoint)
+        start = time.perf_counter()
+        try:
+            response = self.session.request(method, f"{self.BASE_URL}{path}", **kwargs)
+        except Exception as e:
+            self.metrics.increment("api_requests_total", endpoint=endpoint, status=type(e).__name__)
+            raise
+        # For streamed responses this is the time until the headers arrived
+        self.metrics.observe("api_request_seconds", time.perf_counter() - start, endpoint=endpoint)
+        self.metrics.increment("api_requests_total", endpoint=endpoint, status=str(response.status_code))
+        if response.status_code == 429:
+            self.metrics.increment("api_rate_limited_total", endpoint=endpoint)
+        if not kwargs.get("stream"):
+            # Streamed bodies are counted by the code that reads them
+            self.metrics.increment("api_received_bytes_total", len(response.content), endpoint=endpoint)
+        response.raise_for_status()
+        return response
+
+    def create_batch(self, batch: Iterable[Union[Dict, bytes]]) -> Dict:
         """
         Sends a request to create a new batch.
 
-        :param batch: List of message dictionaries to be submitted
+        The body is serialized lazily and sent with chunked transfer encoding, so only
+        one chunk of the payload is held in memory regardless of the batch size.
+
+        :param batch: Message dictionaries, or already encoded JSON requests, to be submitted
         :return: API response containing the created batch details
         """
-        url = f"{self.BASE_URL}/messages/batches"
-        payload = {"requests": batch}
-        response = requests.post(url, headers=self.headers, json=payload)
-        response.raise_for_status()
+        body = self._iter_batch_body(batch)
+        headers = {}
+        if self.gzip_uploads:
+            body = self._gzip_chunks(body)
+            headers["content-encoding"] = "gzip"
+        response = self._request("POST", "/messages/batches", data=body, headers=headers)
         return response.json()
 
+    @staticmethod
+    def _iter_batch_body(batch: Iterable[Union[Dict, bytes]]) -> Iterator[bytes]:
+        """
+        Yields the JSON body of a batch creation request in chunks of about UPLOAD_CHUNK_SIZE bytes.
+
+        :param batch: Message dictionaries or already encoded JSON requests
+        :return: Iterator of body chunks
+        """
+        dumps = get_codec().dumps
+        buffer = bytearray(b'{"requests": [')
+        separator = b""
+        for request in batch:
+            buffer += separator
+            buffer += request if isinstance(request, bytes) else dumps(request)
+            separator = b", "
+            if len(buffer) >= UPLOAD_CHUNK_SIZE:
+                yield bytes(buffer)
+                buffer.clear()
+        buffer += b"]}"
+        yield bytes(buffer)
+
+    @staticmethod
+    def _gzip_chunks(chunks: Iterable[bytes]) -> Iterator[bytes]:
+        """
+        Gzip-compresses a stream of chunks.
+
+        :param chunks: Uncompressed chunks
+        :return: Iterator of compressed chunks
+        """
+        compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+        for chunk in chunks:
+            compressed = compressor.compress(chunk)
+            if compressed:
+                yield compressed
+        yield compressor.flush()
+
     def get_batch_status(self, batch_id: str) -> Dict:
         """
         Retrieves the status of a batch.
@@ -34,11 +255,26 @@ class APIClient:
         :param batch_id: ID of the batch to get status for
         :return: API response containing the batch status
         """
-        url = f"{self.BASE_URL}/messages/batches/{batch_id}"
-        response = requests.get(url, headers=self.headers)
-        response.raise_for_status()
+        response = self._request("GET", f"/messages/batches/{batch_id}")
         return response.json()
 
+    def get_batch_status_if_changed(self, batch_id: str, etag: Optional[str] = None) -> Tuple[Optional[Dict], Optional[str]]:
+        """
+        Retrieves the status of a batch with a conditional request.
+
+        When an ETag from an earlier response is given it is sent as If-None-Match, and
+        a 304 Not Modified answer, which has no body, is reported as no change.
+
+        :param batch_id: ID of the batch to get status for
+        :param etag: ETag of the last status response for this batch
+        :return: Tuple of (status response, or None if unchanged; ETag of the response)
+        """
+        headers = {"if-none-match": etag} if etag else {}
+        response = self._request("GET", f"/messages/batches/{batch_id}", headers=headers)
+        if response.status_code == 304:
+            return None, response.headers.get("etag", etag)
+        return response.json(), response.headers.get("etag")
+
     def get_batch_results(self, batch_id: str) -> Iterator[Dict]:
         """
         Retrieves and yields batch results.
@@ -46,12 +282,27 @@ class APIClient:
         :param batch_id: ID of the batch to get results for
         :return: Iterator of batch result dictionaries
         """
-        url = f"{self.BASE_URL}/messages/batches/{batch_id}/results"
-        response = requests.get(url, headers=self.headers, stream=True)
-        response.raise_for_status()
-        for line in response.iter_lines():
-            if line:
-                yield json.loads(line)
+        loads = self.codec.loads
+        with self._request("GET", f"/messages/batches/{batch_id}/results", stream=True) as response:
+            for line in response.iter_lines():
+                if line:
+                    self.metrics.increment("api_received_bytes_total", len(line) + 1,
+                                           endpoint="GET /messages/batches/{id}/results")
+                    yield loads(line)
+
+    def open_results_stream(self, batch_id: str, offset: int = 0) -> requests.Response:
+        """
+        Opens the raw JSONL results stream of a batch, optionally starting at a byte offset.
+
+        The caller is responsible for closing the response. A server that honours the
+        Range header answers 206 Partial Content; 200 means the full stream is sent.
+
+        :param batch_id: ID of the batch to get results for
+        :param offset: Byte offset to resume from
+        :return: Streaming response object
+        """
+        headers = {"range": f"bytes={offset}-"} if offset else {}
+        return self._request("GET", f"/messages/batches/{batch_id}/results", stream=True, headers=headers)
 
     def list_batches(self, limit: int = 20) -> List[Dict]:
         """
@@ -60,11 +311,48 @@ class APIClient:
         :param limit: Number of batches to retrieve (default 20)
         :return: List of batch dictionaries
         """
-        url = f"{self.BASE_URL}/messages/batches"
+        return self.list_batches_page(limit).get("data", [])
+
+    def list_batches_page(self, limit: int = 20, after_id: Optional[str] = None,
+                          before_id: Optional[str] = None) -> Dict:
+        """
+        Retrieves one page of batches, newest first.
+
+        :param limit: Number of batches per page
+        :param after_id: Return the page of batches immediately after (older than) this batch
+        :param before_id: Return the page of batches immediately before (newer than) this batch
+        :return: API response with 'data', 'has_more', 'first_id' and 'last_id'
+        """
         params = {"limit": limit}
-        response = requests.get(url, headers=self.headers, params=params)
-        response.raise_for_status()
-        return response.json().get("data", [])
+        if after_id:
+            params["after_id"] = after_id
+        if before_id:
+            params["before_id"] = before_id
+        response = self._request("GET", "/messages/batches", params=params)
+        return response.json()
+
+    def iter_batches(self, page_size: int = 100, after_id: Optional[str] = None,
+                     prefetch: bool = True) -> Iterator[Dict]:
+        """
+        Yields every batch in the workspace, newest first, following pagination.
+
+        :param page_size: Number of batches fetched per request
+        :param after_id: Start after (older than) this batch
+        :param prefetch: If True, fetch the next page in the background while the current one is consumed
+        :return: Iterator of batch dictionaries
+        """
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            future = executor.submit(self.list_batches_page, page_size, after_id)
+            while future is not None:
+                page = future.result()
+                data = page.get("data", [])
+                future = None
+                next_after_id = page.get("last_id") or (data[-1]["id"] if data else None)
+                if page.get("has_more") and data and prefetch:
+                    future = executor.submit(self.list_batches_page, page_size, next_after_id)
+                yield from data
+                if page.get("has_more") and data and not prefetch:
+                    future = executor.submit(self.list_batches_page, page_size, next_after_id)
 
     def cancel_batch(self, batch_id: str) -> Dict:
         """
@@ -73,11 +361,9 @@ class APIClient:
         :param batch_id: ID of the batch to cancel
         :return: API response containing the canceled batch details
         """
-        url = f"{self.BASE_URL}/messages/batches/{batch_id}/cancel"
-        response = requests.post(url, headers=self.headers)
-        response.raise_for_status()
+        response = self._request("POST", f"/messages/batches/{batch_id}/cancel")
         return response.json()
 
 class APIError(Exception):
     """Custom exception for API-related errors."""
-    pass
\ No newline at end of file
+    pass
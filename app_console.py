@@ -0,0 +1,18 @@
+from typing import Optional
+from rich.console import Console
+
+_console: Optional[Console] = None
+
+def get_console() -> Console:
+    """
+    Returns the console shared by all components, creating it on first use.
+
+    The console writes to whatever sys.stdout is at the time of writing, so redirecting
+    stdout (as the headless commands do) redirects every component's output at once.
+
+    :return: The shared rich Console
+    """
+    global _console
+    if _console is None:
+        _console = Console()
+    return _console
@@ -0,0 +1,203 @@
+from typing import List, Dict, Iterable, AsyncIterator, Optional, Tuple, Union
+import asyncio
+
+try:
+    import aiohttp
+except ImportError:  # aiohttp is only needed by the asyncio client
+    aiohttp = None
+
+from api_client import APIClient, build_headers, resolve_base_url
+from json_codec import get_codec
+
+# Size of the chunks a results stream is read in
+RESULTS_CHUNK_SIZE = 64 * 1024
+
+class AsyncAPIClient:
+    """
+    An asyncio counterpart of APIClient with the same methods, for driving many
+    concurrent batch operations from a single event loop.
+
+    All calls share one aiohttp connection pool, configured like APIClient's, which is
+    created on first use inside the running event loop. Requires the optional
+    aiohttp package.
+    """
+    BASE_URL = APIClient.BASE_URL
+
+    def __init__(self, api_key: str, pool_maxsize: int = 100, pool_maxsize_per_host: int = 0,
+                 keep_alive: bool = True, timeout: Union[float, Tuple[float, float]] = (10.0, 60.0),
+                 gzip_uploads: bool = False, base_url: Optional[str] = None):
+        """
+        :param api_key: Anthropic API key
+        :param pool_maxsize: Maximum number of open connections in total
+        :param pool_maxsize_per_host: Maximum number of open connections per host (0 for no limit)
+        :param keep_alive: If False, close the connection after each call
+        :param timeout: Request timeout in seconds, or a (connect, read) tuple
+        :param gzip_uploads: If True, gzip-compress streamed batch creation bodies
+        :param base_url: API base URL (default: BATCHFORGE_BASE_URL if set, else BASE_URL)
+        """
+        if aiohttp is None:
+            raise ImportError("AsyncAPIClient requires the 'aiohttp' package. Install it with 'pip install aiohttp'.")
+        self.api_key = api_key
+        self.BASE_URL = resolve_base_url(base_url)
+        self.headers = build_headers(self.api_key)
+        self.pool_maxsize = pool_maxsize
+        self.pool_maxsize_per_host = pool_maxsize_per_host
+        self.keep_alive = keep_alive
+        self.timeout = timeout
+        self.gzip_uploads = gzip_uploads
+        self.codec = get_codec()
+        self._session: Optional["aiohttp.ClientSession"] = None
+        self._stats = {"requests": 0, "opened": 0, "reused": 0}
+
+    async def __aenter__(self) -> "AsyncAPIClient":
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        """Closes all pooled connections."""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def connection_stats(self) -> Dict[str, int]:
+        """
+        Returns how many connections were opened and how many requests reused one.
+
+        :return: Dictionary with 'requests', 'opened' and 'reused' counts
+        """
+        return dict(self._stats)
+
+    def _get_session(self) -> "aiohttp.ClientSession":
+        """Returns the shared session, creating it within the running event loop on first use."""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_maxsize,
+                                             limit_per_host=self.pool_maxsize_per_host,
+                                             force_close=not self.keep_alive)
+            if isinstance(self.timeout, tuple):
+                timeout = aiohttp.ClientTimeout(sock_connect=self.timeout[0], sock_read=self.timeout[1])
+            else:
+                timeout = aiohttp.ClientTimeout(sock_connect=self.timeout, sock_read=self.timeout)
+
+            trace_config = aiohttp.TraceConfig()
+            trace_config.on_request_start.append(self._count_stat("requests"))
+            trace_config.on_connection_create_end.append(self._count_stat("opened"))
+            trace_config.on_connection_reuseconn.append(self._count_stat("reused"))
+
+            self._session = aiohttp.ClientSession(connector=connector, timeout=timeout,
+                                                  headers=self.headers, trace_configs=[trace_config])
+        return self._session
+
+    def _count_stat(self, key: str):
+        async def count(session, context, params) -> None:
+            self._stats[key] += 1
+        return count
+
+    async def create_batch(self, batch: Iterable[Union[Dict, bytes]]) -> Dict:
+        """
+        Sends a request to create a new batch, streaming the body in chunks.
+
+        Encoding (and compressing) the body is CPU work, and a spooled draft is read from
+        disk, so every chunk is produced in the default executor: a large batch does not
+        block the event loop, and other coroutines keep running while it is uploaded.
+
+        :param batch: Message dictionaries, or already encoded JSON requests, to be submitted
+        :return: API response containing the created batch details
+        """
+        chunks = APIClient._iter_batch_body(batch)
+        headers = {}
+        if self.gzip_uploads:
+            chunks = APIClient._gzip_chunks(chunks)
+            headers["content-encoding"] = "gzip"
+
+        async def body() -> AsyncIterator[bytes]:
+            loop = asyncio.get_running_loop()
+            while True:
+                chunk = await loop.run_in_executor(None, next, chunks, None)
+                if chunk is None:
+                    return
+                yield chunk
+
+        async with self._get_session().post(f"{self.BASE_URL}/messages/batches", data=body(),
+                                            headers=headers) as response:
+            response.raise_for_status()
+            return await response.json()
+
+    async def get_batch_status(self, batch_id: str) -> Dict:
+        """
+        Retrieves the status of a batch.
+
+        :param batch_id: ID of the batch to get status for
+        :return: API response containing the batch status
+        """
+        async with self._get_session().get(f"{self.BASE_URL}/messages/batches/{batch_id}") as response:
+            response.raise_for_status()
+            return await response.json()
+
+    async def get_batch_status_if_changed(self, batch_id: str,
+                                          etag: Optional[str] = None) -> Tuple[Optional[Dict], Optional[str]]:
+        """
+        Retrieves the status of a batch with a conditional request.
+
+        :param batch_id: ID of the batch to get status for
+        :param etag: ETag of the last status response for this batch
+        :return: Tuple of (status response, or None if unchanged; ETag of the response)
+        """
+        headers = {"if-none-match": etag} if etag else {}
+        async with self._get_session().get(f"{self.BASE_URL}/messages/batches/{batch_id}",
+                                           headers=headers) as response:
+            response.raise_for_status()
+            if response.status == 304:
+                return None, response.headers.get("etag", etag)
+            return await response.json(), response.headers.get("etag")
+
+    async def get_batch_results(self, batch_id: str) -> AsyncIterator[Dict]:
+        """
+        Retrieves and yields batch results as they are received.
+
+        :param batch_id: ID of the batch to get results for
+        :return: Async iterator of batch result dictionaries
+        """
+        async with self._get_session().get(f"{self.BASE_URL}/messages/batches/{batch_id}/results") as response:
+            response.raise_for_status()
+            # Pieces of the line that is still incomplete. Only each new chunk is split, so a
+            # line spread over many chunks is joined once instead of re-scanned per chunk.
+            pending: List[bytes] = []
+            async for chunk in response.content.iter_chunked(RESULTS_CHUNK_SIZE):
+                lines = chunk.split(b"\n")
+                if len(lines) == 1:
+                    pending.append(chunk)
+                    continue
+                pending.append(lines[0])
+                lines[0] = b"".join(pending)
+                pending = [lines.pop()]
+                for line in lines:
+                    if line.strip():
+                        yield self.codec.loads(line)
+            tail = b"".join(pending)
+            if tail.strip():
+                yield self.codec.loads(tail)
+
+    async def list_batches(self, limit: int = 20) -> List[Dict]:
+        """
+        Lists all batches in the workspace.
+
+        :param limit: Number of batches to retrieve (default 20)
+        :return: List of batch dictionaries
+        """
+        params = {"limit": limit}
+        async with self._get_session().get(f"{self.BASE_URL}/messages/batches", params=params) as response:
+            response.raise_for_status()
+            return (await response.json()).get("data", [])
+
+    async def cancel_batch(self, batch_id: str) -> Dict:
+        """
+        Cancels a batch.
+
+        :param batch_id: ID of the batch to cancel
+        :return: API response containing the canceled batch details
+        """
+        async with self._get_session().post(f"{self.BASE_URL}/messages/batches/{batch_id}/cancel") as response:
+            response.raise_for_status()
+            return await response.json()
@@ -0,0 +1,148 @@
+from typing import Dict, List, Optional, Tuple
+import math
+
+from poll_scheduler import TERMINAL_STATUSES
+
+# Maximum number of request_counts samples kept per batch
+HISTORY_LENGTH = 60
+# Time constant of the exponential smoothing of processing rates, in seconds
+SMOOTHING_SECONDS = 300.0
+
+def finished_requests(request_counts: Dict[str, int]) -> int:
+    """Returns the number of requests of a batch that are no longer processing."""
+    return sum(count for status, count in request_counts.items() if status != "processing")
+
+class ThroughputAnalytics:
+    """
+    Computes processing rates and ETAs from the request_counts history of monitored batches.
+
+    Each monitor entry carries a 'history' of (time, finished requests) samples, one
+    per poll that saw progress. The rate of a batch is an exponentially weighted moving
+    average of the rates between consecutive samples, weighted by how long each
+    interval lasted, so a single burst does not swing the ETA while a stall that is
+    still going on (the time since the last sample, up to the last poll) pulls it down.
+    """
+    def __init__(self, smoothing_seconds: float = SMOOTHING_SECONDS):
+        """
+        :param smoothing_seconds: Time constant of the moving average; larger values react more slowly
+        """
+        self.smoothing_seconds = smoothing_seconds
+
+    @staticmethod
+    def record(entry: Dict, previous: Optional[Dict], polled_at: float) -> None:
+        """
+        Carries the history of a batch over to its new monitor entry, adding a sample if
+        the number of finished requests changed.
+
+        :param entry: New monitor entry, with 'request_counts'
+        :param previous: Previous monitor entry of the batch, or None
+        :param polled_at: Time of the poll that produced the new entry
+        """
+        history: List[List[float]] = list((previous or {}).get("history", []))
+        finished = finished_requests(entry["request_counts"])
+        if not history or history[-1][1] != finished:
+            history.append([polled_at, finished])
+            del history[:-HISTORY_LENGTH]
+        entry["history"] = history
+
+    def rate(self, entry: Dict) -> Optional[float]:
+        """
+        Returns the smoothed processing rate of a batch.
+
+        :param entry: Monitor entry with 'history' and 'last_polled'
+        :return: Finished requests per second, or None with fewer than two samples
+        """
+        history = entry.get("history") or []
+        if len(history) < 2:
+            return None
+        samples: List[Tuple[float, float]] = [(t, n) for t, n in history]
+        last_polled = entry.get("last_polled")
+        if last_polled is not None and last_polled > samples[-1][0]:
+            samples.append((last_polled, samples[-1][1]))
+
+        smoothed = None
+        for (t0, n0), (t1, n1) in zip(samples, samples[1:]):
+            elapsed = t1 - t0
+            if elapsed <= 0:
+                continue
+            interval_rate = (n1 - n0) / elapsed
+            if smoothed is None:
+                smoothed = interval_rate
+            else:
+                weight = 1.0 - math.exp(-elapsed / self.smoothing_seconds)
+                smoothed += weight * (interval_rate - smoothed)
+        return max(smoothed, 0.0) if smoothed is not None else None
+
+    def batch_stats(self, entry: Dict) -> Dict:
+        """
+        Returns the throughput of one batch.
+
+        :param entry: Monitor entry
+        :return: Dictionary with 'finished', 'remaining', 'rate' (requests per second or None)
+                 and 'eta' (seconds until all requests finished, 0 once finished, None if unknown)
+        """
+        counts = entry.get("request_counts", {})
+        remaining = counts.get("processing", 0)
+        rate = self.rate(entry)
+        if entry.get("status") in TERMINAL_STATUSES or (counts and not remaining):
+            eta: Optional[float] = 0.0
+        elif rate:
+            eta = remaining / rate
+        else:
+            eta = None
+        return {"finished": finished_requests(counts), "remaining": remaining, "rate": rate, "eta": eta}
+
+    def summarize(self, entries: Dict[str, Dict]) -> Dict:
+        """
+        Returns the throughput of every batch and the totals per model and overall.
+
+        Batches submitted with several models are counted under 'mixed', batches whose
+        model is not known under 'unknown'.
+
+        :param entries: Monitor entries by batch ID
+        :return: Dictionary with 'batches' (batch_stats by batch ID), 'models' and 'total'; the
+                 latter two hold 'batches', 'running', 'finished', 'remaining', 'rate' (sum of the
+                 rates of the running batches) and 'eta' (remaining requests at that rate)
+        """
+        batches = {batch_id: self.batch_stats(entry) for batch_id, entry in entries.items()}
+        models: Dict[str, Dict] = {}
+        total = self._empty_totals()
+        for batch_id, stats in batches.items():
+            names = entries[batch_id].get("models") or []
+            model = names[0] if len(names) == 1 else "mixed" if names else "unknown"
+            totals = models.get(model)
+            if totals is None:
+                totals = models[model] = self._empty_totals()
+            for bucket in (totals, total):
+                bucket["batches"] += 1
+                bucket["finished"] += stats["finished"]
+                bucket["remaining"] += stats["remaining"]
+                if stats["eta"] != 0.0:
+                    bucket["running"] += 1
+                    bucket["rate"] += stats["rate"] or 0.0
+        for bucket in list(models.values()) + [total]:
+            if not bucket["remaining"]:
+                bucket["eta"] = 0.0
+            elif bucket["rate"]:
+                bucket["eta"] = bucket["remaining"] / bucket["rate"]
+        return {"batches": batches, "models": models, "total": total}
+
+    @staticmethod
+    def _empty_totals() -> Dict:
+        return {"batches": 0, "running": 0, "finished": 0, "remaining": 0, "rate": 0.0, "eta": None}
+
+def format_duration(seconds: Optional[float]) -> str:
+    """
+    Formats an ETA for display.
+
+    :param seconds: Duration in seconds, or None if unknown
+    :return: String such as '2h 05m', '4m 10s' or '-' if unknown
+    """
+    if seconds is None:
+        return "-"
+    seconds = int(round(seconds))
+    if seconds >= 3600:
+        return f"{seconds // 3600}h {seconds % 3600 // 60:02d}m"
+    if seconds >= 60:
+        return f"{seconds // 60}m {seconds % 60:02d}s"
+    return f"{seconds}s"
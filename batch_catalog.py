@@ -0,0 +1,142 @@
+from typing import Dict, List, Optional
+import json
+import sqlite3
+import threading
+
+from poll_scheduler import TERMINAL_STATUSES
+from storage import get_data_path
+
+class BatchCatalog:
+    """
+    A local catalog of batch metadata, so that listing and filtering batches does not
+    need to page through the API every time.
+
+    sync() is incremental: it pages through the batch list newest first and stops as soon
+    as it reaches the newest batch seen by the previous sync, then refreshes only the
+    catalogued batches that had not finished yet.
+    """
+    def __init__(self, db_path: Optional[str] = None):
+        """
+        :param db_path: Path of the SQLite database (default: 'catalog.sqlite3' in the data directory)
+        """
+        self.db_path = db_path or get_data_path("catalog.sqlite3")
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS batches (
+                    id TEXT PRIMARY KEY,
+                    processing_status TEXT,
+                    created_at TEXT,
+                    ended_at TEXT,
+                    data TEXT NOT NULL
+                )""")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS batches_status ON batches (processing_status, created_at)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS batches_created ON batches (created_at)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS sync_state (key TEXT PRIMARY KEY, value TEXT)")
+
+    def close(self) -> None:
+        """Closes the catalog database."""
+        self._conn.close()
+
+    def upsert(self, batches: List[Dict]) -> None:
+        """
+        Adds or updates batches in the catalog.
+
+        :param batches: Batch dictionaries as returned by the API
+        """
+        rows = [(batch["id"], batch.get("processing_status"), batch.get("created_at"), batch.get("ended_at"),
+                 json.dumps(batch)) for batch in batches]
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO batches VALUES (?, ?, ?, ?, ?)", rows)
+
+    def _get_state(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM sync_state WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_state(self, key: str, value: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO sync_state VALUES (?, ?)", (key, value))
+
+    def sync(self, api_client, full: bool = False, page_size: int = 100) -> int:
+        """
+        Brings the catalog up to date with the API.
+
+        :param api_client: APIClient used to list batches
+        :param full: If True, page through all batches instead of stopping at the last synced one
+        :param page_size: Number of batches fetched per request
+        :return: Number of batches fetched from the API
+        """
+        last_newest_id = None if full else self._get_state("newest_id")
+        newest_id = None
+        pending: List[Dict] = []
+        seen = set()
+        # An incremental sync usually stops on the first page, so only prefetch on a full pass
+        for batch in api_client.iter_batches(page_size, prefetch=last_newest_id is None):
+            if newest_id is None:
+                newest_id = batch["id"]
+            if batch["id"] == last_newest_id:
+                break
+            pending.append(batch)
+            seen.add(batch["id"])
+            if len(pending) >= page_size:
+                self.upsert(pending)
+                pending = []
+        self.upsert(pending)
+
+        if not full:
+            # Batches that were still running at the last sync are not on the new pages
+            refreshed = [api_client.get_batch_status(batch_id) for batch_id in self._unfinished_ids()
+                         if batch_id not in seen]
+            self.upsert(refreshed)
+            seen.update(batch["id"] for batch in refreshed)
+
+        if newest_id is not None:
+            self._set_state("newest_id", newest_id)
+        return len(seen)
+
+    def _unfinished_ids(self) -> List[str]:
+        placeholders = ", ".join("?" for _ in TERMINAL_STATUSES)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT id FROM batches WHERE processing_status NOT IN ({placeholders})", TERMINAL_STATUSES
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def query(self, status: Optional[str] = None, created_after: Optional[str] = None,
+              created_before: Optional[str] = None, limit: Optional[int] = None) -> List[Dict]:
+        """
+        Returns catalogued batches, newest first.
+
+        :param status: Only return batches with this processing status
+        :param created_after: Only return batches created at or after this ISO 8601 timestamp
+        :param created_before: Only return batches created before this ISO 8601 timestamp
+        :param limit: Maximum number of batches to return
+        :return: List of batch dictionaries
+        """
+        clauses = []
+        params: List = []
+        if status:
+            clauses.append("processing_status = ?")
+            params.append(status)
+        if created_after:
+            clauses.append("created_at >= ?")
+            params.append(created_after)
+        if created_before:
+            clauses.append("created_at < ?")
+            params.append(created_before)
+        sql = "SELECT data FROM batches"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY created_at DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM batches").fetchone()[0]
@@ -0,0 +1,195 @@
+from typing import Dict, List, Optional, Tuple, TYPE_CHECKING
+import threading
+import time
+
+from app_console import get_console
+from batch_analytics import format_duration
+from poll_scheduler import TERMINAL_STATUSES
+
+if TYPE_CHECKING:
+    from rich.table import Table
+
+# Request count columns of the dashboard, in display order
+COUNT_COLUMNS = ["processing", "succeeded", "errored", "canceled", "expired"]
+# Terminal lines taken by the title, header, borders and caption of the table
+TABLE_CHROME_LINES = 9
+
+class BatchDashboard:
+    """
+    A live view of the monitored batches that is redrawn in place.
+
+    Polling runs on a background thread and only updates the monitor's entries, while
+    the calling thread renders at no more than refresh_per_second frames per second
+    and only redraws when something changed: a batch status, a poll finishing or the
+    page turning. The row of each batch, including its processing rate and ETA, is
+    built once and reused until the batch is polled again, and only the rows of the visible page are put into the
+    table, so a list of thousands of batches costs no more to draw than one page.
+    Running batches are listed first; when they do not fit on one page the pages turn
+    every page_seconds.
+    """
+    def __init__(self, batch_monitor, refresh_per_second: float = 4.0, poll_interval: float = 10.0,
+                 page_size: Optional[int] = None, page_seconds: float = 5.0):
+        """
+        :param batch_monitor: BatchMonitor holding the monitored batches
+        :param refresh_per_second: Maximum number of redraws per second
+        :param poll_interval: Seconds between two background polls of all running batches
+        :param page_size: Rows per page (default: as many as fit in the terminal)
+        :param page_seconds: Seconds each page is shown when there are several
+        """
+        self.batch_monitor = batch_monitor
+        self.refresh_per_second = refresh_per_second
+        self.poll_interval = poll_interval
+        self.page_size = page_size
+        self.page_seconds = page_seconds
+        self.console = get_console()
+        self.last_poll: Optional[float] = None
+        self.errors: Dict[str, Exception] = {}
+        self._polls = 0
+        self._rows: Dict[str, Tuple[Tuple, Tuple[str, ...]]] = {}
+        self._ordered: List[Tuple[str, Dict]] = []
+        self._ordered_version: Optional[int] = None
+
+    def _poll_loop(self, stop: threading.Event) -> None:
+        """Polls the running batches every poll_interval seconds until stopped."""
+        while not stop.is_set():
+            try:
+                self.errors = self.batch_monitor.poll_all()
+            except Exception as e:
+                self.errors = {"*": e}
+            self.last_poll = time.time()
+            self._polls += 1
+            stop.wait(self.poll_interval)
+
+    def _row(self, batch_id: str, entry: Dict) -> Tuple[str, ...]:
+        """Returns the table cells of a batch, rebuilding them only when it was polled again."""
+        counts = entry["request_counts"]
+        key = (entry["status"], tuple(counts.get(column, 0) for column in COUNT_COLUMNS), entry.get("last_polled"))
+        cached = self._rows.get(batch_id)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        stats = self.batch_monitor.analytics.batch_stats(entry)
+        rate = f"{stats['rate']:.2f}" if stats["rate"] is not None else "-"
+        row = (batch_id, entry["status"]) + tuple(str(count) for count in key[1]) + (rate, format_duration(stats["eta"]))
+        self._rows[batch_id] = (key, row)
+        return row
+
+    def _ordered_batches(self) -> List[Tuple[str, Dict]]:
+        """Returns the monitored batches with running ones first, re-sorted only when the monitor changed."""
+        version = self.batch_monitor.version
+        if version != self._ordered_version:
+            batches = self.batch_monitor.snapshot()
+            self._ordered = sorted(batches, key=lambda item: (item[1]["status"] in TERMINAL_STATUSES, item[0]))
+            self._ordered_version = version
+            # Forget cached rows of batches that are no longer monitored
+            if len(self._rows) > len(batches):
+                monitored = {batch_id for batch_id, _ in batches}
+                self._rows = {batch_id: row for batch_id, row in self._rows.items() if batch_id in monitored}
+        return self._ordered
+
+    def _rows_per_page(self) -> int:
+        if self.page_size:
+            return self.page_size
+        return max(self.console.size.height - TABLE_CHROME_LINES, 5)
+
+    def page_count(self) -> int:
+        """Returns the number of pages the monitored batches take up."""
+        return max(-(-len(self._ordered_batches()) // self._rows_per_page()), 1)
+
+    def summary(self) -> str:
+        """
+        Returns a one-line overview of the monitored batches: how many there are in each
+        status and how many of their requests have finished.
+        """
+        batches = self._ordered_batches()
+        if not batches:
+            return "[yellow]No active batches[/yellow]"
+        statuses: Dict[str, int] = {}
+        finished = 0
+        total = 0
+        for _, entry in batches:
+            statuses[entry["status"]] = statuses.get(entry["status"], 0) + 1
+            counts = entry["request_counts"]
+            processing = counts.get("processing", 0)
+            done = sum(counts.get(column, 0) for column in COUNT_COLUMNS[1:])
+            finished += done
+            total += processing + done
+        by_status = ", ".join(f"{count} {status}" for status, count in sorted(statuses.items()))
+        return f"{len(batches)} batches ({by_status}), {finished:,} of {total:,} requests finished"
+
+    def render(self, page: int = 0) -> "Table":
+        """
+        Builds the table for one page of the monitored batches.
+
+        :param page: Index of the page to show
+        :return: Table with the rows of that page and a caption with the summary
+        """
+        from rich.table import Table
+
+        batches = self._ordered_batches()
+        per_page = self._rows_per_page()
+        pages = self.page_count()
+        page = page % pages
+
+        table = Table(title="Monitored Batches")
+        table.add_column("Batch ID", style="cyan")
+        table.add_column("Status", style="magenta")
+        table.add_column("Processing", style="blue")
+        table.add_column("Succeeded", style="green")
+        table.add_column("Errored", style="red")
+        table.add_column("Canceled", style="yellow")
+        table.add_column("Expired", style="dim")
+        table.add_column("Req/s", justify="right")
+        table.add_column("ETA", justify="right")
+        for batch_id, entry in batches[page * per_page:(page + 1) * per_page]:
+            table.add_row(*self._row(batch_id, entry))
+
+        footer = [self.summary()]
+        throughput = self.batch_monitor.throughput()
+        total = throughput["total"]
+        if total["running"]:
+            footer.append(f"{total['rate']:.2f} req/s, ETA {format_duration(total['eta'])}")
+        if pages > 1:
+            footer.append(f"page {page + 1}/{pages}")
+        if self.last_poll is not None:
+            footer.append(f"last poll {time.strftime('%H:%M:%S', time.localtime(self.last_poll))}")
+        if self.errors:
+            footer.append(f"[red]{len(self.errors)} failed polls[/red]")
+        footer.append("Ctrl+C to return")
+        lines = [" · ".join(footer)]
+        if len(throughput["models"]) > 1:
+            lines.append(" · ".join(f"{model}: {totals['rate']:.2f} req/s, ETA {format_duration(totals['eta'])}"
+                                    for model, totals in sorted(throughput["models"].items()) if totals["running"]))
+        table.caption = "\n".join(line for line in lines if line)
+        return table
+
+    def run(self) -> None:
+        """Shows the dashboard until Ctrl+C is pressed, polling the running batches in the background."""
+        from rich.live import Live
+
+        if not self.batch_monitor.snapshot():
+            self.console.print("[yellow]No active batches to monitor.[/yellow]")
+            return
+
+        stop = threading.Event()
+        # A daemon thread, so a poll still in flight when the dashboard closes does not hold it open
+        poller = threading.Thread(target=self._poll_loop, args=(stop,), daemon=True)
+        poller.start()
+        frame_time = 1.0 / self.refresh_per_second
+        started = time.monotonic()
+        drawn = None
+        try:
+            with Live(self.render(), console=self.console, auto_refresh=False) as live:
+                while True:
+                    frame_start = time.monotonic()
+                    page = int((frame_start - started) / self.page_seconds) % self.page_count()
+                    state = (self.batch_monitor.version, self._polls, page)
+                    if state != drawn:
+                        live.update(self.render(page), refresh=True)
+                        drawn = state
+                    time.sleep(max(frame_time - (time.monotonic() - frame_start), 0.0))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            stop.set()
+        for batch_id, error in self.errors.items():
+            self.console.print(f"[red]Error updating status for batch {batch_id}: {str(error)}[/red]")
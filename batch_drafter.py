@@ -1,108 +1,552 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, MutableSequence, Iterable, Iterator, Tuple, Optional, Callable, Set, TextIO, Union, TYPE_CHECKING
+from functools import lru_cache
+import glob
 import json
 import os
-import csv
-from rich.console import Console
-from rich.table import Table
+import re
+import time
+
+from app_console import get_console
+from draft_store import RecordDraftStore, SpooledDraftStore
+from draft_validator import DraftValidator
+from json_codec import get_codec
+from metrics import get_metrics
+from records import RequestRecord
+from token_estimator import TokenEstimator
+
+if TYPE_CHECKING:
+    from rich.table import Table
+
+# Number of characters read per chunk when incrementally parsing JSON files
+IMPORT_READ_SIZE = 64 * 1024
+# Number of request records buffered before they are flushed into the draft
+IMPORT_SINK_SIZE = 1000
+# Number of rows shown per page by view_batch
+VIEW_PAGE_SIZE = 100
+# File extensions that can be imported
+IMPORT_EXTENSIONS = ['.txt', '.json', '.jsonl', '.csv']
+
+_CUSTOM_ID_PATTERN = re.compile(rb'^\{"custom_id":\s*("(?:[^"\\]|\\.)*")')
+# Characters the API does not allow in a custom_id
+_INVALID_ID_CHARACTERS = re.compile(r'[^A-Za-z0-9_-]')
+# Maximum length of a custom_id
+MAX_CUSTOM_ID_LENGTH = 64
+
+@lru_cache(maxsize=256)
+def _custom_id_stem(file_path: str) -> str:
+    """Returns the file name without its extension, with characters not allowed in a custom_id replaced by '_'."""
+    return _INVALID_ID_CHARACTERS.sub("_", os.path.splitext(os.path.basename(file_path))[0])
+
+def default_custom_id(file_path: str, number: int) -> str:
+    """
+    Returns the custom_id of a prompt imported without one: the file name stem and the
+    line or entry number, e.g. 'prompts_1' for the first line of 'prompts.txt'. The stem
+    is shortened so the ID stays within MAX_CUSTOM_ID_LENGTH.
+
+    :param file_path: Path of the imported file
+    :param number: Line number, or number of the entry in a JSON array
+    :return: A custom_id the API accepts
+    """
+    return _numbered_custom_id(_custom_id_stem(file_path), number)
+
+def _numbered_custom_id(stem: str, number: int) -> str:
+    """Returns f"{stem}_{number}", with the stem shortened so the ID stays within MAX_CUSTOM_ID_LENGTH."""
+    suffix = f"_{number}"
+    return stem[:MAX_CUSTOM_ID_LENGTH - len(suffix)] + suffix
+
+def _parse_import_file(task: Tuple[str, str, str, int]) -> Dict:
+    """
+    Parses one file of a multi-file import into a JSONL file of encoded requests.
+    Runs in a worker process, so its console output is captured and returned.
+
+    :param task: Tuple of (input path, output path, model, max_tokens)
+    :return: Dictionary with 'file', 'output', 'rows', 'seconds', 'worker' (process ID),
+             'log' (captured console output) and 'error' (None on success)
+    """
+    import io
+    from rich.console import Console
+
+    file_path, output_path, model, max_tokens = task
+    start = time.perf_counter()
+    drafter = BatchDrafter()
+    drafter.console = Console(file=io.StringIO(), width=200)
+    extension = os.path.splitext(file_path)[1].lower()
+    codec = drafter.codec
+    rows = 0
+    error = None
+    try:
+        with open(file_path, 'r', newline='' if extension == '.csv' else None) as file, \
+                open(output_path, 'wb') as output:
+            rows_iter = drafter._iter_rows(file, file_path, extension)
+            for request in drafter._iter_requests(rows_iter, model, max_tokens):
+                encoded = request.encode(codec) if isinstance(request, RequestRecord) else codec.dumps(request)
+                output.write(encoded + b"\n")
+                rows += 1
+    except Exception as e:
+        error = str(e)
+    return {"file": file_path, "output": output_path, "rows": rows, "seconds": time.perf_counter() - start,
+            "worker": os.getpid(), "log": drafter.console.file.getvalue(), "error": error}
 
 class BatchDrafter:
-    def __init__(self, config_manager=None):
-        self.current_batch: List[Dict] = []
+    def __init__(self, config_manager=None, spool_path: Optional[str] = None):
+        """
+        :param config_manager: Optional configuration manager
+        :param spool_path: If given, the draft is spooled to this file instead of being kept
+                           in memory, and an existing draft at this path is reopened
+        """
+        self.current_batch: MutableSequence[Dict] = SpooledDraftStore(spool_path) if spool_path else RecordDraftStore()
         self.config_manager = config_manager
-        self.console = Console()
+        self.codec = get_codec()
+        self.token_estimator = TokenEstimator()
+        self.validator = DraftValidator()
+        self.console = get_console()
+        self.metrics = get_metrics()
 
-    def import_batch(self, file_path: str, model: str, max_tokens: int) -> None:
+    def import_batch(self, file_path: str, model: str, max_tokens: int) -> Optional[int]:
         """
         Imports prompts from a file to create a new batch.
         Supports .txt, .json, .jsonl, and .csv file formats.
+
+        The file is streamed through generator stages (file -> rows -> requests) into
+        the draft, so apart from the draft itself the import holds at most one read
+        chunk (IMPORT_READ_SIZE), the JSON value being decoded and IMPORT_SINK_SIZE
+        pending requests in memory, regardless of the size of the file.
+
+        :return: Number of prompts imported, or None if the file could not be imported
         """
         file_name, file_extension = os.path.splitext(file_path)
-        
-        if file_extension.lower() == '.txt':
-            self._import_from_txt(file_path, model, max_tokens)
-        elif file_extension.lower() in ['.json', '.jsonl']:
-            self._import_from_json(file_path, model, max_tokens)
-        elif file_extension.lower() == '.csv':
-            self._import_from_csv(file_path, model, max_tokens)
+        extension = file_extension.lower()
+
+        if extension == '.txt':
+            label = "text"
+        elif extension in ['.json', '.jsonl']:
+            label = "JSON/JSONL"
+        elif extension == '.csv':
+            label = "CSV"
         else:
             self.console.print(f"[red]Unsupported file format: {file_extension}[/red]")
+            return None
 
-    def _import_from_csv(self, file_path: str, model: str, max_tokens: int) -> None:
-        """
-        Imports prompts from a CSV file, supporting multiline prompts.
-        Expected CSV format: custom_id,content
-        """
         try:
-            with open(file_path, 'r', newline='') as csvfile:
-                csv_reader = csv.reader(csvfile)
-                headers = next(csv_reader)  # Read the header row
-                
-                if len(headers) != 2 or headers[0].lower() != 'custom_id' or headers[1].lower() != 'content':
-                    raise ValueError("CSV file must have 'custom_id' and 'content' columns")
-
-                for row in csv_reader:
-                    if len(row) == 2:
-                        custom_id, content = row
-                        content = content.strip()
-                        if content:
-                            self.add_message(custom_id, model, max_tokens, content)
-                    else:
-                        self.console.print(f"[yellow]Skipping invalid row: {row}[/yellow]")
-
-            self.console.print(f"[green]Successfully imported prompts from {file_path}[/green]")
+            with self.metrics.timer("stage_seconds", stage="import"), \
+                    open(file_path, 'r', newline='' if extension == '.csv' else None) as file:
+                imported = self._run_import(file, file_path, extension, model, max_tokens)
+            self.metrics.increment("imported_requests_total", imported)
+            self.console.print(f"[green]Successfully imported {imported} prompts from {file_path}[/green]")
+            return imported
         except Exception as e:
-            self.console.print(f"[red]Error importing from CSV file: {str(e)}[/red]")
+            self.console.print(f"[red]Error importing from {label} file: {str(e)}[/red]")
+            return None
 
-    def _import_from_txt(self, file_path: str, model: str, max_tokens: int) -> None:
+    @staticmethod
+    def expand_import_paths(patterns: Iterable[str]) -> List[str]:
         """
-        Imports prompts from a text file, using line numbers as part of the custom_id.
+        Expands paths, directories and glob patterns into the list of files to import.
+
+        Directories contribute the files with a supported extension directly inside them,
+        and glob patterns (where '**' matches subdirectories) the supported files they
+        match. Each group is sorted by path, and files listed twice are imported once.
+
+        :param patterns: File paths, directory paths or glob patterns
+        :return: Paths of the files to import, in import order
         """
-        try:
-            with open(file_path, 'r') as file:
-                for line_number, content in enumerate(file, 1):
-                    content = content.strip()
-                    if content:
-                        custom_id = f"{os.path.basename(file_path)}_{line_number}"
-                        self.add_message(custom_id, model, max_tokens, content)
-            self.console.print(f"[green]Successfully imported prompts from {file_path}[/green]")
-        except Exception as e:
-            self.console.print(f"[red]Error importing from text file: {str(e)}[/red]")
+        paths: List[str] = []
+        for pattern in patterns:
+            if os.path.isdir(pattern):
+                matches = sorted(os.path.join(pattern, name) for name in os.listdir(pattern))
+            elif glob.has_magic(pattern):
+                matches = sorted(glob.glob(pattern, recursive=True))
+            else:
+                paths.append(pattern)
+                continue
+            paths.extend(path for path in matches
+                         if os.path.isfile(path) and os.path.splitext(path)[1].lower() in IMPORT_EXTENSIONS)
+        seen: Set[str] = set()
+        unique = []
+        for path in paths:
+            key = os.path.abspath(path)
+            if key not in seen:
+                seen.add(key)
+                unique.append(path)
+        return unique
 
-    def _import_from_json(self, file_path: str, model: str, max_tokens: int) -> None:
+    def import_files(self, patterns: Iterable[str], model: str, max_tokens: int,
+                     max_workers: Optional[int] = None) -> Optional[int]:
         """
-        Imports prompts from a JSON or JSONL file.
+        Imports prompts from several files, directories or glob patterns.
+
+        A single file is streamed like import_batch. Several files are parsed in a process
+        pool, since CSV and JSON parsing is CPU-bound; every worker writes the requests of
+        its file to a temporary JSONL file, and the files are merged into the draft in the
+        order of expand_import_paths as soon as each one is ready. A custom_id that is
+        already in the draft or was imported from an earlier file gets a numeric suffix
+        ('_2', '_3', ...), so the draft never holds the same custom_id twice. Rows per
+        second of each worker are reported when the import finishes.
+
+        :param patterns: File paths, directory paths or glob patterns
+        :param model: Model name for the imported prompts
+        :param max_tokens: max_tokens for the imported prompts
+        :param max_workers: Number of worker processes (default: number of CPUs)
+        :return: Number of prompts imported, or None if no file could be imported
         """
-        try:
-            with open(file_path, 'r') as file:
-                if file_path.lower().endswith('.jsonl'):
-                    for line_number, line in enumerate(file, 1):
-                        data = json.loads(line)
-                        self._process_json_entry(data, file_path, line_number, model, max_tokens)
+        paths = self.expand_import_paths(patterns)
+        if not paths:
+            self.console.print("[red]No files to import.[/red]")
+            return None
+        unsupported = [path for path in paths if os.path.splitext(path)[1].lower() not in IMPORT_EXTENSIONS]
+        for path in unsupported:
+            self.console.print(f"[red]Unsupported file format: {path}[/red]")
+        paths = [path for path in paths if path not in unsupported]
+        if len(paths) <= 1:
+            return self.import_batch(paths[0], model, max_tokens) if paths else None
+
+        import tempfile
+        from concurrent.futures import ProcessPoolExecutor
+        from rich.progress import Progress, TextColumn, BarColumn, MofNCompleteColumn
+
+        spool_path = getattr(self.current_batch, "path", None)
+        temp_root = os.path.dirname(os.path.abspath(spool_path)) if spool_path else None
+        workers = min(max_workers or os.cpu_count() or 1, len(paths))
+        seen_ids = self._draft_custom_ids()
+        imported = 0
+        renamed = 0
+        failed = 0
+        reports: List[Dict] = []
+        with self.metrics.timer("stage_seconds", stage="import"), \
+                tempfile.TemporaryDirectory(prefix="import_", dir=temp_root) as temp_dir, \
+                ProcessPoolExecutor(max_workers=workers) as executor, \
+                Progress(TextColumn("[progress.description]{task.description}"), BarColumn(),
+                         MofNCompleteColumn(), transient=True, console=self.console) as progress:
+            task = progress.add_task(f"[cyan]Importing {len(paths)} files with {workers} workers...", total=len(paths))
+            tasks = [(path, os.path.join(temp_dir, f"{index}.jsonl"), model, max_tokens)
+                     for index, path in enumerate(paths)]
+            # map() yields in submission order, so files are merged deterministically while later ones are still parsed
+            for report in executor.map(_parse_import_file, tasks):
+                if report["log"]:
+                    self.console.print(report["log"].rstrip(), markup=False)
+                if report["error"] is not None:
+                    self.console.print(f"[red]Error importing {report['file']}: {report['error']}[/red]")
+                    failed += 1
                 else:
-                    data = json.load(file)
-                    if isinstance(data, list):
-                        for index, entry in enumerate(data):
-                            self._process_json_entry(entry, file_path, index + 1, model, max_tokens)
-                    elif isinstance(data, dict):
-                        self._process_json_entry(data, file_path, 1, model, max_tokens)
-            self.console.print(f"[green]Successfully imported prompts from {file_path}[/green]")
-        except Exception as e:
-            self.console.print(f"[red]Error importing from JSON/JSONL file: {str(e)}[/red]")
+                    count, file_renamed = self._merge_import_file(report["output"], seen_ids)
+                    imported += count
+                    renamed += file_renamed
+                    # Time a worker spent parsing its file; the merge is part of the 'import' stage
+                    self.metrics.observe("stage_seconds", report["seconds"], stage="parse")
+                    reports.append(report)
+                # A worker that could not open its file never created the output
+                if os.path.exists(report["output"]):
+                    os.remove(report["output"])
+                progress.update(task, advance=1)
+
+        if failed == len(paths):
+            return None
+        self.metrics.increment("imported_requests_total", imported)
+        self.console.print(self.format_import_report(reports))
+        if renamed:
+            self.console.print(f"[yellow]Renamed {renamed} duplicate custom_ids.[/yellow]")
+        self.console.print(f"[green]Successfully imported {imported} prompts from {len(paths) - failed} files[/green]")
+        return imported
+
+    def _draft_custom_ids(self) -> Set[str]:
+        """Returns the custom_ids already in the draft."""
+        if not hasattr(self.current_batch, "iter_raw"):
+            return {request["custom_id"] for request in self.current_batch}
+        return {self._raw_custom_id(line) for line in self.current_batch.iter_raw()}
 
-    def _process_json_entry(self, entry: Dict, file_path: str, index: int, model: str, max_tokens: int) -> None:
+    def _raw_custom_id(self, line: bytes) -> str:
+        """Extracts the custom_id of an encoded request, decoding only that field when possible."""
+        match = _CUSTOM_ID_PATTERN.match(line)
+        if match:
+            return self.codec.loads(match.group(1))
+        return self.codec.loads(line)["custom_id"]
+
+    def _merge_import_file(self, path: str, seen_ids: Set[str]) -> Tuple[int, int]:
         """
-        Processes a single JSON entry and adds it to the batch.
+        Appends the encoded requests of a parsed file to the draft, renaming custom_ids
+        that are already taken.
+
+        :param path: JSONL file written by a worker
+        :param seen_ids: custom_ids already in the draft; updated with the appended ones
+        :return: Tuple of (requests appended, custom_ids renamed)
         """
-        custom_id = entry.get('custom_id', f"{os.path.basename(file_path)}_{index}")
-        content = entry.get('content', '')
-        if content:
-            self.add_message(custom_id, model, max_tokens, content)            
+        renamed = 0
 
-    def add_message(self, custom_id: str, model: str, max_tokens: int, content: str) -> None:
+        def unique_lines() -> Iterator[bytes]:
+            nonlocal renamed
+            with open(path, 'rb') as file:
+                for line in file:
+                    line = line.rstrip(b"\n")
+                    custom_id = self._raw_custom_id(line)
+                    if custom_id in seen_ids:
+                        suffix = 2
+                        while _numbered_custom_id(custom_id, suffix) in seen_ids:
+                            suffix += 1
+                        request = self.codec.loads(line)
+                        custom_id = request["custom_id"] = _numbered_custom_id(custom_id, suffix)
+                        line = self.codec.dumps(request)
+                        renamed += 1
+                    seen_ids.add(custom_id)
+                    yield line
+
+        before = len(self.current_batch)
+        if hasattr(self.current_batch, "extend_raw"):
+            self.current_batch.extend_raw(unique_lines())
+        else:
+            self.current_batch.extend(self.codec.loads(line) for line in unique_lines())
+        return len(self.current_batch) - before, renamed
+
+    @staticmethod
+    def format_import_report(reports: List[Dict]) -> "Table":
         """
-        Adds a new message to the batch.
+        Returns a table with the files, rows and rows per second of each import worker.
+
+        :param reports: Reports of the imported files as returned by the workers
+        """
+        from rich.table import Table
+
+        workers: Dict[int, Dict] = {}
+        for report in reports:
+            totals = workers.setdefault(report["worker"], {"files": 0, "rows": 0, "seconds": 0.0})
+            totals["files"] += 1
+            totals["rows"] += report["rows"]
+            totals["seconds"] += report["seconds"]
+
+        table = Table(title="Import Workers")
+        table.add_column("Worker", style="cyan")
+        table.add_column("Files", justify="right")
+        table.add_column("Rows", justify="right", style="green")
+        table.add_column("Seconds", justify="right")
+        table.add_column("Rows/s", justify="right", style="magenta")
+        for worker, totals in sorted(workers.items()):
+            rate = totals["rows"] / totals["seconds"] if totals["seconds"] else 0.0
+            table.add_row(str(worker), str(totals["files"]), f"{totals['rows']:,}",
+                          f"{totals['seconds']:.2f}", f"{rate:,.0f}")
+        return table
+
+    def _run_import(self, file: TextIO, file_path: str, extension: str, model: str, max_tokens: int) -> int:
+        """
+        Streams an open file into the draft while showing a single progress bar.
+
+        :return: Number of requests added to the draft
+        """
+        from rich.progress import Progress, TextColumn, BarColumn, DownloadColumn, TransferSpeedColumn
+
+        total_bytes = os.fstat(file.fileno()).st_size
+        with Progress(
+            TextColumn("[progress.description]{task.description}"),
+            BarColumn(),
+            DownloadColumn(),
+            TransferSpeedColumn(),
+            transient=True,
+            console=self.console,
+        ) as progress:
+            task = progress.add_task(f"[cyan]Importing {os.path.basename(file_path)}...", total=total_bytes)
+
+            def report_progress() -> None:
+                progress.update(task, completed=file.buffer.tell())
+
+            rows = self._iter_rows(file, file_path, extension)
+            requests = self._iter_requests(rows, model, max_tokens)
+            imported = self._sink_requests(requests, report_progress)
+            progress.update(task, completed=total_bytes)
+        return imported
+
+    def _iter_rows(self, file: TextIO, file_path: str, extension: str) -> Iterator[Tuple[str, str]]:
+        """
+        Yields (custom_id, content) rows parsed from an open file.
+        """
+        if extension == '.txt':
+            return self._iter_txt_rows(file, file_path)
+        elif extension == '.jsonl':
+            return self._iter_jsonl_rows(file, file_path)
+        elif extension == '.json':
+            return self._iter_json_rows(file, file_path)
+        return self._iter_csv_rows(file)
+
+    def _iter_csv_rows(self, file: TextIO) -> Iterator[Tuple[str, str]]:
+        """
+        Yields rows from a CSV file, supporting multiline prompts.
+        Expected CSV format: custom_id,content
+        """
+        import csv
+
+        csv_reader = csv.reader(file)
+        headers = next(csv_reader, None)  # Read the header row
+
+        if headers is None or len(headers) != 2 or headers[0].lower() != 'custom_id' or headers[1].lower() != 'content':
+            raise ValueError("CSV file must have 'custom_id' and 'content' columns")
+
+        skipped = 0
+        for row in csv_reader:
+            if len(row) == 2:
+                yield row[0], row[1]
+            else:
+                skipped += 1
+        if skipped:
+            self.console.print(f"[yellow]Skipped {skipped} invalid rows[/yellow]")
+
+    def _iter_txt_rows(self, file: TextIO, file_path: str) -> Iterator[Tuple[str, str]]:
+        """
+        Yields rows from a text file, with custom_ids from default_custom_id().
         """
-        message = {
+        for line_number, content in enumerate(file, 1):
+            yield default_custom_id(file_path, line_number), content
+
+    def _iter_jsonl_rows(self, file: TextIO, file_path: str) -> Iterator[Tuple[str, str]]:
+        """
+        Yields rows from a JSONL file, one JSON object per line.
+        """
+        loads = self.codec.loads
+        for line_number, line in enumerate(file, 1):
+            if line.strip():
+                yield self._json_entry_to_row(loads(line), file_path, line_number)
+
+    def _iter_json_rows(self, file: TextIO, file_path: str) -> Iterator[Tuple[str, str]]:
+        """
+        Yields rows from a JSON file holding either a single object or an array of objects.
+        """
+        for index, entry in enumerate(self._iter_json_values(file), 1):
+            if isinstance(entry, dict):
+                yield self._json_entry_to_row(entry, file_path, index)
+
+    @staticmethod
+    def _iter_json_values(file: TextIO) -> Iterator[Any]:
+        """
+        Incrementally decodes a JSON document, yielding the elements of a top-level
+        array one at a time (or the document itself if it is not an array).
+
+        An element that is not complete in the buffer is retried after reading more,
+        and the read size doubles with every retry of the same element, so decoding
+        stays linear in the size of the element however large it is. Memory holds the
+        element being decoded plus at most about as much read ahead of it (at least
+        one IMPORT_READ_SIZE chunk), so arrays of small elements need little memory
+        while a single huge element, or a top-level document that is not an array,
+        is held whole.
+        """
+        decoder = json.JSONDecoder()
+        buffer = ""
+        pos = 0
+        eof = False
+
+        def fill(size: int = IMPORT_READ_SIZE) -> bool:
+            nonlocal buffer, pos, eof
+            chunk = file.read(size)
+            if not chunk:
+                eof = True
+                return False
+            buffer = buffer[pos:] + chunk
+            pos = 0
+            return True
+
+        def skip_whitespace() -> bool:
+            nonlocal pos
+            while True:
+                while pos < len(buffer) and buffer[pos].isspace():
+                    pos += 1
+                if pos < len(buffer):
+                    return True
+                if not fill():
+                    return False
+
+        def decode_value() -> Any:
+            nonlocal pos
+            read_size = IMPORT_READ_SIZE
+            while True:
+                try:
+                    value, end = decoder.raw_decode(buffer, pos)
+                    # A value that ends exactly at the end of the buffer (e.g. a number)
+                    # might continue in the next chunk, so only accept it once more data follows.
+                    if end < len(buffer) or eof:
+                        pos = end
+                        return value
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                # Read geometrically more, so an element spanning many chunks is not re-decoded once per chunk
+                fill(max(read_size, len(buffer) - pos))
+                read_size *= 2
+
+        if not skip_whitespace():
+            return
+        if buffer[pos] != '[':
+            yield decode_value()
+            return
+
+        pos += 1
+        if skip_whitespace() and buffer[pos] == ']':
+            return
+        while True:
+            if not skip_whitespace():
+                raise ValueError("Unexpected end of JSON array")
+            yield decode_value()
+            if not skip_whitespace():
+                raise ValueError("Unexpected end of JSON array")
+            if buffer[pos] == ']':
+                return
+            if buffer[pos] != ',':
+                raise ValueError(f"Expected ',' or ']' in JSON array, found {buffer[pos]!r}")
+            pos += 1
+
+    @staticmethod
+    def _json_entry_to_row(entry: Dict, file_path: str, index: int) -> Tuple[str, str]:
+        """
+        Converts a single JSON entry into a (custom_id, content) row; entries without
+        a custom_id get one from default_custom_id().
+        """
+        custom_id = entry.get('custom_id')
+        if custom_id is None:
+            custom_id = default_custom_id(file_path, index)
+        return custom_id, entry.get('content', '')
+
+    def _iter_requests(self, rows: Iterable[Tuple[str, Any]], model: str,
+                       max_tokens: int) -> Iterator[Union[RequestRecord, Dict]]:
+        """
+        Turns parsed rows into request records, dropping rows with empty content.
+        Text is stripped; other content, such as a list of content blocks from a JSON
+        file, is passed through unchanged as a request dictionary and left to the
+        validator to check.
+        """
+        for custom_id, content in rows:
+            if isinstance(content, str):
+                content = content.strip()
+                if content:
+                    yield RequestRecord(custom_id, model, max_tokens, content)
+            elif content:
+                yield self._build_message(custom_id, model, max_tokens, content)
+
+    def _sink_requests(self, requests: Iterable[Union[RequestRecord, Dict]],
+                       on_flush: Optional[Callable[[], None]] = None) -> int:
+        """
+        Appends request records to the draft in bounded chunks of IMPORT_SINK_SIZE.
+
+        :param requests: Iterable of request records
+        :param on_flush: Optional callback invoked after every flushed chunk
+        :return: Number of requests appended
+        """
+        pending: List[Union[RequestRecord, Dict]] = []
+        count = 0
+        for request in requests:
+            pending.append(request)
+            if len(pending) >= IMPORT_SINK_SIZE:
+                self.current_batch.extend(pending)
+                count += len(pending)
+                pending = []
+                if on_flush:
+                    on_flush()
+        if pending:
+            self.current_batch.extend(pending)
+            count += len(pending)
+        if on_flush:
+            on_flush()
+        return count
+
+    @staticmethod
+    def _build_message(custom_id: str, model: str, max_tokens: int, content: Any) -> Dict:
+        """
+        Builds a single request record in the format expected by the API.
+        """
+        return {
             "custom_id": custom_id,
             "params": {
                 "model": model,
@@ -112,29 +556,17 @@ class BatchDrafter:
                 ]
             }
         }
-        self.current_batch.append(message)
-        self.console.print(f"[green]Message added to batch with custom_id: {custom_id}[/green]")
 
     def create_new_batch(self) -> None:
         """Initializes a new batch."""
-        self.current_batch = []
+        self.current_batch.clear()
         self.console.print("[green]New batch created.[/green]")
 
     def add_message(self, custom_id: str, model: str, max_tokens: int, content: str) -> None:
         """
         Adds a new message to the batch.
         """
-        message = {
-            "custom_id": custom_id,
-            "params": {
-                "model": model,
-                "max_tokens": max_tokens,
-                "messages": [
-                    {"role": "user", "content": content}
-                ]
-            },
-            #"file_path": file_path
-        }
+        message = self._build_message(custom_id, model, max_tokens, content)
         self.current_batch.append(message)
         self.console.print(f"[green]Message added to batch with custom_id: {custom_id}[/green]")
 
@@ -153,6 +585,7 @@ class BatchDrafter:
             else:
                 self.console.print(f"[red]Invalid field: {field}[/red]")
                 return
+            self.current_batch[index] = message
             self.console.print(f"[green]Message at index {index} updated.[/green]")
         else:
             self.console.print("[red]Invalid message index.[/red]")
@@ -167,9 +600,21 @@ class BatchDrafter:
         else:
             self.console.print("[red]Invalid message index.[/red]")
 
-    def view_batch(self) -> Table:
-        """Returns a formatted table representation of the current batch."""
+    def view_batch(self, start: int = 0, limit: int = VIEW_PAGE_SIZE) -> "Table":
+        """
+        Returns a formatted table representation of one page of the current batch.
+        Only the requested rows are read, so large spooled drafts are never fully loaded.
+
+        :param start: Index of the first message to show
+        :param limit: Maximum number of messages to show
+        """
+        from rich.table import Table
+
+        total = len(self.current_batch)
+        stop = min(start + limit, total)
         table = Table(title="Current Batch")
+        if start > 0 or stop < total:
+            table.caption = f"Showing {start}-{max(stop - 1, start)} of {total} messages"
         table.add_column("Index", style="cyan")
         table.add_column("Custom ID", style="magenta")
         table.add_column("Model", style="green")
@@ -177,18 +622,77 @@ class BatchDrafter:
         table.add_column("Content", style="blue")
         #table.add_column("File Path", style="red")
 
-        for index, message in enumerate(self.current_batch):
+        for index in range(start, stop):
+            message = self.current_batch[index]
             table.add_row(
                 str(index),
                 message['custom_id'],
                 message['params']['model'],
                 str(message['params']['max_tokens']),
-                message['params']['messages'][0]['content'][:50] + "...",
+                self._content_preview(message['params']['messages'][0]['content']),
                 #message['file_path']
             )
 
         return table
 
-    def get_batch(self) -> List[Dict]:
+    @staticmethod
+    def _content_preview(content: Any) -> str:
+        """
+        Returns the start of message content for the batch table: the text itself, or
+        the first text block of a list of content blocks, else the number of blocks.
+        """
+        if isinstance(content, list):
+            texts = [block["text"] for block in content if isinstance(block, dict) and isinstance(block.get("text"), str)]
+            if not texts:
+                return f"[{len(content)} content block{'s' if len(content) != 1 else ''}]"
+            content = texts[0]
+        return str(content)[:50] + "..."
+
+    def estimate_batch(self) -> Dict:
+        """
+        Estimates the input tokens and cost of the current batch locally, without calling the API.
+
+        :return: Estimate dictionary as returned by TokenEstimator.estimate
+        """
+        with self.metrics.timer("stage_seconds", stage="estimate"):
+            return self.token_estimator.estimate(self.current_batch)
+
+    def validate_batch(self) -> Dict:
+        """
+        Checks the current batch locally for problems the API would reject it for.
+
+        :return: Report as returned by DraftValidator.validate
+        """
+        with self.metrics.timer("stage_seconds", stage="validate"):
+            return self.validator.validate(self.current_batch)
+
+    @staticmethod
+    def format_estimate(estimate: Dict) -> "Table":
+        """
+        Returns a table with the per-model totals of an estimate.
+
+        :param estimate: Estimate dictionary as returned by estimate_batch
+        """
+        def cost(value: Optional[float]) -> str:
+            return "N/A" if value is None else f"${value:,.2f}"
+
+        from rich.table import Table
+
+        table = Table(title="Estimated Batch Size")
+        table.caption = "Token counts are approximate; costs use Message Batches pricing"
+        table.add_column("Model", style="green")
+        table.add_column("Requests", style="cyan", justify="right")
+        table.add_column("Input Tokens", style="magenta", justify="right")
+        table.add_column("Input Cost", style="yellow", justify="right")
+        table.add_column("Max Output Cost", style="yellow", justify="right")
+        for model, totals in estimate["models"].items():
+            table.add_row(model, f"{totals['requests']:,}", f"{totals['input_tokens']:,}",
+                          cost(totals["input_cost"]), cost(totals["max_output_cost"]))
+        if len(estimate["models"]) > 1:
+            table.add_row("Total", f"{estimate['requests']:,}", f"{estimate['input_tokens']:,}",
+                          cost(estimate["input_cost"]), cost(estimate["max_output_cost"]), style="bold")
+        return table
+
+    def get_batch(self) -> MutableSequence[Dict]:
         """Returns the current batch."""
         return self.current_batch
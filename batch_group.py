@@ -0,0 +1,70 @@
+from typing import List, Dict, Optional
+import uuid
+
+class BatchGroup:
+    """
+    A set of API batches that were submitted from one draft and are handled as one logical batch.
+    """
+    PREFIX = "bgroup_"
+
+    def __init__(self, batch_ids: List[str], group_id: Optional[str] = None):
+        self.group_id = group_id or f"{self.PREFIX}{uuid.uuid4().hex[:24]}"
+        self.batch_ids = list(batch_ids)
+
+    def aggregate_status(self, statuses: List[Dict]) -> Dict:
+        """
+        Combines the status responses of the member batches into one batch-like dictionary.
+
+        :param statuses: Status responses for the member batches
+        :return: Dictionary with 'id', 'processing_status', 'request_counts', 'batch_ids'
+                 and 'member_request_counts' (request counts of each member batch)
+        """
+        counts: Dict[str, int] = {}
+        for status in statuses:
+            for key, value in status.get("request_counts", {}).items():
+                counts[key] = counts.get(key, 0) + value
+
+        processing_statuses = [status.get("processing_status", "Unknown") for status in statuses]
+        # A group without members (every prompt answered from the cache) has nothing left to process
+        if all(s in ["ended", "canceled"] for s in processing_statuses):
+            processing_status = "ended"
+        elif "canceling" in processing_statuses:
+            processing_status = "canceling"
+        else:
+            processing_status = "in_progress"
+
+        return {
+            "id": self.group_id,
+            "processing_status": processing_status,
+            "request_counts": counts,
+            "batch_ids": list(self.batch_ids),
+            "member_request_counts": {batch_id: status.get("request_counts", {})
+                                      for batch_id, status in zip(self.batch_ids, statuses)}
+        }
+
+class BatchGroupRegistry:
+    """
+    Keeps track of batch groups so that a group ID can be used wherever a batch ID is accepted.
+    """
+    def __init__(self):
+        self._groups: Dict[str, BatchGroup] = {}
+
+    def add(self, group: BatchGroup) -> None:
+        """
+        Registers a batch group.
+
+        :param group: The group to register
+        """
+        self._groups[group.group_id] = group
+
+    def get(self, group_id: str) -> Optional[BatchGroup]:
+        """
+        Returns the group with the given ID, or None if it is not a known group.
+
+        :param group_id: ID of the group
+        :return: The BatchGroup or None
+        """
+        return self._groups.get(group_id)
+
+    def __contains__(self, group_id: str) -> bool:
+        return group_id in self._groups
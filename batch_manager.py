@@ -1,46 +1,161 @@
-from typing import List, Dict, Iterator
-from rich.console import Console
+from typing import List, Dict, Iterator, Optional
+import time
+
+from app_console import get_console
+from batch_catalog import BatchCatalog
+from batch_group import BatchGroupRegistry
+from metrics import get_metrics
+from poll_scheduler import PollScheduler
+from prompt_cache import PromptCache
+from rate_limiter import is_retryable_error
+from results_downloader import ResultsDownloader
+from result_store import ResultStore
+
+# Number of times the status of a batch group member is retried after a retryable error
+MEMBER_STATUS_RETRIES = 2
+# Delay in seconds before the first retry of a member status, doubled on every further retry
+MEMBER_STATUS_BACKOFF = 0.5
 
 class BatchManager:
-    def __init__(self, api_client):
+    def __init__(self, api_client, batch_groups: Optional[BatchGroupRegistry] = None,
+                 result_store: Optional[ResultStore] = None, catalog: Optional[BatchCatalog] = None,
+                 prompt_cache: Optional[PromptCache] = None):
+        """
+        :param api_client: APIClient used for API calls
+        :param batch_groups: Registry used to resolve batch group IDs
+        :param result_store: Local store for downloaded results (default: a ResultStore in the data directory,
+                             created on first use)
+        :param catalog: Local catalog of batch metadata (default: a BatchCatalog in the data directory,
+                        created on first use)
+        :param prompt_cache: If given, results of completed batches are cached by prompt, and results
+                             of requests that were answered from the cache are merged into batch results
+        """
         self.api_client = api_client
-        self.console = Console()
+        self.batch_groups = batch_groups if batch_groups is not None else BatchGroupRegistry()
+        self._result_store = result_store
+        self._catalog = catalog
+        self.prompt_cache = prompt_cache
+        # Last status received for each batch group member
+        self._member_status: Dict[str, Dict] = {}
+        self.downloader = ResultsDownloader(api_client)
+        self.console = get_console()
+        self.metrics = get_metrics()
 
-    def list_all_batches(self, limit: int = 20) -> List[Dict]:
+    @property
+    def result_store(self) -> ResultStore:
+        """The local result store, created on first use."""
+        if self._result_store is None:
+            self._result_store = ResultStore()
+        return self._result_store
+
+    @property
+    def catalog(self) -> BatchCatalog:
+        """The local batch catalog, created on first use."""
+        if self._catalog is None:
+            self._catalog = BatchCatalog()
+        return self._catalog
+
+    def list_all_batches(self, limit: Optional[int] = 20) -> List[Dict]:
         """
-        Lists all batches in the workspace.
+        Lists all batches in the workspace, following pagination as needed.
 
-        :param limit: Number of batches to retrieve (default 20)
+        :param limit: Number of batches to retrieve (default 20, None for all)
         :return: List of batch dictionaries
         """
         try:
-            batches = self.api_client.list_batches(limit)
+            batches = []
+            for batch in self.api_client.iter_batches(page_size=min(limit or 100, 100)):
+                batches.append(batch)
+                if limit is not None and len(batches) >= limit:
+                    break
             return batches
         except Exception as e:
             self.console.print(f"[red]Error listing batches: {str(e)}[/red]")
             return []
 
+    def search_batches(self, status: Optional[str] = None, created_after: Optional[str] = None,
+                       created_before: Optional[str] = None, limit: Optional[int] = None,
+                       sync: bool = True) -> List[Dict]:
+        """
+        Lists batches from the local catalog, after incrementally syncing it with the API.
+
+        :param status: Only return batches with this processing status
+        :param created_after: Only return batches created at or after this ISO 8601 timestamp
+        :param created_before: Only return batches created before this ISO 8601 timestamp
+        :param limit: Maximum number of batches to return
+        :param sync: If False, skip syncing and answer purely from the catalog
+        :return: List of batch dictionaries, newest first
+        """
+        if sync:
+            try:
+                self.catalog.sync(self.api_client)
+            except Exception as e:
+                self.console.print(f"[yellow]Could not sync batch catalog, showing cached data: {str(e)}[/yellow]")
+        return self.catalog.query(status, created_after, created_before, limit)
+
     def get_batch_details(self, batch_id: str) -> Dict:
         """
         Retrieves detailed information about a specific batch.
+        For a batch group, the details of all member batches are aggregated.
 
-        :param batch_id: ID of the batch to retrieve details for
-        :return: Dictionary containing batch details
+        :param batch_id: ID of the batch (or batch group) to retrieve details for
+        :return: Dictionary containing batch details, or an empty dictionary on any error
         """
         try:
-            details = self.api_client.get_batch_status(batch_id)
-            return details
+            return self.fetch_batch_details(batch_id)
         except Exception as e:
             self.console.print(f"[red]Error retrieving batch details: {str(e)}[/red]")
             return {}
 
+    def fetch_batch_details(self, batch_id: str) -> Dict:
+        """
+        Like get_batch_details, but raises errors, so callers that poll can tell errors
+        worth retrying (see is_retryable_error) from permanent ones such as an unknown batch.
+
+        :param batch_id: ID of the batch (or batch group) to retrieve details for
+        :return: Dictionary containing batch details
+        """
+        group = self.batch_groups.get(batch_id)
+        if group is not None:
+            return group.aggregate_status([self._fetch_member_status(member_id) for member_id in group.batch_ids])
+        return self.api_client.get_batch_status(batch_id)
+
+    def _fetch_member_status(self, member_id: str) -> Dict:
+        """
+        Retrieves the status of a batch group member. Retryable errors are retried with
+        backoff, and if the member still cannot be reached its last known status is used,
+        so one failing member does not make the status of the whole group unavailable.
+
+        :param member_id: ID of the member batch
+        :return: Status response of the member
+        """
+        delay = MEMBER_STATUS_BACKOFF
+        for attempt in range(MEMBER_STATUS_RETRIES + 1):
+            try:
+                status = self.api_client.get_batch_status(member_id)
+            except Exception as e:
+                last_known = self._member_status.get(member_id)
+                if not is_retryable_error(e) or (attempt == MEMBER_STATUS_RETRIES and last_known is None):
+                    raise
+                if attempt == MEMBER_STATUS_RETRIES:
+                    return last_known
+                time.sleep(delay)
+                delay *= 2
+                continue
+            self._member_status[member_id] = status
+            return status
+
     def cancel_batch(self, batch_id: str) -> bool:
         """
-        Cancels a specific batch.
+        Cancels a specific batch. Canceling a batch group cancels all of its member batches.
 
-        :param batch_id: ID of the batch to cancel
+        :param batch_id: ID of the batch (or batch group) to cancel
         :return: Boolean indicating success or failure
         """
+        group = self.batch_groups.get(batch_id)
+        if group is not None:
+            results = [self.cancel_batch(member_id) for member_id in group.batch_ids]
+            return all(results)
         try:
             response = self.api_client.cancel_batch(batch_id)
             if response['processing_status'] == 'canceling':
@@ -53,23 +168,114 @@ class BatchManager:
             self.console.print(f"[red]Error canceling batch: {str(e)}[/red]")
             return False
 
-    def retrieve_batch_results(self, batch_id: str) -> Iterator[Dict]:
+    def retrieve_batch_results(self, batch_id: str, result_type: Optional[str] = None) -> Iterator[Dict]:
         """
         Retrieves and yields results for a completed batch.
+        Results are downloaded into the local result store once and read from there afterwards,
+        without any API calls.
 
         :param batch_id: ID of the batch to retrieve results for
+        :param result_type: Only yield results of this type ('succeeded', 'errored', 'canceled' or 'expired')
+        :return: Iterator of result dictionaries
+        """
+        group = self.batch_groups.get(batch_id)
+        member_ids = group.batch_ids if group is not None else [batch_id]
+        if member_ids and not self.download_batch_results(batch_id):
+            return iter([])  # Return an empty iterator
+        return self._iter_stored_results(batch_id, member_ids, result_type)
+
+    def _iter_stored_results(self, batch_id: str, member_ids: List[str], result_type: Optional[str]) -> Iterator[Dict]:
+        """
+        Yields the stored results of the member batches one after another, followed by
+        the results of requests that were answered from the prompt cache.
+
+        :param batch_id: ID of the batch (or batch group)
+        :param member_ids: IDs of the API batches holding the results
+        :param result_type: Result type to filter by, or None for all results
         :return: Iterator of result dictionaries
         """
+        for member_id in member_ids:
+            yield from self.result_store.iter_results(member_id, result_type)
+        if self.prompt_cache is not None:
+            yield from self.prompt_cache.iter_cached_results(batch_id, result_type)
+
+    def _record_cached_responses(self, batch_id: str, member_ids: List[str]) -> None:
+        """
+        Adds the results of a downloaded batch to the prompt cache, once per batch.
+
+        :param batch_id: ID of the batch (or batch group)
+        :param member_ids: IDs of the API batches holding the results
+        """
+        if self.prompt_cache is not None and self.prompt_cache.has_pending(batch_id):
+            results = (result for member_id in member_ids for result in self.result_store.iter_results(member_id))
+            cached = self.prompt_cache.record_results(batch_id, results)
+            self.console.print(f"[green]Cached {cached} responses for reuse in later batches.[/green]")
+
+    def find_result(self, custom_id: str, batch_id: Optional[str] = None) -> Optional[Dict]:
+        """
+        Looks up a single stored result by custom_id.
+
+        :param custom_id: custom_id of the request
+        :param batch_id: ID of the batch (or batch group) to look in, or None to search all stored batches
+        :return: The result dictionary, or None if no stored result matches
+        """
+        group = self.batch_groups.get(batch_id) if batch_id else None
+        if batch_id is None or group is None:
+            return self.result_store.get(custom_id, batch_id)
+        for member_id in group.batch_ids:
+            result = self.result_store.get(custom_id, member_id)
+            if result is not None:
+                return result
+        return None
+
+    def download_batch_results(self, batch_id: str) -> List[str]:
+        """
+        Downloads the results of a completed batch (or of every member of a batch group)
+        into the local result store, skipping batches that are already stored.
+
+        Results are only stored when the download has as many lines as the batch has
+        requests; if any member fails that check, nothing is returned and the next call
+        downloads it again.
+
+        :param batch_id: ID of the batch to download results for
+        :return: Paths of the downloaded JSONL files, empty if the batch is not completed
+                 or a download could not be verified
+        """
+        group = self.batch_groups.get(batch_id)
+        member_ids = group.batch_ids if group is not None else [batch_id]
+        store = self.result_store
+        paths = [store.path_for(member_id) for member_id in member_ids]
+        if all(store.has_batch(member_id) for member_id in member_ids):
+            self._record_cached_responses(batch_id, member_ids)
+            return paths
+
         try:
             batch_status = self.get_batch_details(batch_id)
             if batch_status.get('processing_status') != 'ended':
                 self.console.print(f"[yellow]Batch {batch_id} is not completed. Current status: {batch_status.get('processing_status')}[/yellow]")
-                return iter([])  # Return an empty iterator
+                return []
 
-            return self.api_client.get_batch_results(batch_id)
+            member_counts = batch_status.get('member_request_counts', {batch_id: batch_status.get('request_counts', {})})
+            unverified = []
+            for member_id, path in zip(member_ids, paths):
+                if store.has_batch(member_id):
+                    continue
+                counts = member_counts.get(member_id)
+                expected = sum(counts.values()) if counts else None
+                if not self.downloader.download(member_id, path, expected)["verified"]:
+                    unverified.append(member_id)
+                    continue
+                with self.metrics.timer("stage_seconds", stage="ingest"):
+                    store.ingest(member_id, path)
+            if unverified:
+                self.console.print(f"[red]Results of {', '.join(unverified)} are incomplete; "
+                                   f"try downloading them again.[/red]")
+                return []
+            self._record_cached_responses(batch_id, member_ids)
+            return paths
         except Exception as e:
             self.console.print(f"[red]Error retrieving batch results: {str(e)}[/red]")
-            return iter([])  # Return an empty iterator
+            return []
 
     def get_batch_status_summary(self, batch_id: str) -> str:
         """
@@ -80,33 +286,74 @@ class BatchManager:
         """
         try:
             details = self.get_batch_details(batch_id)
-            status = details.get('processing_status', 'Unknown')
-            counts = details.get('request_counts', {})
-            total = sum(counts.values())
-            summary = f"Batch {batch_id} - Status: {status}\n"
-            summary += f"Total requests: {total}\n"
-            for key, value in counts.items():
-                percentage = (value / total) * 100 if total > 0 else 0
-                summary += f"{key.capitalize()}: {value} ({percentage:.1f}%)\n"
-            return summary
+            return self.format_status_summary(batch_id, details)
         except Exception as e:
             return f"Error getting batch summary: {str(e)}"
 
+    @staticmethod
+    def format_status_summary(batch_id: str, details: Dict) -> str:
+        """
+        Formats a status response as a summary, without calling the API.
+
+        :param batch_id: ID of the batch
+        :param details: Status response for the batch
+        :return: String summary of batch status
+        """
+        status = details.get('processing_status', 'Unknown')
+        counts = details.get('request_counts', {})
+        total = sum(counts.values())
+        summary = f"Batch {batch_id} - Status: {status}\n"
+        summary += f"Total requests: {total}\n"
+        for key, value in counts.items():
+            percentage = (value / total) * 100 if total > 0 else 0
+            summary += f"{key.capitalize()}: {value} ({percentage:.1f}%)\n"
+        return summary
+
     def monitor_batch_progress(self, batch_id: str) -> None:
         """
         Monitors and displays the progress of a batch.
 
         :param batch_id: ID of the batch to monitor
         """
+        self.monitor_batches([batch_id])
+
+    def monitor_batches(self, batch_ids: List[str], scheduler: Optional[PollScheduler] = None) -> Dict[str, Dict]:
+        """
+        Monitors several batches until all of them have finished.
+
+        Polling is driven by a PollScheduler, so batches without progress are polled
+        less and less often, finished batches are dropped, and each poll makes a
+        single status call whose response is reused for the displayed summary.
+
+        :param batch_ids: IDs of the batches to monitor
+        :param scheduler: Scheduler to use, a default PollScheduler if omitted
+        :return: The last status response received for each batch
+        """
+        scheduler = scheduler if scheduler is not None else PollScheduler()
+        latest: Dict[str, Dict] = {}
+        for batch_id in batch_ids:
+            scheduler.add(batch_id)
         try:
-            with self.console.status(f"[bold green]Monitoring batch {batch_id}...") as status:
-                while True:
-                    details = self.get_batch_details(batch_id)
-                    status.update(self.get_batch_status_summary(batch_id))
-                    if details.get('processing_status') in ['ended', 'canceled']:
-                        break
-                    time.sleep(5)  # Wait for 5 seconds before checking again
-            self.console.print(f"[bold]Final status for batch {batch_id}:[/bold]")
-            self.console.print(self.get_batch_status_summary(batch_id))
+            with self.console.status(f"[bold green]Monitoring {len(batch_ids)} batch(es)...") as status:
+                while len(scheduler):
+                    for batch_id in scheduler.wait_due():
+                        try:
+                            details = self.fetch_batch_details(batch_id)
+                        except Exception as e:
+                            if is_retryable_error(e):
+                                scheduler.record_error(batch_id)
+                            else:
+                                # Polling again would fail the same way, e.g. for an unknown batch ID
+                                self.console.print(f"[red]Stopped monitoring batch {batch_id}: {str(e)}[/red]")
+                                scheduler.remove(batch_id)
+                            continue
+                        latest[batch_id] = details
+                        scheduler.record(batch_id, details)
+                    status.update("\n".join(self.format_status_summary(batch_id, latest.get(batch_id, {}))
+                                            for batch_id in batch_ids))
+            for batch_id in batch_ids:
+                self.console.print(f"[bold]Final status for batch {batch_id}:[/bold]")
+                self.console.print(self.format_status_summary(batch_id, latest.get(batch_id, {})))
         except Exception as e:
             self.console.print(f"[red]Error monitoring batch: {str(e)}[/red]")
+        return latest
@@ -1,23 +1,104 @@
-from typing import Dict
-from rich.console import Console
-from rich.table import Table
-from rich.text import Text
-from rich.progress import Progress, SpinnerColumn, TextColumn
+from typing import Callable, Dict, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import threading
+import time
+
+from app_console import get_console
+from batch_analytics import ThroughputAnalytics
+from batch_group import BatchGroup, BatchGroupRegistry
+from metrics import get_metrics
+from monitor_state import MonitorStateStore
+from poll_scheduler import TERMINAL_STATUSES
+from rate_limiter import TokenBucket, get_retry_after
 
 class BatchMonitor:
-    def __init__(self, api_client):
+    def __init__(self, api_client, batch_groups: Optional[BatchGroupRegistry] = None,
+                 max_in_flight: int = 8, requests_per_second: float = 10.0, max_retries: int = 3,
+                 state_store: Optional[MonitorStateStore] = None):
+        """
+        :param api_client: APIClient used for status calls
+        :param batch_groups: Registry used to resolve batch group IDs
+        :param max_in_flight: Maximum number of status calls running at the same time
+        :param requests_per_second: Sustained rate of status calls allowed by the rate limiter
+        :param max_retries: Number of times a rate-limited (429) status call is retried
+        :param state_store: Store the monitored batches are persisted in
+                            (default: a MonitorStateStore in the data directory, created on first use)
+        """
         self.api_client = api_client
-        self.active_batches = {}
-        self.console = Console()
+        self.batch_groups = batch_groups if batch_groups is not None else BatchGroupRegistry()
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.rate_limiter = TokenBucket(requests_per_second, capacity=max_in_flight)
+        self._state_store = state_store
+        self._active_batches: Optional[Dict[str, Dict]] = None
+        self._lock = threading.RLock()
+        # Incremented whenever a monitored batch is added, removed or changes status
+        self.version = 0
+        self.analytics = ThroughputAnalytics()
+        self.console = get_console()
+        self.metrics = get_metrics()
+
+    @property
+    def state_store(self) -> MonitorStateStore:
+        """The store monitored batches are persisted in, created on first use."""
+        if self._state_store is None:
+            self._state_store = MonitorStateStore()
+        return self._state_store
+
+    @property
+    def active_batches(self) -> Dict[str, Dict]:
+        """
+        Monitored batches by ID, each with its last 'status', 'request_counts', 'last_polled'
+        time, 'etag', the 'models' it was submitted with and the 'history' of its progress. Loaded from the state store on first access, so batches monitored
+        before a restart are shown right away and only polled when statuses are refreshed.
+        """
+        if self._active_batches is None:
+            with self._lock:
+                if self._active_batches is None:
+                    self._load_state()
+        return self._active_batches
+
+    def _load_state(self) -> None:
+        """Loads the saved monitor entries and registers the saved batch groups."""
+        self._active_batches = self.state_store.load()
+        for batch_id, entry in self._active_batches.items():
+            # Batch groups live in memory only, so register them again from the saved members
+            if "batch_ids" in entry and batch_id not in self.batch_groups:
+                self.batch_groups.add(BatchGroup(entry["batch_ids"], group_id=batch_id))
+
+    def snapshot(self) -> List[Tuple[str, Dict]]:
+        """
+        Returns the monitored batches as a list of (batch ID, entry) pairs, safe to read
+        while a background thread is polling.
+        """
+        with self._lock:
+            return list(self.active_batches.items())
+
+    def save_state(self) -> None:
+        """Persists the monitored batches. A failed write is reported but does not stop monitoring."""
+        try:
+            with self._lock:
+                self.state_store.save(self.active_batches)
+        except Exception as e:
+            self.console.print(f"[yellow]Could not save monitor state: {str(e)}[/yellow]")
 
-    def add_batch(self, batch_id: str) -> None:
+    def add_batch(self, batch_id: str, models: Optional[List[str]] = None) -> None:
         """
-        Adds a new batch to monitor.
+        Adds a new batch to monitor. Batch group IDs are monitored as one batch.
 
-        :param batch_id: ID of the batch to be monitored
+        :param batch_id: ID of the batch (or batch group) to be monitored
+        :param models: Models the batch was submitted with, used to report throughput per model
         """
         if batch_id not in self.active_batches:
-            self.active_batches[batch_id] = {"status": "Added", "request_counts": {}}
+            entry = {"status": "Added", "request_counts": {}, "last_polled": None, "etag": None,
+                     "models": sorted(models or [])}
+            group = self.batch_groups.get(batch_id)
+            if group is not None:
+                entry["batch_ids"] = list(group.batch_ids)
+            with self._lock:
+                self.active_batches[batch_id] = entry
+                self.version += 1
+            self.save_state()
             self.console.print(f"[green]Batch {batch_id} added to monitoring.[/green]")
         else:
             self.console.print(f"[yellow]Batch {batch_id} is already being monitored.[/yellow]")
@@ -30,17 +111,99 @@ class BatchMonitor:
         """
         if batch_id in self.active_batches:
             try:
-                batch_status = self.api_client.get_batch_status(batch_id)
-                self.active_batches[batch_id] = {
-                    "status": batch_status.get("processing_status", "Unknown"),
-                    "request_counts": batch_status.get("request_counts", {})
-                }
+                self._record(batch_id, self.fetch_batch_status(batch_id))
+                self.save_state()
                 self.console.print(f"[blue]Status updated for batch {batch_id}.[/blue]")
             except Exception as e:
                 self.console.print(f"[red]Error updating status for batch {batch_id}: {str(e)}[/red]")
         else:
             self.console.print(f"[yellow]Batch {batch_id} is not being monitored.[/yellow]")
 
+    def _record(self, batch_id: str, entry: Dict) -> None:
+        """Stores a freshly polled status as the monitor entry of a batch, extending its history."""
+        entry["last_polled"] = time.time()
+        with self._lock:
+            previous = self.active_batches.get(batch_id, {})
+            entry["models"] = previous.get("models", [])
+            self.analytics.record(entry, previous, entry["last_polled"])
+            if (entry["status"], entry["request_counts"]) != (previous.get("status"), previous.get("request_counts")):
+                self.version += 1
+            self.active_batches[batch_id] = entry
+
+    def fetch_batch_status(self, batch_id: str) -> Dict:
+        """
+        Fetches the status of a batch from the API, aggregating member batches for a batch group.
+
+        Polls are conditional: the ETag of the last status of each API batch is sent
+        along and a 304 Not Modified answer reuses the saved status. Members of a group
+        that already reached a terminal status are not polled again.
+
+        :param batch_id: ID of the batch or batch group
+        :return: Monitor entry with 'status', 'request_counts' and 'etag'; for a batch group
+                 also 'batch_ids' and 'members' (the same entry for each member batch)
+        """
+        previous = self.active_batches.get(batch_id) or {}
+        group = self.batch_groups.get(batch_id)
+        if group is None:
+            return self._poll(batch_id, previous)
+
+        saved_members = previous.get("members", {})
+        members = {}
+        for member_id in group.batch_ids:
+            member = saved_members.get(member_id) or {}
+            members[member_id] = member if member.get("status") in TERMINAL_STATUSES else self._poll(member_id, member)
+        status = group.aggregate_status([{"processing_status": member["status"],
+                                          "request_counts": member["request_counts"]}
+                                         for member in members.values()])
+        return {"status": status["processing_status"], "request_counts": status["request_counts"],
+                "etag": None, "batch_ids": list(group.batch_ids), "members": members}
+
+    def _poll(self, batch_id: str, previous: Dict) -> Dict:
+        """
+        Polls one API batch, reusing its previous entry when the API reports no change.
+
+        :param batch_id: ID of the batch
+        :param previous: Previous monitor entry of the batch, empty if there is none
+        :return: Entry with 'status', 'request_counts' and 'etag'
+        """
+        etag = previous.get("etag") if "status" in previous else None
+        batch_status, etag = self._get_status_rate_limited(batch_id, etag)
+        if batch_status is None:
+            return {"status": previous["status"], "request_counts": previous["request_counts"], "etag": etag}
+        return {"status": batch_status.get("processing_status", "Unknown"),
+                "request_counts": batch_status.get("request_counts", {}), "etag": etag}
+
+    def _get_status_rate_limited(self, batch_id: str, etag: Optional[str] = None) -> Tuple[Optional[Dict], Optional[str]]:
+        """
+        Calls the status endpoint through the rate limiter, backing off and retrying
+        when the API answers 429 Too Many Requests.
+
+        :param batch_id: ID of the batch
+        :param etag: ETag of the last status response, sent as If-None-Match
+        :return: Tuple of (API status response, or None if unchanged; ETag of the response)
+        """
+        attempt = 0
+        while True:
+            self.rate_limiter.acquire()
+            try:
+                return self.api_client.get_batch_status_if_changed(batch_id, etag)
+            except Exception as e:
+                response = getattr(e, "response", None)
+                if response is None or response.status_code != 429 or attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                self.metrics.increment("api_retries_total", operation="get_batch_status")
+                self.rate_limiter.pause(get_retry_after(response, default=2.0 ** attempt))
+
+    def throughput(self) -> Dict:
+        """
+        Returns processing rates and ETAs of the monitored batches, per model and overall,
+        computed from the request_counts history recorded while polling.
+
+        :return: Summary as returned by ThroughputAnalytics.summarize
+        """
+        return self.analytics.summarize(dict(self.snapshot()))
+
     def get_batch_status(self, batch_id: str) -> Dict:
         """
         Returns the current status of a batch.
@@ -63,7 +226,10 @@ class BatchMonitor:
         if batch_id in self.active_batches:
             status = self.active_batches[batch_id]["status"]
             if status in ["ended", "canceled"]:
-                del self.active_batches[batch_id]
+                with self._lock:
+                    del self.active_batches[batch_id]
+                    self.version += 1
+                self.save_state()
                 self.console.print(f"[green]Batch {batch_id} removed from monitoring.[/green]")
             else:
                 self.console.print(f"[yellow]Batch {batch_id} is not completed (status: {status}). Not removing.[/yellow]")
@@ -74,6 +240,9 @@ class BatchMonitor:
         """
         Displays a table of all monitored batch statuses.
         """
+        from rich.table import Table
+        from rich.text import Text
+
         if not self.active_batches:
             return Text("No active batches", style="yellow")
 
@@ -101,18 +270,56 @@ class BatchMonitor:
 
         return table
 
+    def poll_all(self, on_polled: Optional[Callable[[str], None]] = None) -> Dict[str, Exception]:
+        """
+        Polls every monitored batch that has not reached a terminal status, without printing.
+
+        Status calls run concurrently, at most max_in_flight at a time and throttled by
+        the rate limiter, so a refresh takes about as long as the slowest call. The
+        refreshed statuses are saved to the state store once at the end.
+
+        :param on_polled: Called with the batch ID after each batch is polled
+        :return: Errors of the polls that failed, by batch ID
+        """
+        batch_ids = [batch_id for batch_id, entry in self.snapshot() if entry["status"] not in TERMINAL_STATUSES]
+        errors: Dict[str, Exception] = {}
+        if not batch_ids:
+            return errors
+        with self.metrics.timer("stage_seconds", stage="poll"), \
+                ThreadPoolExecutor(max_workers=min(self.max_in_flight, len(batch_ids))) as executor:
+            futures = {executor.submit(self.fetch_batch_status, batch_id): batch_id for batch_id in batch_ids}
+            for future in as_completed(futures):
+                batch_id = futures[future]
+                try:
+                    entry = future.result()
+                    if batch_id in self.active_batches:
+                        self._record(batch_id, entry)
+                except Exception as e:
+                    errors[batch_id] = e
+                if on_polled is not None:
+                    on_polled(batch_id)
+        self.save_state()
+        return errors
+
     def update_all_statuses(self) -> None:
         """
-        Updates the status of all monitored batches.
+        Updates the status of all monitored batches, showing a spinner while polling and
+        printing a summary line and any errors afterwards. Batches that already reached a
+        terminal status are not polled again.
         """
+        from rich.progress import Progress, SpinnerColumn, TextColumn
+
+        polled = sum(1 for _, entry in self.snapshot() if entry["status"] not in TERMINAL_STATUSES)
         with Progress(
             SpinnerColumn(),
             TextColumn("[progress.description]{task.description}"),
             transient=True,
+            console=self.console,
         ) as progress:
-            task = progress.add_task("[cyan]Updating batch statuses...", total=len(self.active_batches))
-            for batch_id in list(self.active_batches.keys()):
-                self.update_status(batch_id)
-                progress.update(task, advance=1)
+            task = progress.add_task("[cyan]Updating batch statuses...", total=polled)
+            errors = self.poll_all(lambda batch_id: progress.update(task, advance=1))
 
-        self.display_batch_statuses()
+        for batch_id, error in errors.items():
+            self.console.print(f"[red]Error updating status for batch {batch_id}: {str(error)}[/red]")
+        if polled:
+            self.console.print(f"[blue]Status updated for {polled - len(errors)} of {polled} batches.[/blue]")
@@ -1,31 +1,555 @@
-from typing import List, Dict
-from rich.console import Console
+from typing import List, Dict, Iterator, Optional, Sequence, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import hashlib
+import json
+import threading
+import time
+import requests
 from rich.panel import Panel
 
+from app_console import get_console
+from batch_group import BatchGroup, BatchGroupRegistry
+from draft_store import RecordDraftStore, SpooledDraftStore
+from draft_validator import DraftValidator
+from json_codec import get_codec
+from metrics import get_metrics
+from prompt_cache import PromptCache
+from rate_limiter import get_retry_after
+from submission_journal import SubmissionJournal
+
+# Per-batch limits of the Message Batches API
+MAX_BATCH_REQUESTS = 100_000
+MAX_BATCH_BYTES = 256 * 1024 * 1024
+# Seconds of clock difference tolerated when matching journaled attempts to listed batches
+RECONCILE_CLOCK_SKEW = 120
+# Seconds the API keeps the results of a batch after it was created
+RESULTS_RETENTION = 29 * 24 * 3600
+
 class BatchSubmitter:
-    def __init__(self, api_client):
+    def __init__(self, api_client, batch_groups: Optional[BatchGroupRegistry] = None,
+                 max_requests: int = MAX_BATCH_REQUESTS, max_bytes: int = MAX_BATCH_BYTES,
+                 max_workers: int = 4, prompt_cache: Optional[PromptCache] = None,
+                 journal: Optional[SubmissionJournal] = None, max_retries: int = 3, retry_backoff: float = 2.0,
+                 validator: Optional[DraftValidator] = None):
+        """
+        :param api_client: APIClient used for submission
+        :param batch_groups: Registry that sharded submissions are recorded in
+        :param max_requests: Maximum number of requests per submitted batch
+        :param max_bytes: Maximum serialized payload size per submitted batch
+        :param max_workers: Maximum number of shards submitted at the same time
+        :param prompt_cache: If given, prompts that were already answered are not sent again
+        :param journal: Journal of submissions (default: a SubmissionJournal in the data directory,
+                        created on first use)
+        :param max_retries: Number of times a shard is resent after a transient error
+        :param retry_backoff: Delay in seconds before the first retry, doubled on every further retry
+        :param validator: Validator every draft is checked with before anything is sent
+                          (default: a DraftValidator for max_bytes)
+        """
         self.api_client = api_client
-        self.console = Console()
+        self.batch_groups = batch_groups if batch_groups is not None else BatchGroupRegistry()
+        self.max_requests = max_requests
+        self.max_bytes = max_bytes
+        self.max_workers = max_workers
+        self.prompt_cache = prompt_cache
+        self._journal = journal
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        envelope_bytes = len(json.dumps({"requests": []}).encode("utf-8"))
+        self.validator = validator if validator is not None else DraftValidator(max_request_bytes=max_bytes - envelope_bytes)
+        # Report of the last validation, so callers can show why a draft was not submitted
+        self.last_validation: Optional[Dict] = None
+        self._reconcile_lock = threading.Lock()
+        # Create requests whose outcome is not journaled yet; the batch list is only
+        # searched while there are none, so a shard cannot claim a sibling's new batch
+        self._creates = threading.Condition()
+        self._creates_in_flight = 0
+        self._reconciling = False
+        self.console = get_console()
+        self.metrics = get_metrics()
 
-    def submit_batch(self, batch: List[Dict]) -> str:
+    @property
+    def journal(self) -> SubmissionJournal:
+        """The submission journal, opened on first use."""
+        if self._journal is None:
+            self._journal = SubmissionJournal()
+        return self._journal
+
+    def submit_batch(self, batch: Sequence[Dict], force: bool = False) -> str:
         """
         Submits a batch and returns the batch ID.
 
-        :param batch: List of message dictionaries to be submitted
-        :return: Batch ID returned by the API
+        Drafts that exceed the per-batch request or size limits are split into shards
+        and submitted as a batch group, in which case the group ID is returned.
+        With a prompt cache, only prompts without a cached answer are sent; if every
+        prompt is answered from the cache, an empty batch group is returned, whose ID is
+        derived from the draft like that of any other submission. A forced
+        submission bypasses the cache and sends every prompt.
+
+        Submissions are journaled, so a draft that was already submitted is not sent
+        again: its existing batch ID is returned, and after a partial failure only the
+        shards that were not created are sent. This only applies to batches that can
+        still deliver results: a batch that is still in progress, or that ended with at
+        least one succeeded request and none canceled or expired within RESULTS_RETENTION
+        of its creation. Shards whose batch is gone, canceled, expired or entirely errored
+        are sent again, as is the whole draft with force.
+
+        The draft is validated first, and a draft with errors is not submitted at all.
+
+        :param batch: List of message dictionaries (or a spooled draft) to be submitted
+        :param force: Submit the draft again even if an earlier submission of it can still deliver results
+        :return: Batch ID (or batch group ID) returned by the API, or an empty string if
+                 the draft is invalid or could not be submitted
+        """
+        try:
+            if not self.validate_batch(batch):
+                return ""
+            if self.prompt_cache is None:
+                return self._submit(batch, force)
+            if force:
+                batch_id = self._submit(batch, force)
+                if batch_id:
+                    # Nothing was answered from the cache, but the results still fill it
+                    self.prompt_cache.record_submission(batch_id, batch, {})
+                return batch_id
+
+            misses, hits = self._apply_prompt_cache(batch)
+            try:
+                if len(misses):
+                    batch_id = self._submit(misses, force)
+                else:
+                    batch_id = self._cached_group_id(self._scan(batch)[1])
+                    self.batch_groups.add(BatchGroup([], batch_id))
+                    # Journaled like other groups, so the ID still resolves after a restart
+                    self.journal.record_cached(batch_id)
+                    self.console.print(Panel(f"All prompts were answered from the cache. Batch ID: {batch_id}",
+                                             style="green"))
+                if batch_id:
+                    self.prompt_cache.record_submission(batch_id, misses, hits)
+                return batch_id
+            finally:
+                if isinstance(misses, SpooledDraftStore):
+                    misses.delete()
+        except Exception as e:
+            self.handle_submission_error(e)
+            return ""
+
+    def _apply_prompt_cache(self, batch: Sequence[Dict]) -> Tuple[Sequence[Dict], Dict[str, str]]:
+        """
+        Splits a batch into the requests that must be sent and those answered from the prompt cache.
+
+        :param batch: List of message dictionaries or a spooled draft
+        :return: Tuple of (requests to send, custom_id -> prompt hash of the cached requests)
+        """
+        if isinstance(batch, SpooledDraftStore):
+            # Deleted by submit_batch once the submission is done
+            misses = SpooledDraftStore(f"{batch.path}.misses")
+            misses.clear()
+        else:
+            misses = RecordDraftStore()
+        try:
+            hits, stats = self.prompt_cache.partition(batch, misses)
+        except Exception:
+            if isinstance(misses, SpooledDraftStore):
+                misses.delete()
+            raise
+        if stats["hits"]:
+            self.console.print(f"[green]Prompt cache: {stats['hits']} of {stats['requests']} prompts already answered "
+                               f"({stats['hit_rate']:.1%} hit rate), {stats['hits']} requests and "
+                               f"{stats['bytes_saved'] / 1e6:.1f} MB not sent.[/green]")
+        return misses, hits
+
+    def _submit(self, batch: Sequence[Dict], force: bool = False) -> str:
+        """
+        Submits a batch as a single API batch or, if it is too large, as a batch group.
+
+        :param batch: List of message dictionaries or a spooled draft
+        :param force: Send every shard again, even those whose batch can still deliver results
+        :return: Batch ID (or batch group ID), or an empty string if nothing could be submitted
         """
         try:
+            with self.metrics.timer("stage_seconds", stage="scan"):
+                shards, draft_hash = self._scan(batch)
+            if not shards:
+                raise ValueError("The batch does not contain any requests")
+            entry = self.journal.get_draft(draft_hash)
+            if entry is not None:
+                self._reset_dead_shards(entry, force)
+                entry = self.journal.get_draft(draft_hash)
+            if entry is not None and entry["batch_id"]:
+                self.console.print(Panel(f"This draft was already submitted as {entry['batch_id']}; "
+                                         f"it is not submitted again.", style="yellow"))
+                return entry["batch_id"]
+
+            # Shards already journaled for this draft keep their original ranges
+            self.journal.begin(draft_hash, shards)
+            entry = self.journal.get_draft(draft_hash)
+            if len(entry["shards"]) > 1:
+                group = self.submit_batch_group(batch, entry)
+                return group.group_id if group else ""
+
             self.console.print(Panel("Submitting batch to API...", style="blue"))
-            response = self.api_client.create_batch(batch)
-            batch_id = response.get('id')
+            with self.metrics.timer("stage_seconds", stage="submit"):
+                batch_id = self._submit_shard(batch, draft_hash, entry["shards"][0])
+            self.journal.complete(draft_hash, batch_id)
+            self.console.print(Panel(f"Batch submitted successfully. Batch ID: {batch_id}", style="green"))
+            return batch_id
+        except Exception as e:
+            self.handle_submission_error(e)
+            return ""
+
+    def _reset_dead_shards(self, entry: Dict, force: bool = False) -> None:
+        """
+        Marks the submitted shards of a journaled draft whose batch cannot deliver results
+        as failed, so they are sent again.
+
+        :param entry: Journal entry of the draft, as returned by SubmissionJournal.get_draft
+        :param force: Reset every submitted shard
+        """
+        dead = [shard for shard in entry["shards"] if shard["state"] == "submitted"
+                and (force or not self._can_deliver(shard["batch_id"]))]
+        if not dead:
+            return
+        self.journal.reset_shards(entry["draft_hash"], [shard["index"] for shard in dead])
+        reason = "as requested" if force else "because they were canceled, expired, errored or deleted"
+        self.console.print(f"[yellow]Earlier batches of this draft are sent again {reason}: "
+                           f"{', '.join(shard['batch_id'] for shard in dead)}[/yellow]")
+
+    def _can_deliver(self, batch_id: str) -> bool:
+        """
+        Returns whether a batch is still in progress, or has ended with results worth keeping.
+
+        :param batch_id: ID of the batch
+        :return: False if the batch does not exist, was canceled, has expired requests, has no
+                 succeeded requests or is older than RESULTS_RETENTION
+        """
+        try:
+            status = self.api_client.get_batch_status(batch_id)
+        except requests.exceptions.HTTPError as e:
+            if e.response is not None and e.response.status_code == 404:
+                return False
+            raise
+        created_at = self._parse_timestamp(status.get("created_at"))
+        if created_at is not None and created_at < time.time() - RESULTS_RETENTION:
+            return False
+        if status.get("processing_status") == "in_progress":
+            return True
+        counts = status.get("request_counts", {})
+        return (status.get("processing_status") == "ended" and counts.get("succeeded", 0) > 0
+                and not counts.get("canceled") and not counts.get("expired"))
+
+    def _submit_shard(self, batch: Sequence[Dict], draft_hash: str, shard: Dict) -> str:
+        """
+        Creates the batch for one journaled shard, retrying transient errors with exponential backoff.
+
+        Each attempt is journaled before the request is sent. When an attempt fails without
+        a definite answer (a dropped connection, a timeout or a server error), the batch list
+        is checked for a batch created by that attempt before the shard is sent again. If
+        the batch list cannot be read either, the outcome stays unknown and the shard is
+        retried as usual.
+
+        :param batch: List of message dictionaries or a spooled draft
+        :param draft_hash: Hash identifying the draft
+        :param shard: Journal entry of the shard
+        :return: ID of the created batch
+        """
+        index = shard["index"]
+        size = shard["stop"] - shard["start"]
+        if shard["state"] == "submitted":
+            return shard["batch_id"]
+        if shard["state"] == "pending":
+            # An earlier attempt may have created the batch before the process stopped
+            batch_id = self._reconcile_shard(draft_hash, index, size, shard["attempted_at"])
             if batch_id:
-                self.console.print(Panel(f"Batch submitted successfully. Batch ID: {batch_id}", style="green"))
                 return batch_id
-            else:
+
+        attempt = 0
+        while True:
+            attempted_at = self.journal.mark_attempt(draft_hash, index)
+            try:
+                return self._create_shard(batch, draft_hash, shard)
+            except requests.exceptions.RequestException as e:
+                status = e.response.status_code if e.response is not None else None
+                if status is None or status >= 500:
+                    try:
+                        batch_id = self._reconcile_shard(draft_hash, index, size, attempted_at, time.time())
+                    except requests.exceptions.RequestException as list_error:
+                        # Whether the attempt created a batch stays unknown, so the shard is retried like any other failure
+                        batch_id = None
+                        self.console.print(f"[yellow]Could not check the batch list for shard {index} "
+                                           f"({list_error}).[/yellow]")
+                    if batch_id:
+                        return batch_id
+                if (status is not None and status < 500 and status != 429) or attempt >= self.max_retries:
+                    self.journal.mark_failed(draft_hash, index)
+                    raise
+                delay = get_retry_after(e.response, default=self.retry_backoff * 2 ** attempt)
+                attempt += 1
+                self.metrics.increment("api_retries_total", operation="create_batch")
+                self.console.print(f"[yellow]Submitting shard {index} failed ({e}), "
+                                   f"retrying in {delay:.0f}s ({attempt}/{self.max_retries})...[/yellow]")
+                time.sleep(delay)
+            except Exception:
+                self.journal.mark_failed(draft_hash, index)
+                raise
+
+    def _create_shard(self, batch: Sequence[Dict], draft_hash: str, shard: Dict) -> str:
+        """
+        Sends the create request of a shard and journals the ID of the created batch.
+        The request counts as in flight until its outcome is journaled, and no request is
+        started while the batch list is being reconciled.
+
+        :param batch: List of message dictionaries or a spooled draft
+        :param draft_hash: Hash identifying the draft
+        :param shard: Journal entry of the shard
+        :return: ID of the created batch
+        """
+        with self._creates:
+            self._creates.wait_for(lambda: not self._reconciling)
+            self._creates_in_flight += 1
+        try:
+            response = self.api_client.create_batch(self._iter_encoded(batch, shard["start"], shard["stop"]))
+            batch_id = response.get('id')
+            if not batch_id:
                 raise ValueError("API response did not contain a batch ID")
+            self.journal.mark_submitted(draft_hash, shard["index"], batch_id)
+            return batch_id
+        finally:
+            with self._creates:
+                self._creates_in_flight -= 1
+                self._creates.notify_all()
+
+    def _reconcile_shard(self, draft_hash: str, index: int, size: int, attempted_at: float,
+                         ended_at: Optional[float] = None) -> Optional[str]:
+        """
+        Looks for a batch that an attempt to submit a shard may have created.
+
+        The API has no idempotency keys, so a batch is matched by its total request count
+        and creation time: candidates are the batches that are not in the journal yet, have
+        as many requests as the shard and were created between the attempt and its end,
+        give or take RECONCILE_CLOCK_SKEW. The search waits until no other create request
+        of this submitter is in flight, so the new batch of a sibling shard is always
+        journaled before it could be mistaken for this one.
+
+        Other attempts of the same size in that window may have created some of the
+        candidates. Candidates and attempts are paired in order when there are enough
+        candidates for all of them; otherwise it is unknown which attempt created which
+        batch, so none is claimed, the candidates are retired in the journal and reported,
+        and the shard is sent again.
+
+        :param draft_hash: Hash identifying the draft
+        :param index: Index of the shard
+        :param size: Number of requests in the shard
+        :param attempted_at: Time of the attempt
+        :param ended_at: Time the attempt failed (default: unknown, e.g. after a crash)
+        :return: ID of the matching batch, which is journaled for the shard, or None
+        """
+        with self._reconcile_lock:
+            with self._creates:
+                self._reconciling = True
+                self._creates.wait_for(lambda: self._creates_in_flight == 0)
+            try:
+                since = attempted_at - RECONCILE_CLOCK_SKEW
+                until = (ended_at if ended_at is not None else time.time()) + RECONCILE_CLOCK_SKEW
+                known = self.journal.known_batch_ids()
+                candidates = []
+                for listed in self.api_client.iter_batches(prefetch=False):
+                    created_at = self._parse_timestamp(listed.get("created_at"))
+                    if created_at is not None and created_at < since:
+                        break
+                    if (listed["id"] not in known and (created_at is None or created_at <= until)
+                            and sum(listed.get("request_counts", {}).values()) == size):
+                        candidates.append(listed["id"])
+                if not candidates:
+                    return None
+                # The list is newest first
+                candidates.reverse()
+                attempts = self.journal.pending_shards(size, since, until)
+                if (draft_hash, index) not in attempts:
+                    attempts.append((draft_hash, index))
+                if len(candidates) < len(attempts):
+                    self.journal.retire_batches(candidates)
+                    self.console.print(f"[yellow]Could not tell which of {len(attempts)} interrupted submissions "
+                                       f"created batches {', '.join(candidates)}; shard {index} is sent again. "
+                                       f"Cancel those batches if they are duplicates.[/yellow]")
+                    return None
+                match = candidates[attempts.index((draft_hash, index))]
+                self.journal.mark_submitted(draft_hash, index, match)
+                self.console.print(f"[yellow]Shard {index} had already been created as {match}; "
+                                   f"it is not sent again.[/yellow]")
+                return match
+            finally:
+                with self._creates:
+                    self._reconciling = False
+                    self._creates.notify_all()
+
+    @staticmethod
+    def _parse_timestamp(value: Optional[str]) -> Optional[float]:
+        """Converts an ISO 8601 timestamp from the API to seconds since the epoch."""
+        if not value:
+            return None
+        try:
+            return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+        except ValueError:
+            return None
+
+    @staticmethod
+    def _group_id(draft_hash: str) -> str:
+        """Returns the batch group ID of a sharded draft, which stays the same across resubmissions."""
+        return f"{BatchGroup.PREFIX}{draft_hash[:24]}"
+
+    @staticmethod
+    def _cached_group_id(draft_hash: str) -> str:
+        """
+        Returns the batch group ID of a draft answered entirely from the prompt cache. It
+        stays the same across resubmissions and differs from the draft's own group ID.
+        """
+        return BatchSubmitter._group_id(hashlib.sha256(f"cached:{draft_hash}".encode("utf-8")).hexdigest())
+
+    def recover(self) -> List[str]:
+        """
+        Reconciles the journal with the API, e.g. after the process stopped during a submission.
+
+        Shards whose outcome is unknown are matched against the batch list, drafts whose
+        shards all exist are completed, and batch groups are registered again.
+
+        :return: Batch IDs (or batch group IDs) of submitted drafts that are not monitored yet
+        """
+        try:
+            for draft_hash in self.journal.incomplete():
+                entry = self.journal.get_draft(draft_hash)
+                for shard in entry["shards"]:
+                    if shard["state"] == "pending":
+                        batch_id = self._reconcile_shard(draft_hash, shard["index"], shard["stop"] - shard["start"],
+                                                         shard["attempted_at"])
+                        if batch_id is None:
+                            self.journal.mark_failed(draft_hash, shard["index"])
+                entry = self.journal.get_draft(draft_hash)
+                if all(shard["state"] == "submitted" for shard in entry["shards"]):
+                    shards = entry["shards"]
+                    self.journal.complete(draft_hash, self._group_id(draft_hash) if len(shards) > 1
+                                          else shards[0]["batch_id"])
+
+            for draft_hash, group_id, batch_ids in self.journal.groups():
+                self.batch_groups.add(BatchGroup(batch_ids, group_id or self._group_id(draft_hash)))
+            return self.journal.unacknowledged()
         except Exception as e:
-            self.handle_submission_error(e)
-            return ""
+            self.console.print(f"[red]Error recovering submissions: {str(e)}[/red]")
+            return []
+
+    def acknowledge(self, batch_id: str) -> None:
+        """
+        Records that a submitted batch is being monitored, so recover() does not return it again.
+
+        :param batch_id: Batch ID (or batch group ID) returned by submit_batch
+        """
+        self.journal.acknowledge(batch_id)
+
+    @staticmethod
+    def _iter_encoded(batch: Sequence[Dict], start: int = 0, stop: Optional[int] = None) -> Iterator[bytes]:
+        """
+        Yields the encoded JSON of each request in a range of the batch.
+        Spooled drafts are streamed straight from disk without being parsed, and records
+        of in-memory drafts are encoded without building their dictionaries.
+
+        :param batch: List of message dictionaries or a spooled draft
+        :param start: Index of the first request
+        :param stop: Index after the last request (default: end of the batch)
+        :return: Iterator of encoded requests
+        """
+        if hasattr(batch, "iter_raw"):
+            yield from batch.iter_raw(start, stop)
+            return
+        dumps = get_codec().dumps
+        for request in batch[start:stop]:
+            yield dumps(request)
+
+    def shard_batch(self, batch: Sequence[Dict]) -> List[Tuple[int, int]]:
+        """
+        Splits a batch into shards that respect the request count and payload size limits.
+
+        :param batch: List of message dictionaries or a spooled draft
+        :return: List of (start, stop) index ranges, one per shard
+        """
+        return self._scan(batch)[0]
+
+    def _scan(self, batch: Sequence[Dict]) -> Tuple[List[Tuple[int, int]], str]:
+        """
+        Shards a batch and hashes its encoded requests in one pass over the draft.
+
+        :param batch: List of message dictionaries or a spooled draft
+        :return: Tuple of (shard ranges as returned by shard_batch, hex digest identifying the draft)
+        """
+        digest = hashlib.sha256()
+        # Size of the '{"requests": []}' wrapper around every shard
+        envelope_bytes = len(json.dumps({"requests": []}).encode("utf-8"))
+        shards: List[Tuple[int, int]] = []
+        start = 0
+        count = 0
+        current_bytes = envelope_bytes
+
+        for index, encoded in enumerate(self._iter_encoded(batch)):
+            digest.update(encoded)
+            digest.update(b"\n")
+            request_bytes = len(encoded)
+            if envelope_bytes + request_bytes > self.max_bytes:
+                raise ValueError(f"Request at index {index} alone exceeds the batch size limit")
+            # Account for the ', ' separator between requests
+            added_bytes = request_bytes + (2 if count else 0)
+            if count and (count >= self.max_requests or current_bytes + added_bytes > self.max_bytes):
+                shards.append((start, index))
+                start = index
+                count = 0
+                current_bytes = envelope_bytes
+                added_bytes = request_bytes
+            count += 1
+            current_bytes += added_bytes
+
+        if count:
+            shards.append((start, start + count))
+        return shards, digest.hexdigest()
+
+    def submit_batch_group(self, batch: Sequence[Dict], entry: Dict) -> Optional[BatchGroup]:
+        """
+        Submits the shards of a journaled draft in parallel and registers them as one batch group.
+        Each shard is encoded on its own worker, so only in-flight shards are serialized at once.
+        Shards that were already submitted are not sent again, and the group ID is derived from
+        the draft, so resubmitting after a partial failure completes the same group.
+
+        :param batch: List of message dictionaries or a spooled draft
+        :param entry: Journal entry of the draft, as returned by SubmissionJournal.get_draft
+        :return: The submitted BatchGroup, or None if no shard could be submitted
+        """
+        shards = entry["shards"]
+        remaining = [shard for shard in shards if shard["state"] != "submitted"]
+        self.console.print(Panel(f"Submitting {len(remaining)} of {len(shards)} shards to API...", style="blue"))
+
+        batch_ids = []
+        failed = []
+        with self.metrics.timer("stage_seconds", stage="submit"), ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(shards)))) as executor:
+            futures = [executor.submit(self._submit_shard, batch, entry["draft_hash"], shard) for shard in shards]
+            for index, future in enumerate(futures):
+                try:
+                    batch_ids.append(future.result())
+                except Exception as e:
+                    failed.append(index)
+                    self.handle_submission_error(e)
+
+        if not batch_ids:
+            return None
+
+        group = BatchGroup(batch_ids, self._group_id(entry["draft_hash"]))
+        self.batch_groups.add(group)
+        if failed:
+            self.console.print(Panel(f"Shards {', '.join(str(i) for i in failed)} failed to submit. "
+                                     f"Batch group {group.group_id} contains the remaining {len(batch_ids)} shards. "
+                                     f"Submit the draft again to retry the failed shards.",
+                                     style="yellow"))
+        else:
+            self.journal.complete(entry["draft_hash"], group.group_id)
+            self.console.print(Panel(f"Batch group submitted successfully. Group ID: {group.group_id} "
+                                     f"({len(batch_ids)} batches)", style="green"))
+        return group
 
     def handle_submission_error(self, error: Exception) -> None:
         """
@@ -33,28 +557,72 @@ class BatchSubmitter:
 
         :param error: The exception that was raised during submission
         """
-        error_message = str(error)
-        self.console.print(Panel(f"Error submitting batch: {error_message}", style="bold red"))
+        response = getattr(error, "response", None)
+        status = response.status_code if response is not None else None
+        error_type, error_message = self._describe_api_error(response) if response is not None else (None, None)
+        self.metrics.increment("submission_errors_total", error=error_type or type(error).__name__,
+                               status=str(status) if status is not None else "none")
 
-        if isinstance(error, ValueError):
-            self.console.print("The API response was not in the expected format. Please check the API documentation.")
-        elif isinstance(error, ConnectionError):
+        if status is not None:
+            detail = f"HTTP {status}" + (f" {error_type}" if error_type else "") + f": {error_message or response.reason}"
+            self.console.print(Panel(f"Error submitting batch: {detail}", style="bold red"))
+        else:
+            self.console.print(Panel(f"Error submitting batch: {str(error)}", style="bold red"))
+
+        if status == 429:
+            self.console.print("The API rate limit was hit. Wait a moment and submit the draft again.")
+        elif status in (401, 403):
+            self.console.print("The API key was rejected. Please check ANTHROPIC_API_KEY.")
+        elif status == 413:
+            self.console.print("The batch is too large. Lower the per-batch limits so it is split into smaller shards.")
+        elif status is not None and status >= 500:
+            self.console.print("The API had a server error. Please try again later.")
+        elif status is not None:
+            self.console.print("The API rejected the batch. Please check the requests in the draft.")
+        elif isinstance(error, (ConnectionError, requests.exceptions.ConnectionError)):
             self.console.print("There was a problem connecting to the API. Please check your internet connection and try again.")
-        elif isinstance(error, TimeoutError):
+        elif isinstance(error, (TimeoutError, requests.exceptions.Timeout)):
             self.console.print("The API request timed out. The server might be overloaded, please try again later.")
+        elif isinstance(error, ValueError):
+            self.console.print("The API response was not in the expected format. Please check the API documentation.")
         else:
             self.console.print("An unexpected error occurred. Please contact support if this problem persists.")
 
-        # Log the error for debugging purposes
-        # In a real-world application, you might want to use a proper logging system
+        request_id = response.headers.get("request-id") if response is not None else None
+        if request_id:
+            self.console.print(f"[dim]Request ID: {request_id}[/dim]")
         self.console.print(f"[dim]Debug information: {repr(error)}[/dim]")
 
-        # Optionally, you could implement retry logic here
-        # self.retry_submission(batch)
+    @staticmethod
+    def _describe_api_error(response: requests.Response) -> Tuple[Optional[str], Optional[str]]:
+        """
+        Extracts the error type and message from an API error response.
+
+        :param response: Response of the failed request
+        :return: Tuple of (error type, message), None for parts the body does not contain
+        """
+        try:
+            error = response.json().get("error") or {}
+        except Exception:
+            return None, None
+        if not isinstance(error, dict):
+            return None, str(error)
+        return error.get("type"), error.get("message")
 
-    # Additional helper methods could be added here, such as:
-    # def retry_submission(self, batch: List[Dict], max_retries: int = 3) -> str:
-    #     ...
+    def validate_batch(self, batch: Sequence[Dict]) -> bool:
+        """
+        Validates a draft locally and prints its problems, so an invalid draft is caught
+        before any of it is uploaded.
 
-    # def validate_batch(self, batch: List[Dict]) -> bool:
-    #     ...
+        :param batch: List of message dictionaries or a spooled draft
+        :return: False if the draft has errors; warnings alone do not stop a submission
+        """
+        with self.metrics.timer("stage_seconds", stage="validate"):
+            report = self.validator.validate(batch)
+        self.last_validation = report
+        if report["issues"]:
+            self.console.print(self.validator.format_report(report))
+        if not report["valid"]:
+            self.console.print(Panel(f"The draft has {sum(report['errors'].values()):,} errors and was not submitted. "
+                                     f"Fix the requests listed above and submit again.", style="bold red"))
+        return report["valid"]
\ No newline at end of file
@@ -0,0 +1,119 @@
+"""
+Measures peak memory of APIClient.create_batch as the batch size grows.
+
+A local stub server consumes the upload, and every measurement runs in a fresh
+subprocess so that its peak RSS is not affected by earlier runs. The 'buffered'
+mode reproduces the old behaviour of posting one fully serialized JSON payload.
+
+Usage:
+    python benchmarks/bench_create_batch.py [--sizes 1000 10000 100000] [--gzip]
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _iter_body(self):
+        if self.headers.get("transfer-encoding", "").lower() == "chunked":
+            while True:
+                size = int(self.rfile.readline().split(b";")[0], 16)
+                if size == 0:
+                    self.rfile.readline()
+                    return
+                yield self.rfile.read(size)
+                self.rfile.readline()
+        else:
+            remaining = int(self.headers.get("content-length", 0))
+            while remaining:
+                chunk = self.rfile.read(min(remaining, 64 * 1024))
+                remaining -= len(chunk)
+                yield chunk
+
+    def do_POST(self):
+        decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16) if self.headers.get("content-encoding") == "gzip" else None
+        received = 0
+        for chunk in self._iter_body():
+            received += len(decompressor.decompress(chunk) if decompressor else chunk)
+        body = json.dumps({"id": "msgbatch_stub", "received_bytes": received}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("content-type", "application/json")
+        self.send_header("content-length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+def generate_requests(count: int):
+    for index in range(count):
+        yield {
+            "custom_id": f"request_{index}",
+            "params": {
+                "model": "claude-3-haiku-20240307",
+                "max_tokens": 256,
+                "messages": [{"role": "user", "content": f"Prompt number {index}: " + "lorem ipsum " * 40}]
+            }
+        }
+
+def run_child(base_url: str, count: int, mode: str, gzip: bool) -> None:
+    import requests
+    from api_client import APIClient
+
+    client = APIClient("stub-key", gzip_uploads=gzip, base_url=base_url)
+    start = time.perf_counter()
+    if mode == "buffered":
+        payload = {"requests": list(generate_requests(count))}
+        response = requests.post(f"{base_url}/messages/batches", headers=client.headers, json=payload)
+        result = response.json()
+    else:
+        result = client.create_batch(generate_requests(count))
+    elapsed = time.perf_counter() - start
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({
+        "mode": mode,
+        "requests": count,
+        "seconds": round(elapsed, 3),
+        "payload_mb": round(result["received_bytes"] / 1e6, 1),
+        "peak_rss_mb": round(peak_kb / 1024, 1)
+    }))
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--modes", nargs="+", default=["buffered", "streaming"], choices=["buffered", "streaming"])
+    parser.add_argument("--gzip", action="store_true", help="gzip-compress streamed uploads")
+    parser.add_argument("--child", nargs=3, metavar=("URL", "COUNT", "MODE"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        url, count, mode = args.child
+        run_child(url, int(count), mode, args.gzip)
+        return
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    try:
+        for size in args.sizes:
+            for mode in args.modes:
+                command = [sys.executable, __file__, "--child", base_url, str(size), mode]
+                if args.gzip:
+                    command.append("--gzip")
+                output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+                print(output.strip())
+    finally:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
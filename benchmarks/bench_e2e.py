@@ -0,0 +1,143 @@
+"""
+Drives the whole pipeline (import -> submit -> poll -> download) against the local
+stub server and records what each run costs.
+
+The stub server (stub_server.py) runs in its own process, and every size runs
+'main.py submit FILE --wait' in a fresh process with its own data directory, so peak
+RSS is that of the app alone. For each size the script reports the wall time and the
+time of each phase (taken from the JSON lines the command prints), the API calls made
+by endpoint, peak RSS, megabytes uploaded and downloaded and the combined MB/s.
+
+With --baseline, results are compared with an earlier run's output (its JSON lines)
+and the script exits with status 1 when wall time or peak RSS of a size grew by more
+than --tolerance, so it can catch regressions in CI.
+
+Usage:
+    python benchmarks/bench_e2e.py [--sizes 1000 100000 1000000] [--processing-rate 100000]
+                                   [--latency 0.0] [--error-rate 0.0] [--rate-limit-rate 0.0]
+                                   [--baseline previous.jsonl] [--tolerance 0.25]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+MODEL = "claude-3-haiku-20240307"
+
+def write_prompts(path: str, count: int) -> None:
+    with open(path, "w") as file:
+        for index in range(count):
+            file.write(json.dumps({"custom_id": f"request_{index}",
+                                   "content": f"Prompt number {index}: " + "lorem ipsum " * 40}) + "\n")
+
+def start_stub(args) -> subprocess.Popen:
+    command = [sys.executable, os.path.join(ROOT, "stub_server.py"), "--port", "0",
+               "--processing-rate", str(args.processing_rate), "--latency", str(args.latency),
+               "--error-rate", str(args.error_rate), "--rate-limit-rate", str(args.rate_limit_rate),
+               "--retry-after", "0.5", "--seed", "1"]
+    return subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+
+def get_stats(base_url: str) -> dict:
+    root = base_url.rsplit("/v1", 1)[0]
+    with urllib.request.urlopen(f"{root}/stub/stats") as response:
+        return json.load(response)
+
+def run_pipeline(base_url: str, size: int, directory: str, args) -> dict:
+    prompts = os.path.join(directory, "prompts.jsonl")
+    write_prompts(prompts, size)
+    env = dict(os.environ, BATCHFORGE_DATA_DIR=os.path.join(directory, "data"), ANTHROPIC_API_KEY="stub-key")
+    command = [sys.executable, os.path.join(ROOT, "main.py"), "--base-url", base_url,
+               "--draft", os.path.join(directory, "draft.jsonl"), "submit", prompts, "--model", MODEL,
+               "--wait", "--poll-interval", str(args.poll_interval), "--timeout", str(args.timeout)]
+
+    before = get_stats(base_url)
+    with open(os.path.join(directory, "stderr.log"), "w") as log:
+        start = time.perf_counter()
+        process = subprocess.Popen(command, env=env, stdout=subprocess.PIPE, stderr=log, text=True)
+        # Phases end when the command reports the batch ID, its last status and the downloaded results
+        phases = {}
+        for line in process.stdout:
+            record = json.loads(line)
+            elapsed = time.perf_counter() - start
+            if "results" in record:
+                phases["download"] = elapsed
+            elif record.get("event") == "status":
+                phases["poll"] = elapsed
+            elif "batch_id" in record and "requests" in record:
+                phases["import_submit"] = elapsed
+        _, status, usage = os.wait4(process.pid, 0)
+        wall = time.perf_counter() - start
+    after = get_stats(base_url)
+
+    calls = {endpoint: count - before["calls"].get(endpoint, 0) for endpoint, count in after["calls"].items()}
+    uploaded = (after["bytes_received"] - before["bytes_received"]) / 1e6
+    downloaded = (after["bytes_sent"] - before["bytes_sent"]) / 1e6
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak_rss_mb = usage.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+    return {
+        "requests": size,
+        "exit_code": os.waitstatus_to_exitcode(status),
+        "wall_s": round(wall, 2),
+        "phases_s": {
+            "import_submit": round(phases.get("import_submit", 0.0), 2),
+            "poll": round(phases.get("poll", 0.0) - phases.get("import_submit", 0.0), 2),
+            "download": round(phases.get("download", 0.0) - phases.get("poll", 0.0), 2)
+        },
+        "api_calls": sum(count for count in calls.values() if count) - calls.get("not_modified", 0),
+        "calls_by_endpoint": {endpoint: count for endpoint, count in calls.items() if count},
+        "peak_rss_mb": round(peak_rss_mb, 1),
+        "upload_mb": round(uploaded, 1),
+        "download_mb": round(downloaded, 1),
+        "mb_per_s": round((uploaded + downloaded) / wall, 1),
+        "requests_per_s": round(size / wall)
+    }
+
+def load_baseline(path: str) -> dict:
+    with open(path) as file:
+        return {record["requests"]: record for record in map(json.loads, file) if "requests" in record}
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 100000, 1000000])
+    parser.add_argument("--processing-rate", type=float, default=100000.0,
+                        help="Requests per second the stub finishes per batch")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds the stub delays every call by")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Probability of an injected 500 per call")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Probability of an injected 429 per call")
+    parser.add_argument("--poll-interval", type=float, default=1.0)
+    parser.add_argument("--timeout", type=float, default=3600.0, help="Seconds to wait for each batch")
+    parser.add_argument("--baseline", help="JSON lines output of an earlier run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Allowed relative growth of wall time and peak RSS over the baseline")
+    args = parser.parse_args()
+
+    baseline = load_baseline(args.baseline) if args.baseline else {}
+    stub = start_stub(args)
+    failed = False
+    try:
+        base_url = json.loads(stub.stdout.readline())["base_url"]
+        for size in args.sizes:
+            with tempfile.TemporaryDirectory() as directory:
+                result = run_pipeline(base_url, size, directory, args)
+                if result["exit_code"] != 0:
+                    with open(os.path.join(directory, "stderr.log")) as log:
+                        result["stderr_tail"] = log.read()[-2000:]
+            previous = baseline.get(size)
+            if previous:
+                result["regressions"] = [metric for metric in ["wall_s", "peak_rss_mb"]
+                                         if result[metric] > previous[metric] * (1 + args.tolerance)]
+                failed = failed or bool(result["regressions"])
+            failed = failed or result["exit_code"] != 0
+            print(json.dumps(result), flush=True)
+    finally:
+        stub.terminate()
+        stub.wait()
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
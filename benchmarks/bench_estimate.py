@@ -0,0 +1,68 @@
+"""
+Measures how fast TokenEstimator estimates a spooled draft as the draft grows.
+
+The 'decoded' mode is the straightforward approach of decoding every request and
+counting the characters of its messages; 'estimator' is TokenEstimator.estimate,
+which works on the encoded requests in blocks. Both read the same spooled draft.
+
+Usage:
+    python benchmarks/bench_estimate.py [--sizes 10000 100000 1000000]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from draft_store import SpooledDraftStore
+from token_estimator import TokenEstimator, CHARS_PER_TOKEN
+
+def generate_requests(count: int):
+    for index in range(count):
+        yield {
+            "custom_id": f"request_{index}",
+            "params": {
+                "model": "claude-3-haiku-20240307" if index % 4 else "claude-3-5-sonnet-20241022",
+                "max_tokens": 256,
+                "messages": [{"role": "user", "content": f"Prompt number {index}: " + "lorem ipsum " * 40}]
+            }
+        }
+
+def estimate_decoded(draft: SpooledDraftStore) -> int:
+    tokens = 0
+    for line in draft.iter_raw():
+        request = json.loads(line)
+        chars = sum(len(message["content"]) for message in request["params"]["messages"])
+        tokens += int(chars / CHARS_PER_TOKEN)
+    return tokens
+
+def estimate_blocks(draft: SpooledDraftStore) -> int:
+    return TokenEstimator().estimate(draft)["input_tokens"]
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        for size in args.sizes:
+            draft = SpooledDraftStore(os.path.join(directory, f"draft_{size}.jsonl"))
+            draft.extend(generate_requests(size))
+            for mode, estimate in [("decoded", estimate_decoded), ("estimator", estimate_blocks)]:
+                start = time.perf_counter()
+                tokens = estimate(draft)
+                elapsed = time.perf_counter() - start
+                print(json.dumps({
+                    "mode": mode,
+                    "requests": size,
+                    "seconds": round(elapsed, 3),
+                    "requests_per_s": round(size / elapsed),
+                    "input_tokens": tokens
+                }))
+            draft.close()
+
+if __name__ == "__main__":
+    main()
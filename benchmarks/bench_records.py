@@ -0,0 +1,106 @@
+"""
+Measures memory per request and JSON encode/decode throughput of request dictionaries
+vs. RequestRecords, with every JSON codec installed.
+
+'memory' compares a draft of request dictionaries decoded from JSON, as the in-memory
+draft held them, with the same draft as RequestRecords with interned model names.
+'encode' and 'decode' time the requests of an import (encoding) and the lines of a
+results file (decoding). 'dict' works on dictionaries, so 'dict' with the 'json' codec
+is the stdlib json module as used before; 'record' encodes RequestRecords with the
+codec and 'result_record' decodes results into ResultRecords. The 'json' codec is
+always measured as the baseline.
+
+Usage:
+    python benchmarks/bench_records.py [--requests 100000] [--codecs json orjson msgspec]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from json_codec import available_codecs, load_codec
+from records import RequestRecord, ResultRecord
+
+MODELS = ["claude-3-haiku-20240307", "claude-3-5-sonnet-20241022"]
+
+def generate_requests(count: int):
+    for index in range(count):
+        yield {
+            "custom_id": f"request_{index}",
+            "params": {
+                "model": MODELS[index % 4 == 0],
+                "max_tokens": 256,
+                "messages": [{"role": "user", "content": f"Prompt number {index}: " + "lorem ipsum " * 10}]
+            }
+        }
+
+def generate_results(count: int):
+    for index in range(count):
+        yield {"custom_id": f"request_{index}", "result": {"type": "succeeded", "message": {
+            "id": f"msg_{index}", "type": "message", "role": "assistant", "model": MODELS[index % 4 == 0],
+            "content": [{"type": "text", "text": f"Response number {index}: " + "dolor sit amet " * 10}],
+            "stop_reason": "end_turn", "stop_sequence": None,
+            "usage": {"input_tokens": 40, "output_tokens": 50}}}}
+
+def measure_memory(build) -> int:
+    """Returns the bytes still allocated by the object build() returns."""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del kept
+    return after - before
+
+def timed(function, items: list):
+    """Calls function on every item, dropping the return values so the timing is not skewed by garbage collection."""
+    count = len(items)
+    start = time.perf_counter()
+    for item in items:
+        function(item)
+    elapsed = time.perf_counter() - start
+    return {"seconds": round(elapsed, 3), "per_s": round(count / elapsed)}
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=100000)
+    parser.add_argument("--codecs", nargs="+", help="Codecs to compare (default: all installed)")
+    args = parser.parse_args()
+    count = args.requests
+    codecs = [load_codec(name) for name, installed in available_codecs().items()
+              if installed and (args.codecs is None or name in args.codecs or name == "json")]
+
+    # Encoded as they sit in a spooled draft and a results file, so decoding gives every row its own strings
+    lines = [json.dumps(request).encode("utf-8") for request in generate_requests(count)]
+    result_lines = [json.dumps(result).encode("utf-8") for result in generate_results(count)]
+
+    dict_bytes = measure_memory(lambda: [json.loads(line) for line in lines])
+    record_bytes = measure_memory(lambda: [RequestRecord.from_dict(json.loads(line)) for line in lines])
+    print(json.dumps({"measure": "memory", "requests": count,
+                      "dict_bytes_per_request": round(dict_bytes / count),
+                      "record_bytes_per_request": round(record_bytes / count),
+                      "saving": round(1 - record_bytes / dict_bytes, 3)}))
+
+    requests = [json.loads(line) for line in lines]
+    records = [RequestRecord.from_dict(request) for request in requests]
+    results = [json.loads(line) for line in result_lines]
+    for codec in codecs:
+        dumps, loads = codec.dumps, codec.loads
+        # Records must encode to the same bytes as their dictionaries
+        assert records[0].encode(codec) == dumps(requests[0])
+        encoded = [dumps(result) for result in results]
+        print(json.dumps({"measure": "encode", "mode": "dict", "codec": codec.name, "requests": count,
+                          **timed(dumps, requests)}))
+        print(json.dumps({"measure": "encode", "mode": "record", "codec": codec.name, "requests": count,
+                          **timed(lambda record: record.encode(codec), records)}))
+        print(json.dumps({"measure": "decode", "mode": "dict", "codec": codec.name, "requests": count,
+                          **timed(loads, encoded)}))
+        print(json.dumps({"measure": "decode", "mode": "result_record", "codec": codec.name, "requests": count,
+                          **timed(lambda line: ResultRecord.decode(line, codec), encoded)}))
+
+if __name__ == "__main__":
+    main()
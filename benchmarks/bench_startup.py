@@ -0,0 +1,76 @@
+"""
+Measures cold-start time of main.py with 'python -X importtime'.
+
+Every run starts a fresh interpreter, so nothing is cached in-process between
+runs. For each command the median wall time and the median total import time are
+reported, together with the slowest top-level imports of the median run. With
+--max-ms the script exits with status 1 when a command's median import time
+exceeds the budget, so it can guard startup time in CI.
+
+Usage:
+    python benchmarks/bench_startup.py [--runs 5] [--max-ms 150] [--top 5]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+def run_once(argv, env):
+    start = time.perf_counter()
+    completed = subprocess.run([sys.executable, "-X", "importtime", os.path.join(ROOT, "main.py")] + argv,
+                               env=env, capture_output=True, text=True)
+    wall_ms = (time.perf_counter() - start) * 1000
+    modules = {}
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        # Top-level imports are the ones without indentation
+        if not name.startswith("  "):
+            modules[name.strip()] = int(cumulative) / 1000
+    return {"wall_ms": wall_ms, "import_ms": sum(modules.values()), "modules": modules,
+            "returncode": completed.returncode}
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--max-ms", type=float, help="Fail if a command's median import time exceeds this")
+    parser.add_argument("--top", type=int, default=5, help="Number of slowest imports to report")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        prompts = os.path.join(directory, "prompts.txt")
+        with open(prompts, "w") as file:
+            file.write("first prompt\nsecond prompt\n")
+        env = dict(os.environ, BATCHFORGE_DATA_DIR=directory)
+        commands = {
+            "help": ["--help"],
+            "import": ["import", prompts, "--model", "claude-3-haiku-20240307", "--new"],
+        }
+
+        failed = False
+        for name, argv in commands.items():
+            runs = sorted((run_once(argv, env) for _ in range(args.runs)), key=lambda run: run["import_ms"])
+            median = runs[len(runs) // 2]
+            slowest = sorted(median["modules"].items(), key=lambda item: item[1], reverse=True)[:args.top]
+            import_ms = round(median["import_ms"], 1)
+            over_budget = args.max_ms is not None and import_ms > args.max_ms
+            failed = failed or over_budget or median["returncode"] != 0
+            print(json.dumps({
+                "command": name,
+                "runs": args.runs,
+                "wall_ms": round(statistics.median(run["wall_ms"] for run in runs), 1),
+                "import_ms": import_ms,
+                "slowest_imports": {module: round(ms, 1) for module, ms in slowest},
+                "over_budget": over_budget
+            }))
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,314 @@
+from typing import Dict, List, Optional, Sequence, TextIO, Tuple
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+from poll_scheduler import PollScheduler
+from rate_limiter import is_retryable_error
+
+# Exit codes of the headless commands
+EXIT_OK = 0
+EXIT_ERROR = 1
+EXIT_USAGE = 2
+EXIT_TIMEOUT = 3
+EXIT_NOT_READY = 4
+
+RESULT_TYPES = ["succeeded", "errored", "canceled", "expired"]
+
+def build_parser() -> argparse.ArgumentParser:
+    """
+    Returns the command line parser. Without a command the interactive menu is started.
+    """
+    parser = argparse.ArgumentParser(
+        description="Draft, submit, monitor and retrieve Message Batches. "
+                    "Run without a command for the interactive menu.",
+        epilog=f"Exit codes: {EXIT_OK} success, {EXIT_ERROR} error, {EXIT_USAGE} invalid arguments, "
+               f"{EXIT_TIMEOUT} timed out while waiting, {EXIT_NOT_READY} batch has not ended yet.")
+    parser.add_argument("--draft", help="Path of the spooled draft (default: draft.jsonl in the data directory)")
+    parser.add_argument("--base-url", help="API base URL, e.g. a local stub_server.py "
+                                           "(default: $BATCHFORGE_BASE_URL or https://api.anthropic.com/v1)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Send every prompt instead of answering repeated ones from the prompt cache")
+    parser.add_argument("--metrics-port", type=int,
+                        help="Serve API and stage metrics in the Prometheus text format at http://127.0.0.1:PORT/metrics")
+    parser.add_argument("--metrics-file", help="Write a JSON snapshot of the metrics to this file periodically and at exit")
+    parser.add_argument("--metrics-interval", type=float, default=15.0,
+                        help="Seconds between two metrics snapshots written to --metrics-file")
+    parser.add_argument("--profile", nargs="?", const="", metavar="DIR",
+                        help="Profile the command with cProfile and tracemalloc and write the reports to DIR "
+                             "(default: profiles/<time>_<command> in the data directory)")
+    parser.add_argument("--profile-sort", choices=["cumulative", "tottime", "calls"], default="cumulative",
+                        help="Sort order of the profiled functions")
+    parser.add_argument("--profile-frames", type=int, default=1,
+                        help="Stack frames recorded per allocation site (more show callers but slow the run down)")
+    commands = parser.add_subparsers(dest="command", metavar="command")
+
+    import_parser = commands.add_parser("import", help="Import prompts from files into the draft")
+    _add_import_arguments(import_parser, required=True)
+    import_parser.add_argument("--new", action="store_true", help="Start a new draft instead of appending")
+
+    commands.add_parser("validate", help="Check the draft for problems the API would reject it for")
+
+    submit_parser = commands.add_parser("submit", help="Submit the draft, or only the given files")
+    _add_import_arguments(submit_parser, required=False)
+    submit_parser.add_argument("--force", action="store_true",
+                               help="Submit again even if the draft was already submitted and its batch can still deliver results")
+    submit_parser.add_argument("--wait", action="store_true",
+                               help="Wait until the batch has ended and download its results")
+    _add_wait_arguments(submit_parser)
+
+    wait_parser = commands.add_parser("wait", help="Wait until batches have ended, printing status changes")
+    wait_parser.add_argument("batch_ids", nargs="+", metavar="batch_id")
+    _add_wait_arguments(wait_parser)
+
+    results_parser = commands.add_parser("results", help="Print the results of an ended batch as JSON lines")
+    results_parser.add_argument("batch_id")
+    results_parser.add_argument("--type", choices=RESULT_TYPES, help="Only print results of this type")
+    results_parser.add_argument("--output", help="Write the results to this file instead of stdout")
+
+    list_parser = commands.add_parser("list", help="Print batches as JSON lines, newest first")
+    list_parser.add_argument("--status", choices=["in_progress", "canceling", "ended"])
+    list_parser.add_argument("--created-after", help="ISO 8601 timestamp")
+    list_parser.add_argument("--created-before", help="ISO 8601 timestamp")
+    list_parser.add_argument("--limit", type=int, default=20, help="Maximum number of batches (0 for all)")
+
+    cancel_parser = commands.add_parser("cancel", help="Cancel a batch")
+    cancel_parser.add_argument("batch_id")
+    return parser
+
+def _add_import_arguments(parser: argparse.ArgumentParser, required: bool) -> None:
+    parser.add_argument("files", nargs="+" if required else "*", metavar="file",
+                        help="Files, directories or glob patterns with prompts (.txt, .json, .jsonl, .csv)")
+    parser.add_argument("--model", required=required, help="Model name for the imported prompts")
+    parser.add_argument("--max-tokens", type=int, default=100, help="max_tokens for the imported prompts")
+    parser.add_argument("--workers", type=int, help="Worker processes for multi-file imports (default: number of CPUs)")
+
+def _add_wait_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--timeout", type=float, help="Give up after this many seconds")
+    parser.add_argument("--poll-interval", type=float, default=5.0, help="Shortest time between polls in seconds")
+
+class HeadlessCLI:
+    """
+    Runs single commands without the interactive menu, for scripts, cron jobs and CI.
+
+    Every command writes JSON to stdout, one object per line, and streams it as it is
+    produced; progress and diagnostics from the components go to stderr. The return
+    value of run() is the process exit code.
+    """
+    def __init__(self, batch_drafter, batch_submitter, batch_manager, out: Optional[TextIO] = None):
+        """
+        :param batch_drafter: BatchDrafter holding the draft
+        :param batch_submitter: BatchSubmitter used by 'submit'
+        :param batch_manager: BatchManager used to look up, wait for, download and cancel batches
+        :param out: Stream the JSON output is written to (default: stdout)
+        """
+        self.batch_drafter = batch_drafter
+        self.batch_submitter = batch_submitter
+        self.batch_manager = batch_manager
+        self.out = out or sys.stdout
+
+    def emit(self, record: Dict) -> None:
+        """Writes one JSON line to the output and flushes it."""
+        self.out.write(json.dumps(record) + "\n")
+        self.out.flush()
+
+    def run(self, args: argparse.Namespace) -> int:
+        """
+        Runs the command selected on the command line.
+
+        :param args: Parsed arguments from build_parser()
+        :return: Exit code
+        """
+        handler = getattr(self, f"cmd_{args.command}")
+        try:
+            return handler(args)
+        except Exception as e:
+            self.emit({"error": str(e)})
+            return EXIT_ERROR
+
+    def cmd_import(self, args: argparse.Namespace) -> int:
+        """Imports files into the draft."""
+        if args.new:
+            self.batch_drafter.create_new_batch()
+        imported = self.batch_drafter.import_files(args.files, args.model, args.max_tokens, args.workers)
+        if imported is None:
+            self.emit({"error": f"Could not import {' '.join(args.files)}"})
+            return EXIT_ERROR
+        self.emit({"imported": imported, "requests": len(self.batch_drafter.get_batch())})
+        return EXIT_OK
+
+    def cmd_validate(self, args: argparse.Namespace) -> int:
+        """Validates the draft, failing if it has errors."""
+        report = self.batch_drafter.validate_batch()
+        self.emit(report)
+        return EXIT_OK if report["valid"] else EXIT_ERROR
+
+    def cmd_submit(self, args: argparse.Namespace) -> int:
+        """
+        Submits the draft, or only the given files, optionally waiting for the results.
+        Files are imported into a temporary draft, so the persisted draft is left as it is.
+        """
+        if args.files:
+            if not args.model:
+                self.emit({"error": "--model is required when a file is given"})
+                return EXIT_USAGE
+            code, batch_id = self._submit_files(args)
+        else:
+            code, batch_id = self._submit_draft(self.batch_drafter.get_batch(), args.force)
+        if code != EXIT_OK or not args.wait:
+            return code
+
+        # This process follows the batch to the end, so recovery does not need to pick it up
+        self.batch_submitter.acknowledge(batch_id)
+        code = self._wait([batch_id], args.timeout, args.poll_interval)
+        if code != EXIT_OK:
+            return code
+        paths = self._download(batch_id)
+        if paths is None:
+            return EXIT_ERROR
+        self.emit({"batch_id": batch_id, "results": paths})
+        return EXIT_OK
+
+    def _submit_files(self, args: argparse.Namespace) -> Tuple[int, str]:
+        """
+        Imports files into a temporary spooled draft next to the persisted one and submits it.
+
+        :param args: Parsed arguments of the 'submit' command
+        :return: Tuple of (exit code, batch ID or an empty string)
+        """
+        from batch_drafter import BatchDrafter
+
+        draft = self.batch_drafter.get_batch()
+        directory = os.path.dirname(os.path.abspath(draft.path)) if hasattr(draft, "path") else None
+        with tempfile.TemporaryDirectory(prefix="submit_", dir=directory) as temp_dir:
+            drafter = BatchDrafter(self.batch_drafter.config_manager, spool_path=os.path.join(temp_dir, "draft.jsonl"))
+            try:
+                if drafter.import_files(args.files, args.model, args.max_tokens, args.workers) is None:
+                    self.emit({"error": f"Could not import {' '.join(args.files)}"})
+                    return EXIT_ERROR, ""
+                return self._submit_draft(drafter.get_batch(), args.force)
+            finally:
+                drafter.get_batch().close()
+
+    def _submit_draft(self, batch: Sequence[Dict], force: bool) -> Tuple[int, str]:
+        """
+        Submits a draft and emits its batch ID, or why it was not submitted.
+
+        :param batch: The draft to submit
+        :param force: Passed on to BatchSubmitter.submit_batch
+        :return: Tuple of (exit code, batch ID or an empty string)
+        """
+        batch_id = self.batch_submitter.submit_batch(batch, force=force)
+        if not batch_id:
+            validation = self.batch_submitter.last_validation
+            if validation is not None and not validation["valid"]:
+                self.emit({"error": "The draft is invalid", "validation": validation})
+            else:
+                self.emit({"error": "Batch submission failed"})
+            return EXIT_ERROR, ""
+        self.emit({"batch_id": batch_id, "requests": len(batch)})
+        return EXIT_OK, batch_id
+
+    def _download(self, batch_id: str) -> Optional[List[str]]:
+        """
+        Downloads the results of an ended batch, emitting an error line if that fails.
+
+        :param batch_id: ID of the batch (or batch group)
+        :return: Paths of the downloaded result files, or None on failure
+        """
+        paths = self.batch_manager.download_batch_results(batch_id)
+        group = self.batch_manager.batch_groups.get(batch_id)
+        # A group without member batches was answered entirely from the prompt cache
+        if not paths and (group is None or group.batch_ids):
+            self.emit({"batch_id": batch_id, "error": "Results could not be downloaded"})
+            return None
+        return paths
+
+    def cmd_wait(self, args: argparse.Namespace) -> int:
+        """Waits until batches have ended."""
+        return self._wait(args.batch_ids, args.timeout, args.poll_interval)
+
+    def _wait(self, batch_ids: List[str], timeout: Optional[float], poll_interval: float) -> int:
+        """
+        Polls batches until all of them have ended, emitting a line whenever a status changes.
+        Rate limits, server errors and dropped connections are retried with backoff; any
+        other error, such as an unknown batch ID, ends the wait with an error line.
+
+        :param batch_ids: IDs of the batches (or batch groups) to wait for
+        :param timeout: Seconds after which to give up, or None to wait indefinitely
+        :param poll_interval: Shortest time between two polls of a batch
+        :return: Exit code
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        scheduler = PollScheduler(min_interval=poll_interval)
+        last_seen: Dict[str, Dict] = {}
+        for batch_id in batch_ids:
+            scheduler.add(batch_id)
+
+        while len(scheduler):
+            delay = scheduler.next_due_in()
+            if deadline is not None and time.monotonic() + delay > deadline:
+                time.sleep(max(deadline - time.monotonic(), 0.0))
+                self.emit({"event": "timeout", "pending": [batch_id for batch_id in batch_ids
+                                                           if batch_id in scheduler]})
+                return EXIT_TIMEOUT
+            for batch_id in scheduler.wait_due():
+                try:
+                    details = self.batch_manager.fetch_batch_details(batch_id)
+                except Exception as e:
+                    if is_retryable_error(e):
+                        scheduler.record_error(batch_id)
+                        continue
+                    # Polling again would fail the same way, e.g. for an unknown batch ID
+                    self.emit({"batch_id": batch_id, "error": str(e)})
+                    return EXIT_ERROR
+                scheduler.record(batch_id, details)
+                state = {"processing_status": details.get("processing_status"),
+                         "request_counts": details.get("request_counts", {})}
+                if state != last_seen.get(batch_id):
+                    last_seen[batch_id] = state
+                    self.emit({"event": "status", "batch_id": batch_id, **state})
+        return EXIT_OK
+
+    def cmd_results(self, args: argparse.Namespace) -> int:
+        """Prints or saves the results of an ended batch."""
+        details = self.batch_manager.get_batch_details(args.batch_id)
+        if not details:
+            self.emit({"batch_id": args.batch_id, "error": "Batch not found"})
+            return EXIT_ERROR
+        if details.get("processing_status") != "ended":
+            self.emit({"batch_id": args.batch_id, "processing_status": details.get("processing_status"),
+                       "error": "Batch has not ended yet"})
+            return EXIT_NOT_READY
+        if self._download(args.batch_id) is None:
+            return EXIT_ERROR
+
+        results = self.batch_manager.retrieve_batch_results(args.batch_id, args.type)
+        if not args.output:
+            for result in results:
+                self.emit(result)
+            return EXIT_OK
+        count = 0
+        with open(args.output, "w") as file:
+            for result in results:
+                file.write(json.dumps(result) + "\n")
+                count += 1
+        self.emit({"batch_id": args.batch_id, "results": count, "output": args.output})
+        return EXIT_OK
+
+    def cmd_list(self, args: argparse.Namespace) -> int:
+        """Prints batches from the synced catalog."""
+        batches = self.batch_manager.search_batches(status=args.status, created_after=args.created_after,
+                                                    created_before=args.created_before, limit=args.limit or None)
+        for batch in batches:
+            self.emit(batch)
+        return EXIT_OK
+
+    def cmd_cancel(self, args: argparse.Namespace) -> int:
+        """Cancels a batch."""
+        canceled = self.batch_manager.cancel_batch(args.batch_id)
+        self.emit({"batch_id": args.batch_id, "canceled": canceled})
+        return EXIT_OK if canceled else EXIT_ERROR
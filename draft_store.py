@@ -0,0 +1,357 @@
+from typing import Dict, Iterable, Iterator, List, Optional, Union
+from collections.abc import MutableSequence
+from array import array
+from itertools import islice
+import copy
+import os
+import threading
+
+from json_codec import get_codec
+from records import RequestRecord
+
+class SpooledDraftStore(MutableSequence):
+    """
+    A draft backend that spools requests to disk instead of keeping them in memory.
+
+    Requests are stored as lines in an append-only JSONL file. A sidecar index file
+    holds one 8-byte offset per live request, in draft order, and is the only
+    structure kept in memory. Edits append a new line and repoint the index entry,
+    removals drop the entry from the index, so the draft survives a crash and can be
+    reopened from the same path. Superseded lines are reclaimed by compact().
+    """
+    def __init__(self, path: str):
+        """
+        Opens (or creates) a spooled draft.
+
+        :param path: Path of the JSONL data file; the index is stored next to it with an '.idx' suffix
+        """
+        self.path = path
+        self.index_path = f"{path}.idx"
+        self._lock = threading.RLock()
+        self.codec = get_codec()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        self._data = open(self.path, "ab+")
+        self._offsets = array("Q")
+        if os.path.exists(self.index_path):
+            self._load_index()
+        else:
+            self._rebuild_index()
+        self._index = open(self.index_path, "rb+")
+        self._end = self._data.seek(0, os.SEEK_END)
+        # Make sure a line torn by a crash never merges with the next append
+        if self._end and self._read_at(self._end - 1, 1) != b"\n":
+            self._data.write(b"\n")
+            self._end += 1
+        self._dirty = False
+
+    def _load_index(self) -> None:
+        """Loads the offset index from disk, ignoring entries that point past the data file."""
+        data_size = os.path.getsize(self.path)
+        with open(self.index_path, "rb") as index_file:
+            raw = index_file.read()
+        offsets = array("Q")
+        offsets.frombytes(raw[:len(raw) - len(raw) % offsets.itemsize])
+        self._offsets = array("Q", (offset for offset in offsets if offset < data_size))
+
+    def _rebuild_index(self) -> None:
+        """
+        Rebuilds the offset index by scanning the data file. Every complete, parsable line is
+        treated as live, so superseded versions of edited requests reappear if the index was lost.
+        """
+        self._offsets = array("Q")
+        loads = self.codec.loads
+        with open(self.path, "rb") as data_file:
+            offset = 0
+            for line in data_file:
+                if line.endswith(b"\n"):
+                    try:
+                        loads(line)
+                        self._offsets.append(offset)
+                    except self.codec.errors:
+                        pass
+                offset += len(line)
+        with open(self.index_path, "wb") as index_file:
+            self._offsets.tofile(index_file)
+
+    def _read_at(self, offset: int, size: int) -> bytes:
+        self._data.seek(offset)
+        return self._data.read(size)
+
+    def _write_line(self, request: Union[Dict, RequestRecord]) -> int:
+        """Appends one encoded request to the data file and returns its offset."""
+        if isinstance(request, RequestRecord):
+            line = request.encode(self.codec) + b"\n"
+        else:
+            line = self.codec.dumps(request) + b"\n"
+        offset = self._end
+        self._data.seek(0, os.SEEK_END)
+        self._data.write(line)
+        self._end += len(line)
+        self._dirty = True
+        return offset
+
+    def _write_index_from(self, position: int) -> None:
+        """Rewrites the index file from the given position to the end."""
+        self._index.seek(position * self._offsets.itemsize)
+        self._index.write(self._offsets[position:].tobytes())
+        self._index.truncate()
+        self._dirty = True
+
+    def _normalize(self, index: int) -> int:
+        if index < 0:
+            index += len(self._offsets)
+        if not 0 <= index < len(self._offsets):
+            raise IndexError("draft index out of range")
+        return index
+
+    def flush(self) -> None:
+        """Flushes pending writes of the data and index files to disk."""
+        with self._lock:
+            if self._dirty:
+                self._data.flush()
+                self._index.flush()
+                self._dirty = False
+
+    def close(self) -> None:
+        """Flushes and closes the underlying files."""
+        with self._lock:
+            self.flush()
+            self._data.close()
+            self._index.close()
+
+    def delete(self) -> None:
+        """Closes the draft and deletes its data and index files, e.g. for a temporary draft."""
+        with self._lock:
+            self._data.close()
+            self._index.close()
+            for path in [self.path, self.index_path]:
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def __getitem__(self, index: int) -> Dict:
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        with self._lock:
+            offset = self._offsets[self._normalize(index)]
+            self.flush()
+            self._data.seek(offset)
+            return self.codec.loads(self._data.readline())
+
+    def __setitem__(self, index: int, request: Dict) -> None:
+        with self._lock:
+            index = self._normalize(index)
+            self._offsets[index] = self._write_line(request)
+            self._index.seek(index * self._offsets.itemsize)
+            self._index.write(self._offsets[index:index + 1].tobytes())
+
+    def __delitem__(self, index: int) -> None:
+        with self._lock:
+            index = self._normalize(index)
+            del self._offsets[index]
+            self._write_index_from(index)
+
+    def insert(self, index: int, request: Dict) -> None:
+        with self._lock:
+            index = max(0, min(index if index >= 0 else index + len(self._offsets), len(self._offsets)))
+            self._offsets.insert(index, self._write_line(request))
+            self._write_index_from(index)
+
+    def append(self, request: Dict) -> None:
+        with self._lock:
+            self._offsets.append(self._write_line(request))
+            self._index.seek(0, os.SEEK_END)
+            self._index.write(self._offsets[-1:].tobytes())
+
+    def extend(self, requests) -> None:
+        with self._lock:
+            for request in requests:
+                self.append(request)
+            self.flush()
+
+    def extend_raw(self, lines: Iterable[bytes]) -> None:
+        """
+        Appends already encoded requests without decoding them.
+
+        :param lines: Encoded JSON of each request, without trailing newlines
+        """
+        with self._lock:
+            start = len(self._offsets)
+            self._data.seek(0, os.SEEK_END)
+            for line in lines:
+                self._offsets.append(self._end)
+                self._data.write(line)
+                self._data.write(b"\n")
+                self._end += len(line) + 1
+            self._write_index_from(start)
+            self.flush()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._offsets = array("Q")
+            self._data.truncate(0)
+            self._index.truncate(0)
+            self._end = 0
+            self._dirty = True
+            self.flush()
+
+    def __iter__(self) -> Iterator[Dict]:
+        loads = self.codec.loads
+        for line in self.iter_raw():
+            yield loads(line)
+
+    def iter_raw(self, start: int = 0, stop: Optional[int] = None) -> Iterator[bytes]:
+        """
+        Yields the encoded JSON of each request in draft order, without parsing it.
+        Uses its own file handle, so several readers can stream from the draft at once.
+
+        :param start: Index of the first request
+        :param stop: Index after the last request (default: end of the draft)
+        :return: Iterator of encoded requests, without trailing newlines
+        """
+        with self._lock:
+            self.flush()
+            offsets = self._offsets[start:stop]
+        with open(self.path, "rb") as data_file:
+            position = -1
+            for offset in offsets:
+                if offset != position:
+                    data_file.seek(offset)
+                line = data_file.readline()
+                position = offset + len(line)
+                yield line.rstrip(b"\n")
+
+    def compact(self) -> None:
+        """Rewrites the data file so that it only contains live requests, in draft order."""
+        with self._lock:
+            temp_path = f"{self.path}.tmp"
+            offsets = array("Q")
+            with open(temp_path, "wb") as temp_file:
+                position = 0
+                for line in self.iter_raw():
+                    offsets.append(position)
+                    temp_file.write(line + b"\n")
+                    position += len(line) + 1
+            self._data.close()
+            self._index.close()
+            os.replace(temp_path, self.path)
+            with open(self.index_path, "wb") as index_file:
+                offsets.tofile(index_file)
+            self._data = open(self.path, "ab+")
+            self._index = open(self.index_path, "rb+")
+            self._offsets = offsets
+            self._end = position
+            self._dirty = False
+
+class RecordDraftStore(MutableSequence):
+    """
+    The in-memory draft backend, which keeps requests as RequestRecords where it can.
+
+    Requests with a single user text message are stored as records, anything else as the
+    dictionary it was given. Items are handed out and taken in as dictionaries, like a
+    list of requests, and as with SpooledDraftStore a dictionary read from the draft is a
+    copy: changes are kept by assigning it back. iter_raw() and extend_raw() exchange
+    encoded requests with the codec, so drafts can be estimated, validated and uploaded
+    without building the dictionaries at all.
+    """
+    def __init__(self, requests: Iterable[Dict] = ()):
+        """
+        :param requests: Requests the draft starts with
+        """
+        self.codec = get_codec()
+        self._items: List[Union[RequestRecord, Dict]] = []
+        self.extend(requests)
+
+    @staticmethod
+    def _pack(request: Union[RequestRecord, Dict]) -> Union[RequestRecord, Dict]:
+        if isinstance(request, RequestRecord):
+            return request
+        return RequestRecord.from_dict(request) or copy.deepcopy(request)
+
+    @staticmethod
+    def _unpack(item: Union[RequestRecord, Dict]) -> Dict:
+        return item.to_dict() if isinstance(item, RequestRecord) else copy.deepcopy(item)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __getitem__(self, index: int) -> Dict:
+        if isinstance(index, slice):
+            return [self._unpack(item) for item in self._items[index]]
+        return self._unpack(self._items[index])
+
+    def __setitem__(self, index: int, request: Dict) -> None:
+        self._items[index] = self._pack(request)
+
+    def __delitem__(self, index: int) -> None:
+        del self._items[index]
+
+    def insert(self, index: int, request: Dict) -> None:
+        self._items.insert(index, self._pack(request))
+
+    def append(self, request: Dict) -> None:
+        self._items.append(self._pack(request))
+
+    def extend(self, requests) -> None:
+        pack = self._pack
+        self._items.extend(pack(request) for request in requests)
+
+    def extend_raw(self, lines: Iterable[bytes]) -> None:
+        """
+        Appends encoded requests, decoding them with the codec.
+
+        :param lines: Encoded JSON of each request, without trailing newlines
+        """
+        loads = self.codec.loads
+        pack = self._pack
+        self._items.extend(pack(loads(line)) for line in lines)
+
+    def clear(self) -> None:
+        self._items = []
+
+    def __iter__(self) -> Iterator[Dict]:
+        unpack = self._unpack
+        for item in list(self._items):
+            yield unpack(item)
+
+    def iter_raw(self, start: int = 0, stop: Optional[int] = None) -> Iterator[bytes]:
+        """
+        Yields the encoded JSON of each request in draft order.
+
+        :param start: Index of the first request
+        :param stop: Index after the last request (default: end of the draft)
+        :return: Iterator of encoded requests, without trailing newlines
+        """
+        codec = self.codec
+        dumps = codec.dumps
+        for item in self._items[start:stop]:
+            yield item.encode(codec) if isinstance(item, RequestRecord) else dumps(item)
+
+    def records(self) -> List[Union[RequestRecord, Dict]]:
+        """Returns the stored items: RequestRecords and, for requests of other shapes, dictionaries."""
+        return list(self._items)
+
+def iter_encoded_blocks(batch: Iterable, block_size: int) -> Iterator[List[bytes]]:
+    """
+    Yields the encoded requests of a draft in blocks, for components that scan the JSON
+    instead of decoding it. Draft stores are read with iter_raw(), so nothing is decoded
+    and encoded again; any other sequence of requests is encoded with the shared codec.
+
+    :param batch: Draft store, or list of message dictionaries
+    :param block_size: Number of requests per block
+    :return: Iterator of lists of encoded requests, without trailing newlines
+    """
+    if hasattr(batch, "iter_raw"):
+        encoded = batch.iter_raw()
+    else:
+        dumps = get_codec().dumps
+        encoded = (dumps(request) for request in batch)
+    while True:
+        block = list(islice(encoded, block_size))
+        if not block:
+            return
+        yield block
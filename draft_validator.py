@@ -0,0 +1,256 @@
+from typing import Dict, List, Optional, Sequence, Set, TYPE_CHECKING
+import json
+import re
+
+from draft_store import iter_encoded_blocks
+from json_codec import get_codec
+from token_estimator import MODEL_SPECS
+
+if TYPE_CHECKING:
+    from rich.table import Table
+
+# Number of requests validated together in one block
+VALIDATE_BLOCK_SIZE = 4096
+# Maximum number of issues listed individually in a report
+MAX_LISTED_ISSUES = 100
+# Largest request that fits in a batch on its own: the Message Batches API limit minus the '{"requests": []}' wrapper
+MAX_REQUEST_BYTES = 256 * 1024 * 1024 - len(json.dumps({"requests": []}))
+# Maximum max_tokens by model name prefix; the longest matching prefix wins
+MODEL_MAX_TOKENS: Dict[str, int] = {
+    "claude-opus-4-5": 64_000,
+    "claude-opus-4": 32_000,
+    "claude-sonnet-4": 64_000,
+    "claude-haiku-4": 64_000,
+    "claude-3-7-sonnet": 64_000,
+    "claude-3-5-sonnet": 8_192,
+    "claude-3-5-haiku": 8_192,
+    "claude-3-opus": 4_096,
+    "claude-3-sonnet": 4_096,
+    "claude-3-haiku": 4_096,
+}
+
+# Checks that make the API reject a request or the whole batch, and checks that only warn
+ERROR_CHECKS = ["malformed", "invalid_custom_id", "duplicate_custom_id", "empty_content", "max_tokens", "too_large"]
+WARNING_CHECKS = ["unknown_model", "max_tokens_above_model_limit"]
+
+_CUSTOM_ID_PATTERN = re.compile(rb'^\{"custom_id":\s*"((?:[^"\\\n]|\\.)*)"')
+# The same at the start of every line of a block that starts with a newline; the literal prefix makes it fast to scan for
+_BLOCK_CUSTOM_ID_PATTERN = re.compile(rb'\n\{"custom_id":\s*"((?:[^"\\\n]|\\.)*)"')
+_MODEL_PATTERN = re.compile(rb'"model":\s*"([^"]*)"')
+_MAX_TOKENS_PATTERN = re.compile(rb'"max_tokens":\s*(-?\d+)')
+# Empty or whitespace-only text, or no messages or content blocks at all
+_EMPTY_PATTERN = re.compile(rb'"(?:content|text)":\s*"(?:\s|\\[nrt])*"|"(?:content|messages)":\s*\[\]')
+_VALID_ID = re.compile(rb'[A-Za-z0-9_-]{1,64}')
+# A whole block of valid custom_ids joined by newlines
+_VALID_ID_BLOCK = re.compile(rb'(?:[A-Za-z0-9_-]{1,64}\n)*[A-Za-z0-9_-]{1,64}')
+
+class DraftValidator:
+    """
+    Checks a draft locally for problems that would make the API reject it, before anything is uploaded.
+
+    One pass over the draft checks for duplicate custom_ids, custom_ids that do not match
+    the API's format (1 to 64 letters, digits, '-' or '_'), empty prompts, unknown models,
+    max_tokens out of range and requests too large to fit in a batch. Like TokenEstimator,
+    it works on the encoded JSON in blocks of VALIDATE_BLOCK_SIZE requests: custom_id, model
+    and max_tokens of the whole block are extracted with one pattern scan each, all the
+    custom_ids of the block are checked with a single match, duplicates are found with set
+    operations and the remaining checks compare the block's minimum and maximum, so a valid
+    block costs a handful of C-level calls. Only blocks in which a check fails are examined
+    request by request, and requests the patterns cannot read are decoded. Memory is the set
+    of custom_ids plus one block, so drafts of millions of requests validate in linear time.
+    """
+    def __init__(self, max_request_bytes: int = MAX_REQUEST_BYTES,
+                 model_max_tokens: Optional[Dict[str, int]] = None, known_models: Optional[Sequence[str]] = None):
+        """
+        :param max_request_bytes: Largest allowed encoded request
+        :param model_max_tokens: Maximum max_tokens by model name prefix (default: MODEL_MAX_TOKENS)
+        :param known_models: Model name prefixes that are not reported as unknown
+                             (default: those of MODEL_SPECS and model_max_tokens)
+        """
+        self.max_request_bytes = max_request_bytes
+        self.model_max_tokens = model_max_tokens if model_max_tokens is not None else MODEL_MAX_TOKENS
+        self.known_models = list(known_models) if known_models is not None else \
+            sorted(set(MODEL_SPECS) | set(self.model_max_tokens))
+        self._model_cache: Dict[str, Optional[int]] = {}
+
+    def _model_limit(self, model: str) -> Optional[int]:
+        """Returns the max_tokens limit of a model, 0 for a known model without one, or None for an unknown model."""
+        if model not in self._model_cache:
+            if not any(model.startswith(prefix) for prefix in self.known_models):
+                self._model_cache[model] = None
+            else:
+                prefixes = [prefix for prefix in self.model_max_tokens if model.startswith(prefix)]
+                self._model_cache[model] = self.model_max_tokens[max(prefixes, key=len)] if prefixes else 0
+        return self._model_cache[model]
+
+    def validate(self, batch: Sequence[Dict]) -> Dict:
+        """
+        Validates a draft.
+
+        :param batch: List of message dictionaries or a spooled draft
+        :return: Dictionary with 'requests', 'bytes' (encoded size of all requests), 'valid'
+                 (False if there are errors), 'errors' and 'warnings' (number of issues by
+                 check) and 'issues' (up to MAX_LISTED_ISSUES issues in draft order, each with
+                 'index', 'custom_id', 'check', 'severity' and 'message')
+        """
+        report = {"requests": 0, "bytes": 0, "valid": True, "errors": {}, "warnings": {}, "issues": []}
+        seen: Set[bytes] = set()
+        for lines in iter_encoded_blocks(batch, VALIDATE_BLOCK_SIZE):
+            self.validate_block(lines, report, seen)
+        report["issues"].sort(key=lambda issue: issue["index"])
+        report["valid"] = not report["errors"]
+        return report
+
+    def validate_block(self, lines: List[bytes], report: Dict, seen: Set[bytes]) -> None:
+        """
+        Validates a block of requests and adds its issues to a report.
+
+        :param lines: Encoded JSON of the requests
+        :param report: Report being built by validate()
+        :param seen: Escaped custom_ids of the requests before this block; the block's are added
+        """
+        start = report["requests"]
+        report["requests"] += len(lines)
+        sizes = list(map(len, lines))
+        report["bytes"] += sum(sizes)
+        if max(sizes) > self.max_request_bytes:
+            for i, size in enumerate(sizes):
+                if size > self.max_request_bytes:
+                    self._add(report, start + i, lines[i], "too_large",
+                              f"{size:,} bytes is more than the {self.max_request_bytes:,} bytes a batch can hold")
+
+        # Joined with a leading newline, so every request starts after one
+        joined = b"\n".join([b""] + lines)
+        ids = _BLOCK_CUSTOM_ID_PATTERN.findall(joined)
+        models = _MODEL_PATTERN.findall(joined)
+        max_tokens = _MAX_TOKENS_PATTERN.findall(joined)
+        if len(ids) == len(models) == len(max_tokens) == len(lines):
+            empty = self._has_empty(joined)
+        else:
+            # Not exactly one custom_id first, one model and one max_tokens per request: decode the block
+            ids, models, max_tokens, empty = self._decode_block(lines, start, report)
+
+        self._check_ids(lines, start, ids, report, seen)
+        if empty:
+            for i, line in enumerate(lines):
+                if ids[i] is not None and self._has_empty(line):
+                    self._add(report, start + i, line, "empty_content", "Empty prompt or no messages")
+        self._check_models(lines, start, models, max_tokens, report)
+
+    def _decode_block(self, lines: List[bytes], start: int, report: Dict):
+        """
+        Extracts custom_id, model and max_tokens by decoding every request of a block.
+        Requests that cannot be read are reported as malformed and get None for all three.
+        """
+        ids: List[Optional[bytes]] = []
+        models: List[Optional[bytes]] = []
+        max_tokens: List[Optional[bytes]] = []
+        codec = get_codec()
+        for i, line in enumerate(lines):
+            try:
+                request = codec.loads(line)
+                params = request["params"]
+                custom_id = request["custom_id"]
+                model = params["model"]
+                limit = params["max_tokens"]
+                if not isinstance(model, str) or not isinstance(limit, int) or not isinstance(params["messages"], list):
+                    raise TypeError("wrong field types")
+            except Exception as e:
+                self._add(report, start + i, line, "malformed",
+                          f"Not a request with custom_id, params.model, params.max_tokens and params.messages ({e})")
+                ids.append(None)
+                models.append(None)
+                max_tokens.append(None)
+                continue
+            # The escaped form, as the patterns extract it, so custom_ids compare equal across blocks
+            ids.append(codec.dumps(custom_id)[1:-1] if isinstance(custom_id, str) else b"")
+            models.append(model.encode("utf-8"))
+            max_tokens.append(str(limit).encode("ascii"))
+        return ids, models, max_tokens, self._has_empty(b"\n".join(lines))
+
+    @staticmethod
+    def _has_empty(encoded: bytes) -> bool:
+        """Returns whether encoded requests contain an empty prompt, content block or message list."""
+        return _EMPTY_PATTERN.search(encoded) is not None
+
+    def _check_ids(self, lines: List[bytes], start: int, ids: List[Optional[bytes]], report: Dict,
+                   seen: Set[bytes]) -> None:
+        """Reports custom_ids with an invalid format and custom_ids used before."""
+        present = [custom_id for custom_id in ids if custom_id is not None]
+        if len(present) != len(ids) or not _VALID_ID_BLOCK.fullmatch(b"\n".join(present)):
+            for i, custom_id in enumerate(ids):
+                if custom_id is not None and not _VALID_ID.fullmatch(custom_id):
+                    self._add(report, start + i, lines[i], "invalid_custom_id",
+                              "custom_id must be 1 to 64 letters, digits, '-' or '_'")
+
+        block_ids = set(present)
+        if len(block_ids) == len(present) and seen.isdisjoint(block_ids):
+            seen |= block_ids
+            return
+        for i, custom_id in enumerate(ids):
+            if custom_id is None:
+                continue
+            if custom_id in seen:
+                self._add(report, start + i, lines[i], "duplicate_custom_id", "custom_id is used by an earlier request")
+            else:
+                seen.add(custom_id)
+
+    def _check_models(self, lines: List[bytes], start: int, models: List[Optional[bytes]],
+                      max_tokens: List[Optional[bytes]], report: Dict) -> None:
+        """Reports unknown models and max_tokens below 1 or above the model's limit."""
+        limits = {model: self._model_limit(model.decode("utf-8")) for model in set(models) if model is not None}
+        values = [int(value) if value is not None else None for value in max_tokens]
+        present = [value for value in values if value is not None]
+        if (present and None not in limits.values() and min(present) >= 1
+                and max(present) <= min((limit for limit in limits.values() if limit), default=max(present))):
+            # The usual case: known models and every max_tokens within the smallest of their limits
+            return
+        for i, (model, value) in enumerate(zip(models, values)):
+            if model is None:
+                continue
+            limit = limits[model]
+            if limit is None:
+                self._add(report, start + i, lines[i], "unknown_model", f"Unknown model {model.decode('utf-8')}")
+            if value < 1:
+                self._add(report, start + i, lines[i], "max_tokens", f"max_tokens must be at least 1, not {value}")
+            elif limit and value > limit:
+                self._add(report, start + i, lines[i], "max_tokens_above_model_limit",
+                          f"max_tokens {value:,} is above the {limit:,} of {model.decode('utf-8')}")
+
+    @staticmethod
+    def _add(report: Dict, index: int, line: bytes, check: str, message: str) -> None:
+        """Counts an issue and lists it while fewer than MAX_LISTED_ISSUES are listed."""
+        severity = "warning" if check in WARNING_CHECKS else "error"
+        counts = report["warnings" if severity == "warning" else "errors"]
+        counts[check] = counts.get(check, 0) + 1
+        if len(report["issues"]) < MAX_LISTED_ISSUES:
+            match = _CUSTOM_ID_PATTERN.match(line)
+            custom_id = match.group(1).decode("utf-8", "replace") if match else None
+            report["issues"].append({"index": index, "custom_id": custom_id, "check": check,
+                                     "severity": severity, "message": message})
+
+    @staticmethod
+    def format_report(report: Dict) -> "Table":
+        """
+        Returns a table with the counts of a validation report and the issues it lists.
+
+        :param report: Report as returned by validate()
+        """
+        from rich.table import Table
+
+        errors = sum(report["errors"].values())
+        warnings = sum(report["warnings"].values())
+        table = Table(title="Draft Validation")
+        table.add_column("Index", style="cyan", justify="right")
+        table.add_column("Custom ID", style="green")
+        table.add_column("Check", style="magenta")
+        table.add_column("Problem")
+        for issue in report["issues"]:
+            style = "red" if issue["severity"] == "error" else "yellow"
+            table.add_row(str(issue["index"]), issue["custom_id"] or "-", issue["check"],
+                          f"[{style}]{issue['message']}[/{style}]")
+        counts = ", ".join(f"{count:,} {check}" for check, count in {**report["errors"], **report["warnings"]}.items())
+        listed = f"; the first {len(report['issues'])} are listed" if errors + warnings > len(report["issues"]) else ""
+        table.caption = (f"{report['requests']:,} requests, {report['bytes'] / 1e6:.1f} MB: "
+                         f"{errors:,} errors, {warnings:,} warnings" + (f" ({counts}){listed}" if counts else ""))
+        return table
@@ -0,0 +1,112 @@
+from typing import Dict, Optional, Union
+import json
+import os
+
+# Environment variable that selects the codec: 'auto' (default), 'json', 'orjson' or 'msgspec'
+CODEC_ENV = "BATCHFORGE_JSON_CODEC"
+# Codecs tried in this order by 'auto'; the standard library is always available
+AUTO_ORDER = ["orjson", "msgspec", "json"]
+
+class JSONCodec:
+    """
+    Encodes and decodes JSON with the standard library.
+
+    This is the reference codec: its output is exactly what json.dumps() produces, with
+    ', ' and ': ' separators and non-ASCII characters escaped. dumps and loads are plain
+    attributes, so hot loops can bind them to locals once and call them without any
+    indirection. Every codec accepts bytes or str in loads and returns UTF-8 bytes from
+    dumps.
+    """
+    name = "json"
+    # Whether dumps leaves out the spaces after ',' and ':'
+    compact = False
+    # Exceptions loads raises for invalid JSON
+    errors = (ValueError,)
+
+    def __init__(self):
+        encoder = json.JSONEncoder().encode
+        self.dumps = lambda obj: encoder(obj).encode("utf-8")
+        self.loads = json.loads
+
+class OrjsonCodec(JSONCodec):
+    """Encodes and decodes JSON with orjson, which writes compact UTF-8 without escaping non-ASCII."""
+    name = "orjson"
+    compact = True
+
+    def __init__(self):
+        import orjson
+
+        self.dumps = orjson.dumps
+        self.loads = orjson.loads
+
+class MsgspecCodec(JSONCodec):
+    """Encodes and decodes JSON with msgspec, which writes compact UTF-8 without escaping non-ASCII."""
+    name = "msgspec"
+    compact = True
+
+    def __init__(self):
+        import msgspec
+
+        self.dumps = msgspec.json.Encoder().encode
+        self.loads = msgspec.json.Decoder().decode
+        self.errors = (ValueError, msgspec.DecodeError)
+
+CODECS = {"json": JSONCodec, "orjson": OrjsonCodec, "msgspec": MsgspecCodec}
+
+def available_codecs() -> Dict[str, bool]:
+    """Returns whether each codec in CODECS can be loaded in this environment."""
+    available = {}
+    for name, codec_class in CODECS.items():
+        try:
+            codec_class()
+            available[name] = True
+        except ImportError:
+            available[name] = False
+    return available
+
+def load_codec(name: str = "auto") -> JSONCodec:
+    """
+    Creates a codec by name.
+
+    :param name: 'json', 'orjson', 'msgspec', or 'auto' for the first installed one in AUTO_ORDER
+    :return: The codec
+    :raises ValueError: If the name is unknown
+    :raises ImportError: If the library of the named codec is not installed
+    """
+    if name == "auto":
+        for candidate in AUTO_ORDER:
+            try:
+                return CODECS[candidate]()
+            except ImportError:
+                pass
+    if name not in CODECS:
+        raise ValueError(f"Unknown JSON codec '{name}', expected one of: auto, {', '.join(CODECS)}")
+    return CODECS[name]()
+
+_codec: Optional[JSONCodec] = None
+
+def get_codec() -> JSONCodec:
+    """
+    Returns the codec shared by all components. On first use it is loaded from the
+    BATCHFORGE_JSON_CODEC environment variable, which defaults to 'auto'; a codec whose
+    library is missing falls back to the standard library.
+    """
+    global _codec
+    if _codec is None:
+        try:
+            _codec = load_codec(os.getenv(CODEC_ENV, "auto").strip().lower() or "auto")
+        except (ImportError, ValueError):
+            _codec = JSONCodec()
+    return _codec
+
+def set_codec(codec: Union[str, JSONCodec]) -> JSONCodec:
+    """
+    Installs the codec returned by get_codec(). Components read it when they are
+    created, so this has to be called before they are constructed.
+
+    :param codec: Codec, or the name of one as accepted by load_codec()
+    :return: The installed codec
+    """
+    global _codec
+    _codec = load_codec(codec) if isinstance(codec, str) else codec
+    return _codec
@@ -1,18 +1,111 @@
 import os
 import sys
-from dotenv import load_dotenv
-from rich.console import Console
-from rich.panel import Panel
+from contextlib import redirect_stdout
 
-from api_client import APIClient
-from batch_drafter import BatchDrafter
-from batch_submitter import BatchSubmitter
-from batch_monitor import BatchMonitor
-from batch_manager import BatchManager
-from user_interface import UserInterface
+# Only what is needed to parse the command line is imported up front; rich, requests and
+# the components are imported by the code path that uses them, so short headless commands
+# (and --help) do not pay for modules they never touch.
+from cli import HeadlessCLI, build_parser, EXIT_ERROR
+from storage import get_data_path
+
+def start_metrics(args):
+    """
+    Enables metrics if --metrics-port or --metrics-file was given. Has to run before the
+    components are created, since they pick up the metrics registry in their constructors.
+
+    :param args: Parsed command line arguments
+    :return: The Metrics registry, or None if metrics stay disabled
+    """
+    if args.metrics_port is None and not args.metrics_file:
+        return None
+    from metrics import Metrics, set_metrics
+
+    metrics = Metrics()
+    set_metrics(metrics)
+    if args.metrics_port is not None:
+        port = metrics.serve(args.metrics_port)
+        print(f"Serving metrics at http://127.0.0.1:{port}/metrics", file=sys.stderr)
+    if args.metrics_file:
+        metrics.start_snapshots(args.metrics_file, args.metrics_interval)
+    return metrics
+
+def run_headless(args) -> int:
+    """
+    Runs a single command without the interactive menu.
+
+    JSON results go to stdout; everything the components print is redirected to stderr,
+    so stdout can be piped straight into other tools.
+
+    :param args: Parsed command line arguments
+    :return: Exit code
+    """
+    from batch_drafter import BatchDrafter
+
+    out = sys.stdout
+    with redirect_stdout(sys.stderr):
+        batch_drafter = BatchDrafter(spool_path=args.draft or get_data_path("draft.jsonl"))
+        # Importing and validating the draft are local, so they need neither the API client nor a key
+        if args.command in ["import", "validate"]:
+            return HeadlessCLI(batch_drafter, None, None, out).run(args)
+
+        from dotenv import load_dotenv
+
+        load_dotenv()
+        api_key = os.getenv("ANTHROPIC_API_KEY")
+        if not api_key:
+            HeadlessCLI(None, None, None, out).emit(
+                {"error": "API key not found. Please set the ANTHROPIC_API_KEY environment variable."})
+            return EXIT_ERROR
+
+        from api_client import APIClient
+        from batch_group import BatchGroupRegistry
+        from prompt_cache import PromptCache
+        from batch_submitter import BatchSubmitter
+        from batch_manager import BatchManager
+
+        api_client = APIClient(api_key, base_url=args.base_url)
+        batch_groups = BatchGroupRegistry()
+        prompt_cache = None if args.no_cache else PromptCache()
+        batch_submitter = BatchSubmitter(api_client, batch_groups, prompt_cache=prompt_cache)
+        batch_manager = BatchManager(api_client, batch_groups, prompt_cache=prompt_cache)
+        # Registers batch groups from the journal so group IDs resolve in this process
+        batch_submitter.recover()
+        try:
+            return HeadlessCLI(batch_drafter, batch_submitter, batch_manager, out).run(args)
+        finally:
+            api_client.close()
 
 def main():
-    console = Console()
+    args = build_parser().parse_args()
+    if args.profile is None:
+        run(args)
+        return
+
+    from profiling import ProfileSession
+
+    with ProfileSession(args.profile or None, label=args.command or "interactive", sort=args.profile_sort,
+                        memory_frames=args.profile_frames):
+        run(args)
+
+def run(args):
+    """
+    Runs the command given on the command line, or the interactive menu without one.
+
+    :param args: Parsed command line arguments
+    """
+    metrics = start_metrics(args)
+    if args.command:
+        try:
+            sys.exit(run_headless(args))
+        finally:
+            if metrics is not None:
+                metrics.stop()
+
+    from dotenv import load_dotenv
+    from rich.panel import Panel
+    from app_console import get_console
+
+    console = get_console()
 
     try:
         # Load environment variables
@@ -25,12 +118,29 @@ def main():
                                 title="Error", style="bold red"))
             sys.exit(1)
 
+        from api_client import APIClient
+        from batch_group import BatchGroupRegistry
+        from prompt_cache import PromptCache
+        from batch_drafter import BatchDrafter
+        from batch_submitter import BatchSubmitter
+        from batch_monitor import BatchMonitor
+        from batch_manager import BatchManager
+        from user_interface import UserInterface
+
         # Initialize components
-        api_client = APIClient(api_key)
-        batch_drafter = BatchDrafter()  # Now this works without config_manager
-        batch_submitter = BatchSubmitter(api_client)
-        batch_monitor = BatchMonitor(api_client)
-        batch_manager = BatchManager(api_client)
+        api_client = APIClient(api_key, base_url=args.base_url)
+        batch_groups = BatchGroupRegistry()
+        batch_drafter = BatchDrafter(spool_path=args.draft or get_data_path("draft.jsonl"))
+        prompt_cache = None if args.no_cache else PromptCache()
+        batch_submitter = BatchSubmitter(api_client, batch_groups, prompt_cache=prompt_cache)
+        batch_monitor = BatchMonitor(api_client, batch_groups)
+        batch_manager = BatchManager(api_client, batch_groups, prompt_cache=prompt_cache)
+
+        # Pick up submissions that were interrupted before they reached the monitor
+        for batch_id in batch_submitter.recover():
+            batch_monitor.add_batch(batch_id)
+            batch_submitter.acknowledge(batch_id)
+            console.print(f"[yellow]Recovered submitted batch {batch_id}, now monitoring it.[/yellow]")
 
         # Create and run the user interface
         ui = UserInterface(batch_drafter, batch_submitter, batch_monitor, batch_manager)
@@ -47,6 +157,8 @@ def main():
         console.print(f"[bold red]An unexpected error occurred: {str(e)}[/bold red]")
         console.print_exception(show_locals=True)
     finally:
+        if metrics is not None:
+            metrics.stop()
         console.print("[bold blue]Thank you for using the Message Batch Terminal App![/bold blue]")
 
 if __name__ == "__main__":
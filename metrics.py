@@ -0,0 +1,304 @@
+from typing import Callable, Dict, List, Optional, Tuple
+from bisect import bisect_left
+import json
+import os
+import tempfile
+import threading
+import time
+
+# Upper bounds in seconds of the latency histogram buckets
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+class _NullTimer:
+    """A reusable context manager that does nothing."""
+    def __enter__(self) -> "_NullTimer":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        pass
+
+_NULL_TIMER = _NullTimer()
+
+class NullMetrics:
+    """
+    The metrics registry used while metrics are disabled.
+
+    Every method returns immediately without recording anything and timer() hands out
+    one shared do-nothing context manager, so instrumented code costs one method call
+    per measurement. Code that has to compute a value only to record it should check
+    'enabled' first.
+    """
+    enabled = False
+
+    def increment(self, name: str, amount: float = 1.0, **labels: str) -> None:
+        pass
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        pass
+
+    def timer(self, name: str, **labels: str) -> _NullTimer:
+        return _NULL_TIMER
+
+    def add_collector(self, collector: Callable[[], Dict[str, float]]) -> None:
+        pass
+
+class _Timer:
+    """Records the time spent inside a 'with' block in a histogram."""
+    __slots__ = ("metrics", "name", "labels", "start")
+
+    def __init__(self, metrics: "Metrics", name: str, labels: Dict[str, str]):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self) -> "_Timer":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.metrics.observe(self.name, time.perf_counter() - self.start, **self.labels)
+
+class Metrics(NullMetrics):
+    """
+    An in-process metrics registry with counters, histograms and collected gauges.
+
+    Counters and histograms are keyed by name and labels. Histograms use cumulative
+    buckets like Prometheus. Gauges are not stored: collectors registered with
+    add_collector() are called when the metrics are exported, which suits values that
+    already exist elsewhere, such as connection pool statistics. The registry can
+    be exported in the Prometheus text format, over HTTP with serve(), or as JSON,
+    written to a file now and then with start_snapshots().
+    """
+    enabled = True
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        """
+        :param buckets: Upper bounds of the histogram buckets, in increasing order
+        """
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        # Per histogram: bucket counts (the last one is +Inf), sum and count
+        self._histograms: Dict[Tuple[str, Labels], List] = {}
+        self._collectors: List[Callable[[], Dict[str, float]]] = []
+        self._stop = threading.Event()
+
+    @staticmethod
+    def _key(name: str, labels: Dict[str, str]) -> Tuple[str, Labels]:
+        return name, tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    def increment(self, name: str, amount: float = 1.0, **labels: str) -> None:
+        """
+        Adds to a counter.
+
+        :param name: Metric name, e.g. 'api_requests_total'
+        :param amount: Amount to add
+        :param labels: Label values
+        """
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + amount
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        """
+        Records a value in a histogram.
+
+        :param name: Metric name, e.g. 'api_request_seconds'
+        :param value: Observed value
+        :param labels: Label values
+        """
+        key = self._key(name, labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            histogram[0][index] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    def timer(self, name: str, **labels: str) -> _Timer:
+        """
+        Returns a context manager that records the time spent in its block in a histogram.
+
+        :param name: Metric name, e.g. 'stage_seconds'
+        :param labels: Label values
+        """
+        return _Timer(self, name, labels)
+
+    def add_collector(self, collector: Callable[[], Dict[str, float]]) -> None:
+        """
+        Registers a function that returns gauge values by metric name when metrics are exported.
+
+        :param collector: Function returning a dictionary of gauge values
+        """
+        with self._lock:
+            self._collectors.append(collector)
+
+    def _collect(self) -> Dict[str, float]:
+        gauges: Dict[str, float] = {}
+        for collector in list(self._collectors):
+            try:
+                gauges.update(collector())
+            except Exception:
+                # A failing collector must not break the export of everything else
+                pass
+        return gauges
+
+    def snapshot(self) -> Dict:
+        """
+        Returns all metrics as a JSON-serializable dictionary.
+
+        :return: Dictionary with 'time', 'counters' and 'histograms' (lists of entries with
+                 'name', 'labels' and their values) and 'gauges' (values by name)
+        """
+        with self._lock:
+            counters = [{"name": name, "labels": dict(labels), "value": value}
+                        for (name, labels), value in sorted(self._counters.items())]
+            histograms = []
+            for (name, labels), (counts, total, count) in sorted(self._histograms.items()):
+                cumulative = 0
+                buckets = {}
+                for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += bucket_count
+                    buckets["+Inf" if bound == float("inf") else repr(bound)] = cumulative
+                histograms.append({"name": name, "labels": dict(labels), "buckets": buckets,
+                                   "sum": total, "count": count})
+        return {"time": time.time(), "counters": counters, "histograms": histograms, "gauges": self._collect()}
+
+    @staticmethod
+    def _format_labels(labels: Dict[str, str], extra: Optional[Tuple[str, str]] = None) -> str:
+        items = list(labels.items()) + ([extra] if extra else [])
+        if not items:
+            return ""
+        escaped = (key + '="' + value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+                   for key, value in items)
+        return "{" + ",".join(escaped) + "}"
+
+    def to_prometheus(self) -> str:
+        """Returns all metrics in the Prometheus text exposition format."""
+        snapshot = self.snapshot()
+        lines: List[str] = []
+        typed = set()
+        for counter in snapshot["counters"]:
+            if counter["name"] not in typed:
+                lines.append(f"# TYPE {counter['name']} counter")
+                typed.add(counter["name"])
+            lines.append(f"{counter['name']}{self._format_labels(counter['labels'])} {counter['value']}")
+        for histogram in snapshot["histograms"]:
+            name = histogram["name"]
+            if name not in typed:
+                lines.append(f"# TYPE {name} histogram")
+                typed.add(name)
+            for bound, count in histogram["buckets"].items():
+                lines.append(f"{name}_bucket{self._format_labels(histogram['labels'], ('le', bound))} {count}")
+            lines.append(f"{name}_sum{self._format_labels(histogram['labels'])} {histogram['sum']}")
+            lines.append(f"{name}_count{self._format_labels(histogram['labels'])} {histogram['count']}")
+        for name, value in sorted(snapshot["gauges"].items()):
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def write_snapshot(self, path: str) -> None:
+        """
+        Atomically writes a JSON snapshot of all metrics to a file.
+
+        :param path: Path of the JSON file
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, temp_path = tempfile.mkstemp(prefix=".metrics.", suffix=".tmp", dir=directory)
+        try:
+            with os.fdopen(fd, "w") as file:
+                json.dump(self.snapshot(), file)
+            os.replace(temp_path, path)
+        except BaseException:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+
+    def start_snapshots(self, path: str, interval: float = 15.0) -> None:
+        """
+        Writes a JSON snapshot to a file every interval seconds on a background thread,
+        and once more when stop() is called.
+
+        :param path: Path of the JSON file
+        :param interval: Seconds between two snapshots
+        """
+        def write() -> None:
+            try:
+                self.write_snapshot(path)
+            except OSError:
+                # Keep going; the next snapshot may succeed once the disk or directory is back
+                pass
+
+        def run() -> None:
+            while not self._stop.wait(interval):
+                write()
+            write()
+
+        self._snapshot_thread = threading.Thread(target=run, daemon=True)
+        self._snapshot_thread.start()
+
+    def serve(self, port: int, host: str = "127.0.0.1") -> int:
+        """
+        Serves the metrics in the Prometheus text format at /metrics on a background thread.
+
+        :param port: Port to listen on (0 picks a free port)
+        :param host: Interface to listen on
+        :return: The port the server listens on
+        """
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        metrics = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.to_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("content-type", "text/plain; version=0.0.4")
+                self.send_header("content-length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self._server = ThreadingHTTPServer((host, port), MetricsHandler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self._server.server_address[1]
+
+    def stop(self) -> None:
+        """Stops the HTTP endpoint and writes the final snapshot, if either was started."""
+        self._stop.set()
+        if getattr(self, "_snapshot_thread", None) is not None:
+            self._snapshot_thread.join()
+        if getattr(self, "_server", None) is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+_metrics: NullMetrics = NullMetrics()
+
+def get_metrics() -> NullMetrics:
+    """
+    Returns the metrics registry shared by all components: a NullMetrics that records
+    nothing unless set_metrics() installed a Metrics registry.
+    """
+    return _metrics
+
+def set_metrics(metrics: NullMetrics) -> None:
+    """
+    Installs the metrics registry returned by get_metrics(). Components read it when
+    they are created, so this has to be called before they are constructed.
+
+    :param metrics: Metrics to record into, or NullMetrics to disable recording
+    """
+    global _metrics
+    _metrics = metrics
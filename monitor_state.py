@@ -0,0 +1,64 @@
+from typing import Dict, Optional
+import json
+import os
+import tempfile
+
+from storage import get_data_path
+
+class MonitorStateStore:
+    """
+    Persists the state of the batch monitor in a small JSON file.
+
+    The file holds one entry per monitored batch (last status, last request counts,
+    time of the last poll and the ETag of the last status response), so a restarted
+    monitor knows what it was watching without asking the API. Every save writes a
+    temporary file in the same directory and renames it over the old one, so the file
+    is always either the previous or the new state, never a partial write.
+    """
+    VERSION = 1
+
+    def __init__(self, path: Optional[str] = None):
+        """
+        :param path: Path of the state file (default: 'monitor_state.json' in the data directory)
+        """
+        self.path = path or get_data_path("monitor_state.json")
+
+    def load(self) -> Dict[str, Dict]:
+        """
+        Reads the saved state.
+
+        :return: Dictionary of monitor entries by batch ID; empty if nothing was saved
+                 or the file cannot be read
+        """
+        try:
+            with open(self.path, "r") as file:
+                state = json.load(file)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError):
+            # A damaged state file only costs a re-poll, so start over instead of failing
+            return {}
+        if not isinstance(state, dict) or state.get("version") != self.VERSION:
+            return {}
+        return state.get("batches", {})
+
+    def save(self, batches: Dict[str, Dict]) -> None:
+        """
+        Atomically replaces the saved state.
+
+        :param batches: Dictionary of monitor entries by batch ID
+        """
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, temp_path = tempfile.mkstemp(prefix=".monitor_state.", suffix=".tmp", dir=directory)
+        try:
+            with os.fdopen(fd, "w") as file:
+                json.dump({"version": self.VERSION, "batches": batches}, file)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(temp_path, self.path)
+        except BaseException:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
@@ -0,0 +1,148 @@
+from typing import Dict, List, Optional
+import heapq
+import itertools
+import time
+
+TERMINAL_STATUSES = ["ended", "canceled"]
+
+class PollScheduler:
+    """
+    Decides when each batch should be polled next.
+
+    Batches are kept in a priority queue ordered by their next poll time. Every
+    status response is fed back through record(): the poll interval of a batch
+    backs off exponentially while its request_counts do not change, resets when
+    progress is seen, stays at the minimum once the batch is nearly complete, and
+    the batch is dropped as soon as it reaches a terminal status.
+    """
+    def __init__(self, min_interval: float = 5.0, max_interval: float = 300.0,
+                 backoff_factor: float = 2.0, near_completion_ratio: float = 0.9):
+        """
+        :param min_interval: Shortest time between two polls of a batch, in seconds
+        :param max_interval: Longest time between two polls of a batch, in seconds
+        :param backoff_factor: Factor the interval grows by after a poll without progress
+        :param near_completion_ratio: Fraction of finished requests from which a batch is
+                                      polled at the minimum interval
+        """
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff_factor = backoff_factor
+        self.near_completion_ratio = near_completion_ratio
+        self._queue = []
+        self._counter = itertools.count()
+        self._state: Dict[str, Dict] = {}
+
+    def __len__(self) -> int:
+        return len(self._state)
+
+    def __contains__(self, batch_id: str) -> bool:
+        return batch_id in self._state
+
+    def add(self, batch_id: str, delay: float = 0.0) -> None:
+        """
+        Starts scheduling a batch.
+
+        :param batch_id: ID of the batch
+        :param delay: Seconds until the first poll
+        """
+        if batch_id not in self._state:
+            self._state[batch_id] = {"interval": self.min_interval, "request_counts": None, "due": 0.0}
+            self._schedule(batch_id, delay)
+
+    def remove(self, batch_id: str) -> None:
+        """
+        Stops scheduling a batch.
+
+        :param batch_id: ID of the batch
+        """
+        self._state.pop(batch_id, None)
+
+    def _schedule(self, batch_id: str, delay: float) -> None:
+        due = time.monotonic() + delay
+        self._state[batch_id]["due"] = due
+        heapq.heappush(self._queue, (due, next(self._counter), batch_id))
+
+    def _discard_stale(self) -> None:
+        """Drops queue entries of removed or rescheduled batches."""
+        while self._queue:
+            due, _, batch_id = self._queue[0]
+            state = self._state.get(batch_id)
+            if state is not None and state["due"] == due:
+                return
+            heapq.heappop(self._queue)
+
+    def next_due_in(self) -> Optional[float]:
+        """
+        Returns the number of seconds until the next batch is due, or None if nothing is scheduled.
+        """
+        self._discard_stale()
+        if not self._queue:
+            return None
+        return max(self._queue[0][0] - time.monotonic(), 0.0)
+
+    def pop_due(self) -> List[str]:
+        """
+        Returns the IDs of all batches that are due for a poll. They stay scheduled
+        and are rescheduled when their status is passed to record().
+
+        :return: List of batch IDs
+        """
+        due_ids = []
+        now = time.monotonic()
+        while True:
+            self._discard_stale()
+            if not self._queue or self._queue[0][0] > now:
+                return due_ids
+            _, _, batch_id = heapq.heappop(self._queue)
+            self._state[batch_id]["due"] = None
+            due_ids.append(batch_id)
+
+    def wait_due(self) -> List[str]:
+        """
+        Sleeps until at least one batch is due and returns the due batch IDs.
+
+        :return: List of batch IDs, empty if nothing is scheduled
+        """
+        delay = self.next_due_in()
+        if delay is None:
+            return []
+        if delay > 0:
+            time.sleep(delay)
+        return self.pop_due()
+
+    def record(self, batch_id: str, status: Dict) -> None:
+        """
+        Feeds a status response back into the scheduler and reschedules the batch.
+
+        :param batch_id: ID of the batch
+        :param status: Status response as returned by the API
+        """
+        state = self._state.get(batch_id)
+        if state is None:
+            return
+        if status.get("processing_status") in TERMINAL_STATUSES:
+            self.remove(batch_id)
+            return
+
+        counts = status.get("request_counts", {})
+        total = sum(counts.values())
+        finished = total - counts.get("processing", 0)
+        if total and finished / total >= self.near_completion_ratio:
+            state["interval"] = self.min_interval
+        elif counts == state["request_counts"]:
+            state["interval"] = min(state["interval"] * self.backoff_factor, self.max_interval)
+        else:
+            state["interval"] = self.min_interval
+        state["request_counts"] = dict(counts)
+        self._schedule(batch_id, state["interval"])
+
+    def record_error(self, batch_id: str) -> None:
+        """
+        Reschedules a batch whose status could not be fetched, backing off like a poll without progress.
+
+        :param batch_id: ID of the batch
+        """
+        state = self._state.get(batch_id)
+        if state is not None:
+            state["interval"] = min(state["interval"] * self.backoff_factor, self.max_interval)
+            self._schedule(batch_id, state["interval"])
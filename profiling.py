@@ -0,0 +1,239 @@
+from typing import Dict, List, Optional
+import cProfile
+import io
+import json
+import os
+import platform
+import pstats
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+
+from metrics import Metrics, get_metrics, set_metrics
+from storage import get_data_path
+
+# Number of functions and allocation sites listed in the reports
+REPORT_TOP = 40
+# Sort orders accepted for the function report
+SORT_KEYS = ["cumulative", "tottime", "calls"]
+# Seconds between two checks of the traced memory for a new peak
+PEAK_SAMPLE_SECONDS = 0.5
+# Growth over the last peak snapshot that triggers a new one
+PEAK_SNAPSHOT_GROWTH = 1.1
+
+def get_version() -> Optional[str]:
+    """Returns the git commit of the source tree (with '-dirty' if it has changes), or None outside a checkout."""
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except Exception:
+        return None
+
+class ProfileSession:
+    """
+    Profiles everything run inside a 'with' block with cProfile and tracemalloc.
+
+    On exit it writes to the output directory:
+    - profile.prof: the raw cProfile statistics, for pstats, snakeviz and similar tools
+    - profile.txt: the slowest functions in the chosen sort order and the top allocation sites
+      at the largest heap seen
+    - profile.json: a summary with wall and CPU time, peak traced memory, per-stage durations
+      from the metrics registry, the top functions and allocation sites and the git commit,
+      so runs can be compared across versions with compare_profiles()
+
+    Stage durations need metrics, so a Metrics registry is installed on entry if metrics are
+    disabled. Components pick up the registry when they are created, so the session has to
+    be entered before they are constructed. The heap is sampled every PEAK_SAMPLE_SECONDS on
+    a background thread, and a tracemalloc snapshot is taken whenever it grew by 10% over the
+    last one, so the allocation sites are those of (close to) the peak rather than whatever is
+    left at the end. cProfile and tracemalloc only see this process:
+    work done by the worker processes of a multi-file import shows up as the 'parse' stage.
+    Both slow the profiled code down, tracemalloc considerably, so compare profiled runs
+    with each other rather than with unprofiled ones.
+    """
+    def __init__(self, output_dir: Optional[str] = None, label: str = "run", sort: str = "cumulative",
+                 top: int = REPORT_TOP, memory_frames: int = 1):
+        """
+        :param output_dir: Directory the reports are written to
+                           (default: profiles/<time>_<label> in the data directory)
+        :param label: Name of the profiled operation, e.g. the command
+        :param sort: Sort order of the function report, one of SORT_KEYS
+        :param top: Number of functions and allocation sites in the reports
+        :param memory_frames: Stack frames kept per allocation; more frames show callers but cost more
+        """
+        self.output_dir = output_dir or get_data_path(os.path.join("profiles", f"{time.strftime('%Y%m%d-%H%M%S')}_{label}"))
+        self.label = label
+        self.sort = sort
+        self.top = top
+        self.memory_frames = memory_frames
+        self.profiler = cProfile.Profile()
+
+    def __enter__(self) -> "ProfileSession":
+        if not get_metrics().enabled:
+            set_metrics(Metrics())
+        self._started_at = time.time()
+        self._wall_start = time.perf_counter()
+        self._cpu_start = time.process_time()
+        tracemalloc.start(self.memory_frames)
+        self._peak_snapshot: Optional[tracemalloc.Snapshot] = None
+        self._peak_size = 0
+        self._stop_sampling = threading.Event()
+        self._sampler = threading.Thread(target=self._sample_peak, daemon=True)
+        self._sampler.start()
+        self.profiler.enable()
+        return self
+
+    def _sample_peak(self) -> None:
+        """Takes a tracemalloc snapshot whenever the traced memory reaches a new peak."""
+        snapshot_size = 0
+        while not self._stop_sampling.wait(PEAK_SAMPLE_SECONDS):
+            current, _ = tracemalloc.get_traced_memory()
+            if current > snapshot_size * PEAK_SNAPSHOT_GROWTH:
+                self._peak_snapshot = tracemalloc.take_snapshot()
+                snapshot_size = current
+                self._peak_size = current
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.profiler.disable()
+        wall = time.perf_counter() - self._wall_start
+        cpu = time.process_time() - self._cpu_start
+        self._stop_sampling.set()
+        self._sampler.join()
+        current, peak = tracemalloc.get_traced_memory()
+        if self._peak_snapshot is None or current > self._peak_size:
+            self._peak_snapshot = tracemalloc.take_snapshot()
+        allocations = self._peak_snapshot
+        self._peak_snapshot = None
+        tracemalloc.stop()
+        try:
+            self.write_reports(wall, cpu, peak, allocations)
+            print(f"Profile written to {self.output_dir}", file=sys.stderr)
+        except Exception as e:
+            print(f"Could not write the profile to {self.output_dir}: {str(e)}", file=sys.stderr)
+
+    def write_reports(self, wall: float, cpu: float, peak: int, allocations: tracemalloc.Snapshot) -> Dict:
+        """
+        Writes profile.prof, profile.txt and profile.json to the output directory.
+
+        :param wall: Wall time of the session in seconds
+        :param cpu: CPU time of the session in seconds
+        :param peak: Peak traced memory in bytes
+        :param allocations: tracemalloc snapshot taken at the largest heap seen
+        :return: The summary written to profile.json
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.profiler.dump_stats(os.path.join(self.output_dir, "profile.prof"))
+
+        stream = io.StringIO()
+        stats = pstats.Stats(self.profiler, stream=stream)
+        stats.sort_stats(self.sort).print_stats(self.top)
+        # Allocations made by the profilers themselves are not interesting
+        allocations = allocations.filter_traces([tracemalloc.Filter(False, tracemalloc.__file__),
+                                                 tracemalloc.Filter(False, "<frozen importlib._bootstrap*>")])
+        sites = allocations.statistics("traceback" if self.memory_frames > 1 else "lineno")[:self.top]
+
+        stream.write(f"Top {len(sites)} allocation sites at the largest sampled heap of "
+                     f"{sum(site.size for site in allocations.statistics('filename')) / 1e6:.1f} MB "
+                     f"(peak traced memory {peak / 1e6:.1f} MB):\n\n")
+        for site in sites:
+            # Frames run from the oldest caller to the allocating line
+            frames = list(site.traceback)
+            stream.write(f"{site.size / 1e6:10.3f} MB {site.count:10d} blocks  {frames[-1]}\n")
+            for frame in reversed(frames[:-1]):
+                stream.write(f"{'':34}called from {frame}\n")
+        with open(os.path.join(self.output_dir, "profile.txt"), "w") as file:
+            file.write(stream.getvalue())
+
+        summary = {
+            "label": self.label,
+            "started_at": self._started_at,
+            "version": get_version(),
+            "python": platform.python_version(),
+            "wall_seconds": wall,
+            "cpu_seconds": cpu,
+            "peak_memory_mb": peak / 1e6,
+            "stages": self._stage_durations(),
+            "top_functions": self._top_functions(stats),
+            "top_allocations": [{"site": str(site.traceback[-1]), "size_mb": site.size / 1e6, "count": site.count}
+                                for site in sites]
+        }
+        with open(os.path.join(self.output_dir, "profile.json"), "w") as file:
+            json.dump(summary, file, indent=2)
+        return summary
+
+    @staticmethod
+    def _stage_durations() -> Dict[str, Dict]:
+        """Returns the count and total seconds of every stage recorded in the metrics registry."""
+        metrics = get_metrics()
+        if not isinstance(metrics, Metrics):
+            return {}
+        return {histogram["labels"]["stage"]: {"count": histogram["count"], "seconds": histogram["sum"]}
+                for histogram in metrics.snapshot()["histograms"] if histogram["name"] == "stage_seconds"}
+
+    def _top_functions(self, stats: pstats.Stats) -> List[Dict]:
+        """Returns the first functions of the report in its sort order."""
+        functions = []
+        for function in stats.fcn_list[:self.top]:
+            calls, primitive_calls, tottime, cumtime, _ = stats.stats[function]
+            file_name, line, name = function
+            functions.append({"function": f"{file_name}:{line}({name})", "calls": calls,
+                              "tottime": tottime, "cumtime": cumtime})
+        return functions
+
+def compare_profiles(old: Dict, new: Dict) -> List[Dict]:
+    """
+    Compares two profile.json summaries.
+
+    :param old: Summary of the earlier run
+    :param new: Summary of the later run
+    :return: One row per measure (wall and CPU time, peak memory and every stage) with
+             'measure', 'old', 'new' and 'change' (relative change, None if old is 0 or missing)
+    """
+    measures = [("wall_seconds", old.get("wall_seconds"), new.get("wall_seconds")),
+                ("cpu_seconds", old.get("cpu_seconds"), new.get("cpu_seconds")),
+                ("peak_memory_mb", old.get("peak_memory_mb"), new.get("peak_memory_mb"))]
+    for stage in sorted(set(old.get("stages", {})) | set(new.get("stages", {}))):
+        measures.append((f"stage {stage}", old.get("stages", {}).get(stage, {}).get("seconds"),
+                         new.get("stages", {}).get(stage, {}).get("seconds")))
+    return [{"measure": measure, "old": before, "new": after,
+             "change": (after - before) / before if before and after is not None else None}
+            for measure, before, after in measures]
+
+def main() -> None:
+    """Prints a comparison of two profile.json files (or the directories holding them)."""
+    import argparse
+    from rich.table import Table
+    from app_console import get_console
+
+    parser = argparse.ArgumentParser(description="Compare two profiles written by main.py --profile")
+    parser.add_argument("old", help="profile.json of the earlier run, or its directory")
+    parser.add_argument("new", help="profile.json of the later run, or its directory")
+    args = parser.parse_args()
+
+    summaries = []
+    for path in (args.old, args.new):
+        if os.path.isdir(path):
+            path = os.path.join(path, "profile.json")
+        with open(path) as file:
+            summaries.append(json.load(file))
+    old, new = summaries
+
+    table = Table(title=f"{old.get('label')} {old.get('version') or '?'} -> {new.get('label')} {new.get('version') or '?'}")
+    table.add_column("Measure", style="cyan")
+    table.add_column("Old", justify="right")
+    table.add_column("New", justify="right")
+    table.add_column("Change", justify="right")
+    for row in compare_profiles(old, new):
+        change = row["change"]
+        style = "red" if change is not None and change > 0.1 else "green" if change is not None and change < -0.1 else ""
+        table.add_row(row["measure"],
+                      f"{row['old']:.3f}" if row["old"] is not None else "-",
+                      f"{row['new']:.3f}" if row["new"] is not None else "-",
+                      f"[{style}]{change:+.1%}[/{style}]" if change is not None and style else
+                      f"{change:+.1%}" if change is not None else "-")
+    get_console().print(table)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+from typing import Dict, Iterable, Iterator, MutableSequence, Optional, Tuple
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+from json_codec import get_codec
+from storage import get_data_path
+
+class PromptCache:
+    """
+    A content-addressed cache of answered prompts.
+
+    Requests are keyed on a hash of their params (model, max_tokens, messages and any
+    other parameters). When a draft is submitted, partition() splits it into prompts that
+    still need to be sent and prompts that were already answered by an earlier batch or
+    repeat another prompt of the same draft. The hits are recorded under the submitted
+    batch ID, and once the batch's results are recorded the cached results can be
+    stitched back in by custom_id. Only succeeded results are cached for later batches;
+    the other results of a batch are kept for that batch only, so repeats of a prompt
+    within the draft get the same errored or expired result as the copy that was sent.
+    """
+    def __init__(self, db_path: Optional[str] = None):
+        """
+        :param db_path: Path of the SQLite database (default: 'prompt_cache.sqlite3' in the data directory)
+        """
+        self.db_path = db_path or get_data_path("prompt_cache.sqlite3")
+        self.codec = get_codec()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    prompt_hash TEXT PRIMARY KEY,
+                    result TEXT NOT NULL,
+                    batch_id TEXT,
+                    custom_id TEXT,
+                    created_at REAL
+                )""")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS pending (
+                    batch_id TEXT NOT NULL,
+                    custom_id TEXT NOT NULL,
+                    prompt_hash TEXT NOT NULL,
+                    PRIMARY KEY (batch_id, custom_id)
+                ) WITHOUT ROWID""")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS unanswered (
+                    batch_id TEXT NOT NULL,
+                    prompt_hash TEXT NOT NULL,
+                    result TEXT NOT NULL,
+                    PRIMARY KEY (batch_id, prompt_hash)
+                ) WITHOUT ROWID""")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS cached_hits (
+                    batch_id TEXT NOT NULL,
+                    custom_id TEXT NOT NULL,
+                    prompt_hash TEXT NOT NULL,
+                    PRIMARY KEY (batch_id, custom_id)
+                ) WITHOUT ROWID""")
+
+    def close(self) -> None:
+        """Closes the cache database."""
+        self._conn.close()
+
+    @staticmethod
+    def prompt_hash(request: Dict) -> str:
+        """
+        Returns the cache key of a request.
+
+        :param request: Request dictionary with 'custom_id' and 'params'
+        :return: Hex digest identifying the request's params
+        """
+        # Hashed with the standard library rather than the shared codec: the key needs sorted
+        # keys, and has to stay the same whichever codec is installed
+        canonical = json.dumps(request.get("params", {}), sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def partition(self, batch: Iterable[Dict], misses: MutableSequence[Dict]) -> Tuple[Dict[str, str], Dict]:
+        """
+        Splits a draft into requests that must be sent and requests that can be answered from the cache.
+
+        The first request for each distinct prompt that has no cached response is appended to
+        `misses`; every other request is a hit, answered either by an earlier batch or by the
+        result of the identical request in this draft.
+
+        :param batch: Requests of the draft
+        :param misses: Sequence the requests that must be sent are appended to
+        :return: Tuple of (custom_id -> prompt hash for every hit, statistics dictionary)
+        """
+        hits: Dict[str, str] = {}
+        sent = set()
+        stats = {"requests": 0, "hits": 0, "misses": 0, "bytes_saved": 0}
+        dumps = self.codec.dumps
+        pending = []
+        for request in batch:
+            stats["requests"] += 1
+            key = self.prompt_hash(request)
+            if key in sent or self._has_response(key):
+                hits[request["custom_id"]] = key
+                stats["hits"] += 1
+                stats["bytes_saved"] += len(dumps(request))
+            else:
+                sent.add(key)
+                stats["misses"] += 1
+                pending.append(request)
+                if len(pending) >= 1000:
+                    misses.extend(pending)
+                    pending = []
+        misses.extend(pending)
+        stats["hit_rate"] = stats["hits"] / stats["requests"] if stats["requests"] else 0.0
+        return hits, stats
+
+    def _has_response(self, prompt_hash: str) -> bool:
+        with self._lock:
+            row = self._conn.execute("SELECT 1 FROM responses WHERE prompt_hash = ?", (prompt_hash,)).fetchone()
+        return row is not None
+
+    def record_submission(self, batch_id: str, requests: Iterable[Dict], hits: Dict[str, str]) -> None:
+        """
+        Records which prompts were sent in a batch and which requests were answered from the cache.
+
+        :param batch_id: ID of the submitted batch (or batch group)
+        :param requests: The requests that were sent
+        :param hits: custom_id -> prompt hash of the requests answered from the cache
+        """
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO pending VALUES (?, ?, ?)",
+                                   ((batch_id, request["custom_id"], self.prompt_hash(request)) for request in requests))
+            self._conn.executemany("INSERT OR REPLACE INTO cached_hits VALUES (?, ?, ?)",
+                                   ((batch_id, custom_id, key) for custom_id, key in hits.items()))
+
+    def has_pending(self, batch_id: str) -> bool:
+        """
+        Returns whether results of a batch still have to be recorded.
+
+        :param batch_id: ID of the batch (or batch group)
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT 1 FROM pending WHERE batch_id = ? LIMIT 1", (batch_id,)).fetchone()
+        return row is not None
+
+    def has_hits(self, batch_id: str) -> bool:
+        """
+        Returns whether any requests of a batch were answered from the cache.
+
+        :param batch_id: ID of the batch (or batch group)
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT 1 FROM cached_hits WHERE batch_id = ? LIMIT 1", (batch_id,)).fetchone()
+        return row is not None
+
+    def record_results(self, batch_id: str, results: Iterable[Dict]) -> int:
+        """
+        Caches the succeeded results of a batch under the prompt hashes recorded at submission.
+        Other results are kept for the repeats of their prompt within the same batch.
+
+        :param batch_id: ID of the batch (or batch group)
+        :param results: Result dictionaries of the batch
+        :return: Number of succeeded results cached
+        """
+        with self._lock:
+            hashes = dict(self._conn.execute("SELECT custom_id, prompt_hash FROM pending WHERE batch_id = ?",
+                                             (batch_id,)).fetchall())
+        rows = []
+        unanswered = []
+        now = time.time()
+        dumps = self.codec.dumps
+        for result in results:
+            body = result.get("result") or {}
+            key = hashes.get(result.get("custom_id"))
+            if key is None:
+                continue
+            if body.get("type") == "succeeded":
+                rows.append((key, dumps(body).decode("utf-8"), batch_id, result["custom_id"], now))
+            else:
+                unanswered.append((batch_id, key, dumps(body).decode("utf-8")))
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)", rows)
+            self._conn.executemany("INSERT OR REPLACE INTO unanswered VALUES (?, ?, ?)", unanswered)
+            self._conn.execute("DELETE FROM pending WHERE batch_id = ?", (batch_id,))
+        return len(rows)
+
+    def iter_cached_results(self, batch_id: str, result_type: Optional[str] = None) -> Iterator[Dict]:
+        """
+        Yields results for the requests of a batch that were answered from the cache,
+        in the same format as the API's results. A repeat of a prompt that was sent in
+        the same batch and did not succeed gets that prompt's result.
+
+        :param batch_id: ID of the batch (or batch group)
+        :param result_type: Result type to filter by, or None for all results
+        :return: Iterator of result dictionaries
+        """
+        with self._lock:
+            rows = self._conn.execute("""
+                SELECT h.custom_id, COALESCE(r.result, u.result) FROM cached_hits h
+                LEFT JOIN responses r ON r.prompt_hash = h.prompt_hash
+                LEFT JOIN unanswered u ON u.batch_id = h.batch_id AND u.prompt_hash = h.prompt_hash
+                WHERE h.batch_id = ?""", (batch_id,)).fetchall()
+        loads = self.codec.loads
+        for custom_id, result in rows:
+            if result is None:
+                continue
+            body = loads(result)
+            if result_type is None or body.get("type") == result_type:
+                yield {"custom_id": custom_id, "result": body}
@@ -0,0 +1,96 @@
+from typing import Optional
+from email.utils import parsedate_to_datetime
+import threading
+import time
+
+class TokenBucket:
+    """
+    A thread-safe token bucket rate limiter.
+
+    Tokens are refilled continuously at `rate` per second up to `capacity`. Callers
+    block in acquire() until a token is available, and pause() holds back all callers
+    for a while, e.g. when the server answers with 429 and a retry-after header.
+    """
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        """
+        :param rate: Tokens added per second
+        :param capacity: Maximum number of tokens (burst size), defaults to rate
+        :raises ValueError: If rate is not positive
+        """
+        if not rate > 0:
+            raise ValueError(f"TokenBucket rate must be positive, got {rate!r}")
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, tokens: float = 1.0) -> None:
+        """
+        Blocks until the requested number of tokens is available and takes them.
+
+        :param tokens: Number of tokens to take
+        :raises ValueError: If more tokens are requested than the bucket can hold
+        """
+        if tokens > self.capacity:
+            raise ValueError(f"Cannot acquire {tokens!r} tokens from a bucket with capacity {self.capacity!r}")
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    wait = self._paused_until - now
+                else:
+                    self._refill(now)
+                    if self._tokens >= tokens:
+                        self._tokens -= tokens
+                        return
+                    wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds: float) -> None:
+        """
+        Stops handing out tokens for the given number of seconds and drains the bucket,
+        so that callers resume one by one afterwards instead of in a burst.
+
+        :param seconds: Number of seconds to pause for
+        """
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = 0.0
+            self._updated = self._paused_until
+
+def is_retryable_error(error: Exception) -> bool:
+    """
+    Returns whether a failed API call may succeed when it is tried again: rate limits
+    (HTTP 429), server errors and errors without a response, such as dropped
+    connections and timeouts. Other HTTP errors, e.g. 404 for an unknown batch, are not.
+
+    :param error: The exception the call raised
+    """
+    response = getattr(error, "response", None)
+    return response is None or response.status_code == 429 or response.status_code >= 500
+
+def get_retry_after(response, default: float = 1.0) -> float:
+    """
+    Returns the number of seconds a response asks the client to wait before retrying.
+
+    :param response: HTTP response, possibly carrying a retry-after header
+    :param default: Value to use when the header is missing or invalid
+    :return: Number of seconds to wait
+    """
+    value = response.headers.get("retry-after") if response is not None else None
+    if not value:
+        return default
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return default
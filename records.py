@@ -0,0 +1,156 @@
+from typing import Dict, Optional, Tuple
+import sys
+
+from json_codec import JSONCodec, get_codec
+
+# Encoded request with a single user message, in the spacing of the standard library and of the compact codecs
+_REQUEST_TEMPLATE = b'{"custom_id": %s, "params": {"model": %s, "max_tokens": %d, "messages": [{"role": "user", "content": %s}]}}'
+_COMPACT_REQUEST_TEMPLATE = b'{"custom_id":%s,"params":{"model":%s,"max_tokens":%d,"messages":[{"role":"user","content":%s}]}}'
+
+# Encoded model names by (codec name, model); a draft rarely has more than a few models
+_encoded_models: Dict[Tuple[str, str], bytes] = {}
+
+def intern_model(model: str) -> str:
+    """Returns the one shared copy of a model name, so records of the same model do not each hold their own."""
+    return sys.intern(model) if type(model) is str else model
+
+class RequestRecord:
+    """
+    A batch request with a single user text message, stored in four slots instead of nested dictionaries.
+
+    Almost every imported request has this shape, and as dictionaries it costs four
+    containers (the request, params, the message list and the message) plus its own copy
+    of the model name. A record is one small object whose model name is interned, so
+    in-memory drafts take a fraction of the memory. encode() writes the JSON directly
+    from a template and produces exactly what the codec would produce for to_dict(), so
+    records and dictionaries can be mixed in one draft. Requests of any other shape
+    (system prompts, several messages, content blocks, extra parameters) stay dictionaries.
+    """
+    __slots__ = ("custom_id", "model", "max_tokens", "content")
+
+    def __init__(self, custom_id: str, model: str, max_tokens: int, content: str):
+        self.custom_id = custom_id
+        self.model = intern_model(model)
+        self.max_tokens = max_tokens
+        self.content = content
+
+    @classmethod
+    def from_dict(cls, request: Dict) -> Optional["RequestRecord"]:
+        """
+        Converts a request dictionary into a record if it has exactly the shape of one.
+
+        :param request: Request dictionary in the format expected by the API
+        :return: The record, or None if the request has any other shape or key order
+        """
+        try:
+            params = request["params"]
+            messages = params["messages"]
+            message = messages[0]
+        except (KeyError, IndexError, TypeError):
+            return None
+        if (list(request) != ["custom_id", "params"] or list(params) != ["model", "max_tokens", "messages"]
+                or len(messages) != 1 or list(message) != ["role", "content"] or message["role"] != "user"):
+            return None
+        custom_id, model, max_tokens, content = request["custom_id"], params["model"], params["max_tokens"], message["content"]
+        if type(custom_id) is not str or type(model) is not str or type(max_tokens) is not int or type(content) is not str:
+            return None
+        return cls(custom_id, model, max_tokens, content)
+
+    def to_dict(self) -> Dict:
+        """Returns the request as a dictionary in the format expected by the API."""
+        return {
+            "custom_id": self.custom_id,
+            "params": {
+                "model": self.model,
+                "max_tokens": self.max_tokens,
+                "messages": [
+                    {"role": "user", "content": self.content}
+                ]
+            }
+        }
+
+    def encode(self, codec: Optional[JSONCodec] = None) -> bytes:
+        """
+        Encodes the request as JSON without building its dictionaries.
+
+        :param codec: Codec whose output to match (default: get_codec())
+        :return: The same bytes as codec.dumps(self.to_dict())
+        """
+        codec = codec or get_codec()
+        dumps = codec.dumps
+        key = (codec.name, self.model)
+        model = _encoded_models.get(key)
+        if model is None:
+            model = _encoded_models[key] = dumps(self.model)
+        template = _COMPACT_REQUEST_TEMPLATE if codec.compact else _REQUEST_TEMPLATE
+        return template % (dumps(self.custom_id), model, self.max_tokens, dumps(self.content))
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, RequestRecord):
+            return NotImplemented
+        return (self.custom_id, self.model, self.max_tokens, self.content) == \
+               (other.custom_id, other.model, other.max_tokens, other.content)
+
+    def __repr__(self) -> str:
+        return f"RequestRecord({self.custom_id!r}, {self.model!r}, {self.max_tokens!r}, {self.content[:30]!r})"
+
+class ResultRecord:
+    """
+    The fields of a batch result that are shown and summarized, stored in slots.
+
+    A result dictionary holds the whole response message, of which only the text, the
+    stop reason and the token usage are needed for previews and summaries. The model
+    name is interned like that of RequestRecord. Records are read-only views: the full
+    result is still available from the result store as a dictionary.
+    """
+    __slots__ = ("custom_id", "type", "model", "text", "stop_reason", "input_tokens", "output_tokens",
+                 "error_type", "error_message")
+
+    def __init__(self, custom_id: str, type: str, model: Optional[str] = None, text: str = "",
+                 stop_reason: Optional[str] = None, input_tokens: int = 0, output_tokens: int = 0,
+                 error_type: Optional[str] = None, error_message: Optional[str] = None):
+        self.custom_id = custom_id
+        self.type = type
+        self.model = intern_model(model)
+        self.text = text
+        self.stop_reason = stop_reason
+        self.input_tokens = input_tokens
+        self.output_tokens = output_tokens
+        self.error_type = error_type
+        self.error_message = error_message
+
+    @classmethod
+    def from_dict(cls, result: Dict) -> "ResultRecord":
+        """
+        Converts a result dictionary as returned by the results endpoint.
+
+        :param result: Result dictionary with 'custom_id' and 'result'
+        :return: The record; missing fields are left at their defaults
+        """
+        body = result.get("result") or {}
+        message = body.get("message") or {}
+        usage = message.get("usage") or {}
+        # Errored results wrap the API error: {"type": "error", "error": {"type": ..., "message": ...}}
+        error = (body.get("error") or {}).get("error") or {}
+        text = "".join(block.get("text", "") for block in message.get("content") or [] if isinstance(block, dict))
+        return cls(result.get("custom_id"), body.get("type", result.get("status")), message.get("model"), text,
+                   message.get("stop_reason"), usage.get("input_tokens", 0), usage.get("output_tokens", 0),
+                   error.get("type"), error.get("message"))
+
+    @classmethod
+    def decode(cls, line: bytes, codec: Optional[JSONCodec] = None) -> "ResultRecord":
+        """
+        Decodes one line of a results file.
+
+        :param line: Encoded JSON of the result
+        :param codec: Codec to decode with (default: get_codec())
+        :return: The record
+        """
+        return cls.from_dict((codec or get_codec()).loads(line))
+
+    def to_dict(self) -> Dict:
+        """Returns the fields of the record as a flat dictionary."""
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __repr__(self) -> str:
+        return f"ResultRecord({self.custom_id!r}, {self.type!r})"
@@ -0,0 +1,209 @@
+from typing import Dict, Iterator, List, Optional
+import os
+import sqlite3
+import threading
+import time
+
+from json_codec import get_codec
+from storage import get_data_path
+
+# Default limit for the total size of downloaded result files
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+
+class ResultStore:
+    """
+    A persistent local index over downloaded batch results.
+
+    Each ended batch's results are kept as the JSONL file written by ResultsDownloader,
+    and an SQLite index records the byte offset of every result by (batch_id, custom_id)
+    together with its result type. Single results are read with one index lookup and one
+    seek, type-filtered scans only touch matching lines, and once the files exceed
+    max_bytes the least recently used batches are evicted.
+    """
+    def __init__(self, db_path: Optional[str] = None, results_dir: Optional[str] = None,
+                 max_bytes: int = DEFAULT_MAX_BYTES):
+        """
+        :param db_path: Path of the SQLite index (default: 'results.sqlite3' in the data directory)
+        :param results_dir: Directory the result files are kept in (default: 'results' in the data directory)
+        :param max_bytes: Maximum total size of the result files before old batches are evicted
+        """
+        self.db_path = db_path or get_data_path("results.sqlite3")
+        self.results_dir = results_dir or get_data_path("results")
+        self.max_bytes = max_bytes
+        self.codec = get_codec()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS batches (
+                    batch_id TEXT PRIMARY KEY,
+                    path TEXT NOT NULL,
+                    size_bytes INTEGER NOT NULL,
+                    result_count INTEGER NOT NULL,
+                    last_access REAL NOT NULL
+                )""")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS results (
+                    batch_id TEXT NOT NULL,
+                    custom_id TEXT NOT NULL,
+                    result_type TEXT,
+                    offset INTEGER NOT NULL,
+                    length INTEGER NOT NULL,
+                    PRIMARY KEY (batch_id, custom_id)
+                ) WITHOUT ROWID""")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS results_custom_id ON results (custom_id)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS results_type ON results (batch_id, result_type, offset)")
+
+    def close(self) -> None:
+        """Closes the index database."""
+        self._conn.close()
+
+    def path_for(self, batch_id: str) -> str:
+        """
+        Returns the path the results file of a batch is stored at.
+
+        :param batch_id: ID of the batch
+        :return: Path of the JSONL results file
+        """
+        return os.path.join(self.results_dir, f"{batch_id}.jsonl")
+
+    def has_batch(self, batch_id: str) -> bool:
+        """
+        Returns whether the results of a batch are stored locally.
+
+        :param batch_id: ID of the batch
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT path FROM batches WHERE batch_id = ?", (batch_id,)).fetchone()
+        return row is not None and os.path.exists(row[0])
+
+    def ingest(self, batch_id: str, path: str) -> int:
+        """
+        Indexes a downloaded results file and evicts old batches if the store is over its size limit.
+
+        :param batch_id: ID of the batch
+        :param path: Path of the JSONL results file
+        :return: Number of results indexed
+        """
+        rows = []
+        offset = 0
+        loads = self.codec.loads
+        with open(path, "rb") as file:
+            for line in file:
+                if line.strip():
+                    result = loads(line)
+                    result_type = (result.get("result") or {}).get("type")
+                    rows.append((batch_id, result.get("custom_id"), result_type, offset, len(line)))
+                offset += len(line)
+
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM results WHERE batch_id = ?", (batch_id,))
+            self._conn.executemany("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)", rows)
+            self._conn.execute("INSERT OR REPLACE INTO batches VALUES (?, ?, ?, ?, ?)",
+                               (batch_id, path, offset, len(rows), time.time()))
+        self.evict(keep=batch_id)
+        return len(rows)
+
+    def _touch(self, batch_id: str) -> None:
+        with self._conn:
+            self._conn.execute("UPDATE batches SET last_access = ? WHERE batch_id = ?", (time.time(), batch_id))
+
+    def get(self, custom_id: str, batch_id: Optional[str] = None) -> Optional[Dict]:
+        """
+        Looks up a single result by custom_id.
+
+        :param custom_id: custom_id of the request
+        :param batch_id: ID of the batch; if omitted, the most recently used batch containing the custom_id is used
+        :return: The result dictionary, or None if it is not stored
+        """
+        with self._lock:
+            if batch_id is None:
+                row = self._conn.execute("""
+                    SELECT r.batch_id, b.path, r.offset, r.length FROM results r
+                    JOIN batches b ON b.batch_id = r.batch_id
+                    WHERE r.custom_id = ? ORDER BY b.last_access DESC LIMIT 1""", (custom_id,)).fetchone()
+            else:
+                row = self._conn.execute("""
+                    SELECT r.batch_id, b.path, r.offset, r.length FROM results r
+                    JOIN batches b ON b.batch_id = r.batch_id
+                    WHERE r.batch_id = ? AND r.custom_id = ?""", (batch_id, custom_id)).fetchone()
+            if row is None:
+                return None
+            self._touch(row[0])
+        with open(row[1], "rb") as file:
+            file.seek(row[2])
+            return self.codec.loads(file.read(row[3]))
+
+    def iter_results(self, batch_id: str, result_type: Optional[str] = None) -> Iterator[Dict]:
+        """
+        Yields the stored results of a batch in file order, optionally only those of one result type.
+
+        :param batch_id: ID of the batch
+        :param result_type: 'succeeded', 'errored', 'canceled' or 'expired' to filter by, or None for all
+        :return: Iterator of result dictionaries
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT path FROM batches WHERE batch_id = ?", (batch_id,)).fetchone()
+            if row is None:
+                return
+            self._touch(batch_id)
+            if result_type is not None:
+                spans = self._conn.execute("""
+                    SELECT offset, length FROM results WHERE batch_id = ? AND result_type = ?
+                    ORDER BY offset""", (batch_id, result_type)).fetchall()
+        loads = self.codec.loads
+        with open(row[0], "rb") as file:
+            if result_type is None:
+                for line in file:
+                    if line.strip():
+                        yield loads(line)
+                return
+            for offset, length in spans:
+                file.seek(offset)
+                yield loads(file.read(length))
+
+    def count_by_type(self, batch_id: str) -> Dict[str, int]:
+        """
+        Returns the number of stored results of a batch per result type.
+
+        :param batch_id: ID of the batch
+        :return: Dictionary mapping result types to counts
+        """
+        with self._lock:
+            rows = self._conn.execute("""
+                SELECT result_type, COUNT(*) FROM results WHERE batch_id = ? GROUP BY result_type""",
+                                      (batch_id,)).fetchall()
+        return {result_type: count for result_type, count in rows}
+
+    def total_bytes(self) -> int:
+        """Returns the total size of all stored result files."""
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(SUM(size_bytes), 0) FROM batches").fetchone()[0]
+
+    def evict(self, keep: Optional[str] = None) -> List[str]:
+        """
+        Removes least recently used batches until the store fits in max_bytes.
+
+        :param keep: ID of a batch that must not be evicted, e.g. the one just added
+        :return: IDs of the evicted batches
+        """
+        evicted = []
+        with self._lock:
+            total = self._conn.execute("SELECT COALESCE(SUM(size_bytes), 0) FROM batches").fetchone()[0]
+            if total <= self.max_bytes:
+                return evicted
+            candidates = self._conn.execute("""
+                SELECT batch_id, path, size_bytes FROM batches ORDER BY last_access""").fetchall()
+            with self._conn:
+                for batch_id, path, size_bytes in candidates:
+                    if total <= self.max_bytes:
+                        break
+                    if batch_id == keep:
+                        continue
+                    self._conn.execute("DELETE FROM results WHERE batch_id = ?", (batch_id,))
+                    self._conn.execute("DELETE FROM batches WHERE batch_id = ?", (batch_id,))
+                    if os.path.exists(path):
+                        os.remove(path)
+                    total -= size_bytes
+                    evicted.append(batch_id)
+        return evicted
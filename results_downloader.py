@@ -0,0 +1,166 @@
+from typing import Dict, Optional, Tuple
+import os
+import time
+
+from app_console import get_console
+from metrics import get_metrics
+
+# Size of the chunks results are streamed to disk in
+DOWNLOAD_CHUNK_SIZE = 256 * 1024
+
+class ResultsDownloader:
+    """
+    Streams the raw JSONL results of a batch to a local file.
+
+    Bytes are written as they arrive, without parsing individual lines. The data is
+    first written to a '.part' file; an interrupted download resumes from the size of
+    that file with a Range request, and the file is only renamed to its final name
+    once it is complete, so an existing final file never needs to be downloaded again.
+    When the expected number of results is known, a download is only complete if it
+    has exactly that many lines: otherwise the '.part' file is deleted, no final file
+    is written and the report says 'verified': False, so the next attempt starts over.
+    """
+    def __init__(self, api_client, chunk_size: int = DOWNLOAD_CHUNK_SIZE, max_retries: int = 3):
+        """
+        :param api_client: APIClient used to open the results stream
+        :param chunk_size: Number of bytes read from the connection at a time
+        :param max_retries: Number of times a dropped connection is resumed
+        """
+        self.api_client = api_client
+        self.chunk_size = chunk_size
+        self.max_retries = max_retries
+        self.console = get_console()
+        self.metrics = get_metrics()
+
+    def download(self, batch_id: str, dest_path: str, expected_count: Optional[int] = None) -> Dict:
+        """
+        Downloads the results of a batch to dest_path, resuming a previous partial download.
+
+        :param batch_id: ID of the batch to download results for
+        :param dest_path: Path of the JSONL file to write
+        :param expected_count: Number of result lines expected, usually the sum of request_counts
+        :return: Dictionary with 'path', 'bytes', 'lines', 'seconds', 'mb_per_s' and 'verified';
+                 if 'verified' is False, nothing was written to dest_path
+        """
+        if os.path.exists(dest_path):
+            lines = self._count_lines(dest_path)
+            if expected_count is None or lines == expected_count:
+                return self._report(dest_path, 0, lines, 0.0, expected_count)
+            # Left behind by a version that did not verify downloads before finalizing them
+            self.console.print(f"[yellow]{dest_path} has {lines} results instead of {expected_count}, "
+                               f"downloading it again.[/yellow]")
+            os.remove(dest_path)
+
+        from rich.progress import Progress, TextColumn, BarColumn, DownloadColumn, TransferSpeedColumn
+
+        os.makedirs(os.path.dirname(os.path.abspath(dest_path)), exist_ok=True)
+        part_path = f"{dest_path}.part"
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        # Newlines already on disk plus whether the last byte written was one
+        lines, ends_with_newline = self._count_newlines(part_path) if offset else (0, True)
+
+        start = time.perf_counter()
+        received = 0
+        attempt = 0
+        with Progress(
+            TextColumn("[progress.description]{task.description}"),
+            BarColumn(),
+            DownloadColumn(),
+            TransferSpeedColumn(),
+            transient=True,
+            console=self.console,
+        ) as progress:
+            task = progress.add_task(f"[cyan]Downloading results for {batch_id}...", total=None, completed=offset)
+            while True:
+                try:
+                    response = self.api_client.open_results_stream(batch_id, offset)
+                except Exception as e:
+                    response = getattr(e, "response", None)
+                    if response is not None and response.status_code == 416:
+                        # Nothing left after the offset: the partial file is already complete
+                        break
+                    if response is not None and response.status_code < 500 and response.status_code != 429:
+                        raise
+                    if attempt >= self.max_retries:
+                        raise
+                    attempt += 1
+                    self.metrics.increment("api_retries_total", operation="download")
+                    time.sleep(2 ** attempt)
+                    continue
+
+                try:
+                    with response:
+                        if response.status_code != 206 and offset:
+                            # The server ignored the Range header, so start over
+                            offset, lines, ends_with_newline = 0, 0, True
+                            progress.update(task, completed=0)
+                        length = response.headers.get("content-length")
+                        if length is not None:
+                            progress.update(task, total=offset + int(length))
+                        with open(part_path, "ab" if offset else "wb") as file:
+                            for chunk in response.iter_content(chunk_size=self.chunk_size):
+                                if not chunk:
+                                    continue
+                                file.write(chunk)
+                                lines += chunk.count(b"\n")
+                                ends_with_newline = chunk.endswith(b"\n")
+                                offset += len(chunk)
+                                received += len(chunk)
+                                self.metrics.increment("api_received_bytes_total", len(chunk),
+                                                       endpoint="GET /messages/batches/{id}/results")
+                                progress.update(task, completed=offset)
+                    break
+                except Exception:
+                    if attempt >= self.max_retries:
+                        raise
+                    attempt += 1
+                    self.metrics.increment("api_retries_total", operation="download")
+                    self.console.print(f"[yellow]Connection dropped at {offset} bytes, resuming...[/yellow]")
+
+        if not ends_with_newline:
+            lines += 1
+        if expected_count is not None and lines != expected_count:
+            # Resuming would only append to the wrong data, so the next attempt starts from scratch
+            os.remove(part_path)
+        else:
+            os.replace(part_path, dest_path)
+        self.metrics.observe("stage_seconds", time.perf_counter() - start, stage="download")
+        return self._report(dest_path, received, lines, time.perf_counter() - start, expected_count)
+
+    def _report(self, path: str, received: int, lines: int, seconds: float, expected_count: Optional[int]) -> Dict:
+        """Prints and returns the outcome of a download."""
+        mb_per_s = (received / 1e6) / seconds if seconds > 0 else 0.0
+        verified = expected_count is None or lines == expected_count
+        if received and verified:
+            self.console.print(f"[green]Downloaded {received / 1e6:.1f} MB ({lines} results) to {path} "
+                               f"in {seconds:.1f}s ({mb_per_s:.1f} MB/s)[/green]")
+        if not verified:
+            self.console.print(f"[red]Expected {expected_count} results but the download of {path} "
+                               f"contains {lines}; it was discarded.[/red]")
+        return {
+            "path": path,
+            "bytes": received,
+            "lines": lines,
+            "seconds": seconds,
+            "mb_per_s": mb_per_s,
+            "verified": verified
+        }
+
+    def _count_newlines(self, path: str) -> Tuple[int, bool]:
+        """Returns the number of newlines in a file and whether it ends with one."""
+        count = 0
+        last = b"\n"
+        with open(path, "rb") as file:
+            while True:
+                chunk = file.read(self.chunk_size)
+                if not chunk:
+                    return count, last.endswith(b"\n")
+                count += chunk.count(b"\n")
+                last = chunk
+
+    def _count_lines(self, path: str) -> int:
+        """Returns the number of lines in a file, counting a final line without a newline."""
+        count, ends_with_newline = self._count_newlines(path)
+        if not ends_with_newline:
+            count += 1
+        return count
@@ -0,0 +1,23 @@
+import os
+
+DEFAULT_DATA_DIR = os.path.join("~", ".batchforge")
+
+def get_data_dir() -> str:
+    """
+    Returns the directory used for local application data, creating it if needed.
+    The location can be overridden with the BATCHFORGE_DATA_DIR environment variable.
+
+    :return: Absolute path of the data directory
+    """
+    data_dir = os.path.abspath(os.path.expanduser(os.getenv("BATCHFORGE_DATA_DIR", DEFAULT_DATA_DIR)))
+    os.makedirs(data_dir, exist_ok=True)
+    return data_dir
+
+def get_data_path(name: str) -> str:
+    """
+    Returns the path of a file inside the data directory.
+
+    :param name: File name relative to the data directory
+    :return: Absolute path of the file
+    """
+    return os.path.join(get_data_dir(), name)
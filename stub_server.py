@@ -0,0 +1,415 @@
+from typing import Dict, Iterator, List, Optional, Tuple
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import argparse
+import json
+import random
+import re
+import sys
+import threading
+import time
+import zlib
+
+# Size of the chunks result streams are sent in
+RESULTS_CHUNK_SIZE = 64 * 1024
+
+_PATH_PATTERN = re.compile(r"^/v1/messages/batches(?:/([^/]+))?(/results|/cancel)?/?$")
+
+def _timestamp(seconds: Optional[float]) -> Optional[str]:
+    if seconds is None:
+        return None
+    return datetime.fromtimestamp(seconds, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+class _StubHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients dropping keep-alive connections (e.g. after an injected error) are not server errors
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            return
+        super().handle_error(request, client_address)
+
+class StubBatch:
+    """A batch held by the stub server. Its progress is derived from the clock, not stored."""
+    def __init__(self, batch_id: str, custom_ids: List[str], model: str, created: float):
+        self.batch_id = batch_id
+        self.custom_ids = custom_ids
+        self.model = model
+        self.created = created
+        self.canceled_at: Optional[float] = None
+
+class StubBatchesServer:
+    """
+    A local stand-in for the Message Batches API, for tests and benchmarks that should
+    not call the real API or spend credits.
+
+    It implements create, status, results, list and cancel under '/v1/messages/batches'.
+    Every batch finishes processing_rate requests per second after its creation, a
+    fraction errored_fraction of its results is errored, and canceling a batch cancels
+    whatever had not finished. Status responses carry an ETag and honour If-None-Match,
+    and result streams honour Range. Each call can be delayed by latency seconds and,
+    with the given probabilities, be answered with an injected 500 or a 429 carrying a
+    retry-after header. Calls and transferred bytes are counted and returned by
+    GET /stub/stats.
+    """
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0,
+                 processing_rate: float = 10000.0, error_rate: float = 0.0, rate_limit_rate: float = 0.0,
+                 retry_after: float = 1.0, errored_fraction: float = 0.0, seed: Optional[int] = None):
+        """
+        :param host: Interface to listen on
+        :param port: Port to listen on (0 picks a free port)
+        :param latency: Seconds every call is delayed by
+        :param processing_rate: Requests per second each batch finishes
+        :param error_rate: Probability of answering a call with 500 Internal Server Error
+        :param rate_limit_rate: Probability of answering a call with 429 Too Many Requests
+        :param retry_after: Seconds sent in the retry-after header of injected 429s
+        :param errored_fraction: Fraction of results that are 'errored' instead of 'succeeded'
+        :param seed: Seed of the random generator used for error injection
+        """
+        self.latency = latency
+        self.processing_rate = processing_rate
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.errored_fraction = errored_fraction
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._batches: Dict[str, StubBatch] = {}
+        self.stats = self._empty_stats()
+        self.httpd = _StubHTTPServer((host, port), _StubHandler)
+        self.httpd.stub = self
+        self._thread: Optional[threading.Thread] = None
+
+    @staticmethod
+    def _empty_stats() -> Dict:
+        return {"calls": {}, "injected_errors": 0, "rate_limited": 0, "bytes_received": 0, "bytes_sent": 0}
+
+    @property
+    def base_url(self) -> str:
+        """Base URL to pass to APIClient, including the '/v1' version path."""
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> str:
+        """
+        Starts serving on a background thread.
+
+        :return: Base URL of the server
+        """
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self.base_url
+
+    def stop(self) -> None:
+        """Stops serving and closes the listening socket."""
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self) -> "StubBatchesServer":
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.stop()
+
+    def count(self, key: str, amount: int = 1, call: bool = False) -> None:
+        """Adds to a statistics counter; with call=True, to the number of calls of an endpoint."""
+        with self._lock:
+            if call:
+                self.stats["calls"][key] = self.stats["calls"].get(key, 0) + amount
+            else:
+                self.stats[key] += amount
+
+    def inject_failure(self) -> Optional[int]:
+        """Returns 429 or 500 if this call should fail, else None."""
+        with self._lock:
+            roll = self._random.random()
+        if roll < self.rate_limit_rate:
+            self.count("rate_limited")
+            return 429
+        if roll < self.rate_limit_rate + self.error_rate:
+            self.count("injected_errors")
+            return 500
+        return None
+
+    def create(self, requests: List[Dict]) -> StubBatch:
+        """Creates a batch from decoded requests."""
+        custom_ids = [request["custom_id"] for request in requests]
+        model = requests[0].get("params", {}).get("model", "unknown")
+        with self._lock:
+            batch_id = f"msgbatch_stub{len(self._batches):06d}{self._random.getrandbits(32):08x}"
+            batch = self._batches[batch_id] = StubBatch(batch_id, custom_ids, model, time.time())
+        return batch
+
+    def get(self, batch_id: str) -> Optional[StubBatch]:
+        with self._lock:
+            return self._batches.get(batch_id)
+
+    def cancel(self, batch: StubBatch) -> None:
+        with self._lock:
+            if batch.canceled_at is None and self._finished(batch, time.time()) < len(batch.custom_ids):
+                batch.canceled_at = time.time()
+
+    def newest_first(self) -> List[StubBatch]:
+        with self._lock:
+            return list(reversed(list(self._batches.values())))
+
+    def _finished(self, batch: StubBatch, now: float) -> int:
+        end = batch.canceled_at if batch.canceled_at is not None else now
+        return min(len(batch.custom_ids), int((end - batch.created) * self.processing_rate))
+
+    def _errored(self, finished: int) -> int:
+        return int(finished * self.errored_fraction)
+
+    def describe(self, batch: StubBatch) -> Dict:
+        """Returns the API representation of a batch at the current time."""
+        now = time.time()
+        total = len(batch.custom_ids)
+        finished = self._finished(batch, now)
+        errored = self._errored(finished)
+        ended = finished == total or batch.canceled_at is not None
+        if batch.canceled_at is not None and now - batch.canceled_at < 1.0:
+            status = "canceling"
+        else:
+            status = "ended" if ended else "in_progress"
+        ended_at = None
+        if status == "ended":
+            ended_at = batch.canceled_at if batch.canceled_at is not None else batch.created + total / self.processing_rate
+        return {
+            "id": batch.batch_id,
+            "type": "message_batch",
+            "processing_status": status,
+            "request_counts": {
+                "processing": 0 if ended else total - finished,
+                "succeeded": finished - errored,
+                "errored": errored,
+                "canceled": total - finished if batch.canceled_at is not None else 0,
+                "expired": 0
+            },
+            "created_at": _timestamp(batch.created),
+            "ended_at": _timestamp(ended_at),
+            "expires_at": _timestamp(batch.created + 24 * 3600),
+            "cancel_initiated_at": _timestamp(batch.canceled_at),
+            "results_url": f"{self.base_url}/messages/batches/{batch.batch_id}/results" if status == "ended" else None
+        }
+
+    def iter_results(self, batch: StubBatch) -> Iterator[bytes]:
+        """Yields the encoded result lines of an ended batch."""
+        finished = self._finished(batch, time.time())
+        errored_fraction = self.errored_fraction
+        for index, custom_id in enumerate(batch.custom_ids):
+            if index >= finished:
+                result = {"type": "canceled"}
+            elif int((index + 1) * errored_fraction) > int(index * errored_fraction):
+                result = {"type": "errored", "error": {"type": "error", "error": {
+                    "type": "invalid_request_error", "message": "Injected by the stub server"}}}
+            else:
+                result = {"type": "succeeded", "message": {
+                    "id": f"msg_stub_{index}", "type": "message", "role": "assistant", "model": batch.model,
+                    "content": [{"type": "text", "text": f"Stub response to {custom_id}"}],
+                    "stop_reason": "end_turn", "stop_sequence": None,
+                    "usage": {"input_tokens": 10, "output_tokens": 5}}}
+            yield json.dumps({"custom_id": custom_id, "result": result}).encode("utf-8") + b"\n"
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def stub(self) -> StubBatchesServer:
+        return self.server.stub
+
+    def _send_json(self, body: Dict, status: int = 200, headers: Optional[Dict[str, str]] = None) -> None:
+        encoded = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("content-type", "application/json")
+        self.send_header("content-length", str(len(encoded)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(encoded)
+        self.stub.count("bytes_sent", len(encoded))
+
+    def _send_error(self, status: int, error_type: str, message: str,
+                    headers: Optional[Dict[str, str]] = None) -> None:
+        self._send_json({"type": "error", "error": {"type": error_type, "message": message}}, status, headers)
+
+    def _read_body(self) -> bytes:
+        """Reads a chunked or content-length body, decompressing it if it is gzip-encoded."""
+        chunks = []
+        if self.headers.get("transfer-encoding", "").lower() == "chunked":
+            while True:
+                size = int(self.rfile.readline().split(b";")[0], 16)
+                if size == 0:
+                    self.rfile.readline()
+                    break
+                chunks.append(self.rfile.read(size))
+                self.rfile.readline()
+        else:
+            chunks.append(self.rfile.read(int(self.headers.get("content-length", 0))))
+        body = b"".join(chunks)
+        self.stub.count("bytes_received", len(body))
+        if self.headers.get("content-encoding") == "gzip":
+            body = zlib.decompress(body, zlib.MAX_WBITS | 16)
+        return body
+
+    def _route(self) -> Tuple[Optional[re.Match], Dict[str, List[str]]]:
+        url = urlparse(self.path)
+        return _PATH_PATTERN.match(url.path), parse_qs(url.query)
+
+    def _fail_if_injected(self) -> bool:
+        """Delays the call by the configured latency and answers it with an injected failure if one is drawn."""
+        if self.stub.latency:
+            time.sleep(self.stub.latency)
+        status = self.stub.inject_failure()
+        if status == 429:
+            self._send_error(429, "rate_limit_error", "Injected rate limit",
+                             {"retry-after": str(self.stub.retry_after)})
+        elif status == 500:
+            self._send_error(500, "api_error", "Injected server error")
+        return status is not None
+
+    def do_GET(self):
+        if self.path == "/stub/stats":
+            with self.stub._lock:
+                stats = json.loads(json.dumps(self.stub.stats))
+            return self._send_json(stats)
+        match, query = self._route()
+        if match is None:
+            return self._send_error(404, "not_found_error", f"Unknown path {self.path}")
+        batch_id, action = match.groups()
+        endpoint = "list" if batch_id is None else "results" if action == "/results" else "status"
+        self.stub.count(endpoint, call=True)
+        if self._fail_if_injected():
+            return
+        if batch_id is None:
+            return self._list(query)
+        batch = self.stub.get(batch_id)
+        if batch is None:
+            return self._send_error(404, "not_found_error", f"Batch {batch_id} not found")
+        if action == "/results":
+            return self._results(batch)
+
+        described = self.stub.describe(batch)
+        counts = described["request_counts"]
+        etag = f'"{batch_id}-{described["processing_status"]}-{counts["processing"]}-{counts["canceled"]}"'
+        if self.headers.get("if-none-match") == etag:
+            self.stub.count("not_modified", call=True)
+            self.send_response(304)
+            self.send_header("etag", etag)
+            self.end_headers()
+            return
+        self._send_json(described, headers={"etag": etag})
+
+    def _list(self, query: Dict[str, List[str]]) -> None:
+        batches = self.stub.newest_first()
+        limit = int(query.get("limit", ["20"])[0])
+        ids = [batch.batch_id for batch in batches]
+        start, stop = 0, len(batches)
+        if "after_id" in query and query["after_id"][0] in ids:
+            start = ids.index(query["after_id"][0]) + 1
+        if "before_id" in query and query["before_id"][0] in ids:
+            stop = ids.index(query["before_id"][0])
+            start = max(start, stop - limit)
+        page = batches[start:min(start + limit, stop)]
+        data = [self.stub.describe(batch) for batch in page]
+        self._send_json({
+            "data": data,
+            "has_more": start + len(page) < stop if "before_id" not in query else start > 0,
+            "first_id": data[0]["id"] if data else None,
+            "last_id": data[-1]["id"] if data else None
+        })
+
+    def _results(self, batch: StubBatch) -> None:
+        if self.stub.describe(batch)["processing_status"] != "ended":
+            return self._send_error(400, "invalid_request_error", f"Batch {batch.batch_id} has not ended yet")
+        offset = 0
+        range_match = re.match(r"bytes=(\d+)-$", self.headers.get("range", ""))
+        if range_match:
+            offset = int(range_match.group(1))
+        self.send_response(206 if offset else 200)
+        self.send_header("content-type", "application/binary")
+        self.send_header("transfer-encoding", "chunked")
+        self.end_headers()
+
+        position = 0
+        buffer = bytearray()
+        for line in self.stub.iter_results(batch):
+            if position + len(line) > offset:
+                buffer += line[max(offset - position, 0):]
+            position += len(line)
+            if len(buffer) >= RESULTS_CHUNK_SIZE:
+                self._write_chunk(bytes(buffer))
+                buffer.clear()
+        if buffer:
+            self._write_chunk(bytes(buffer))
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _write_chunk(self, chunk: bytes) -> None:
+        self.wfile.write(f"{len(chunk):x}\r\n".encode("ascii") + chunk + b"\r\n")
+        self.stub.count("bytes_sent", len(chunk))
+
+    def do_POST(self):
+        match, _ = self._route()
+        if match is None:
+            return self._send_error(404, "not_found_error", f"Unknown path {self.path}")
+        batch_id, action = match.groups()
+        if batch_id is None:
+            # The body is read before any failure is injected so the connection stays usable
+            body = self._read_body()
+            self.stub.count("create", call=True)
+            if self._fail_if_injected():
+                return
+            try:
+                requests = json.loads(body)["requests"]
+            except (ValueError, KeyError, TypeError):
+                return self._send_error(400, "invalid_request_error", "Body must be a JSON object with 'requests'")
+            if not requests:
+                return self._send_error(400, "invalid_request_error", "'requests' must not be empty")
+            custom_ids = [request.get("custom_id") for request in requests]
+            if len(set(custom_ids)) != len(custom_ids):
+                return self._send_error(400, "invalid_request_error", "custom_id values must be unique")
+            return self._send_json(self.stub.describe(self.stub.create(requests)))
+
+        if action != "/cancel":
+            return self._send_error(404, "not_found_error", f"Unknown path {self.path}")
+        self.stub.count("cancel", call=True)
+        if self._fail_if_injected():
+            return
+        batch = self.stub.get(batch_id)
+        if batch is None:
+            return self._send_error(404, "not_found_error", f"Batch {batch_id} not found")
+        self.stub.cancel(batch)
+        self._send_json(self.stub.describe(batch))
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Runs a local stand-in for the Message Batches API. "
+                                                 "Point the app at it with --base-url or BATCHFORGE_BASE_URL.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000, help="Port to listen on (0 picks a free port)")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds every call is delayed by")
+    parser.add_argument("--processing-rate", type=float, default=10000.0,
+                        help="Requests per second each batch finishes")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Probability of an injected 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Probability of an injected 429")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="retry-after seconds of injected 429s")
+    parser.add_argument("--errored-fraction", type=float, default=0.0, help="Fraction of errored results")
+    parser.add_argument("--seed", type=int, help="Seed for error injection")
+    args = parser.parse_args()
+
+    server = StubBatchesServer(args.host, args.port, args.latency, args.processing_rate, args.error_rate,
+                               args.rate_limit_rate, args.retry_after, args.errored_fraction, args.seed)
+    # The first line tells a parent process (such as the benchmarks) where to connect
+    print(json.dumps({"base_url": server.base_url}), flush=True)
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+from typing import Dict, List, Optional, Set, Tuple
+import sqlite3
+import threading
+import time
+
+from storage import get_data_path
+
+class SubmissionJournal:
+    """
+    A durable write-ahead journal of batch submissions.
+
+    Every draft is identified by a hash of its encoded requests, and every shard of it
+    is journaled as 'pending' before its create request is sent and as 'submitted'
+    with its batch ID once the API answers. A shard that is still 'pending' after a
+    crash or a dropped connection may or may not exist on the API side; it stays
+    pending until it is reconciled against the batch list. Once all shards of a
+    draft are submitted the draft is 'submitted' under its logical batch ID, and it
+    becomes 'acknowledged' once the batch is being monitored.
+    """
+    def __init__(self, db_path: Optional[str] = None):
+        """
+        :param db_path: Path of the SQLite database (default: 'submissions.sqlite3' in the data directory)
+        """
+        self.db_path = db_path or get_data_path("submissions.sqlite3")
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS drafts (
+                    draft_hash TEXT PRIMARY KEY,
+                    batch_id TEXT,
+                    shard_count INTEGER NOT NULL,
+                    state TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )""")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS shards (
+                    draft_hash TEXT NOT NULL,
+                    shard_index INTEGER NOT NULL,
+                    start INTEGER NOT NULL,
+                    stop INTEGER NOT NULL,
+                    state TEXT NOT NULL,
+                    batch_id TEXT,
+                    attempted_at REAL,
+                    PRIMARY KEY (draft_hash, shard_index)
+                ) WITHOUT ROWID""")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS shards_batch_id ON shards (batch_id)")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS retired_batches (
+                    batch_id TEXT PRIMARY KEY,
+                    retired_at REAL NOT NULL
+                ) WITHOUT ROWID""")
+
+    def close(self) -> None:
+        """Closes the journal database."""
+        self._conn.close()
+
+    def begin(self, draft_hash: str, shards: List[Tuple[int, int]]) -> None:
+        """
+        Journals a draft and its shards, unless the draft is already journaled.
+
+        :param draft_hash: Hash identifying the draft
+        :param shards: List of (start, stop) index ranges of the shards
+        """
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR IGNORE INTO drafts VALUES (?, NULL, ?, 'submitting', ?)",
+                               (draft_hash, len(shards), time.time()))
+            self._conn.executemany("INSERT OR IGNORE INTO shards VALUES (?, ?, ?, ?, 'new', NULL, NULL)",
+                                   ((draft_hash, index, start, stop) for index, (start, stop) in enumerate(shards)))
+
+    def get_draft(self, draft_hash: str) -> Optional[Dict]:
+        """
+        Returns the journal entry of a draft.
+
+        :param draft_hash: Hash identifying the draft
+        :return: Dictionary with 'draft_hash', 'batch_id', 'state' and 'shards' (one dictionary
+                 per shard with 'index', 'start', 'stop', 'state', 'batch_id' and 'attempted_at'),
+                 or None if the draft is not journaled
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT batch_id, state FROM drafts WHERE draft_hash = ?",
+                                     (draft_hash,)).fetchone()
+            if row is None:
+                return None
+            shards = self._conn.execute("""
+                SELECT shard_index, start, stop, state, batch_id, attempted_at FROM shards
+                WHERE draft_hash = ? ORDER BY shard_index""", (draft_hash,)).fetchall()
+        return {
+            "draft_hash": draft_hash,
+            "batch_id": row[0],
+            "state": row[1],
+            "shards": [{"index": index, "start": start, "stop": stop, "state": state,
+                        "batch_id": batch_id, "attempted_at": attempted_at}
+                       for index, start, stop, state, batch_id, attempted_at in shards]
+        }
+
+    def _set_shard(self, draft_hash: str, index: int, state: str, batch_id: Optional[str] = None,
+                   attempted_at: Optional[float] = None) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("""
+                UPDATE shards SET state = ?, batch_id = COALESCE(?, batch_id),
+                                  attempted_at = COALESCE(?, attempted_at)
+                WHERE draft_hash = ? AND shard_index = ?""", (state, batch_id, attempted_at, draft_hash, index))
+
+    def mark_attempt(self, draft_hash: str, index: int) -> float:
+        """
+        Records that a shard's create request is about to be sent.
+
+        :param draft_hash: Hash identifying the draft
+        :param index: Index of the shard
+        :return: Time of the attempt
+        """
+        attempted_at = time.time()
+        self._set_shard(draft_hash, index, "pending", attempted_at=attempted_at)
+        return attempted_at
+
+    def mark_submitted(self, draft_hash: str, index: int, batch_id: str) -> None:
+        """
+        Records the batch ID a shard was created as.
+
+        :param draft_hash: Hash identifying the draft
+        :param index: Index of the shard
+        :param batch_id: ID of the created batch
+        """
+        self._set_shard(draft_hash, index, "submitted", batch_id=batch_id)
+
+    def mark_failed(self, draft_hash: str, index: int) -> None:
+        """
+        Records that a shard was definitely not created, so it is sent again on the next submission.
+
+        :param draft_hash: Hash identifying the draft
+        :param index: Index of the shard
+        """
+        self._set_shard(draft_hash, index, "failed")
+
+    def complete(self, draft_hash: str, batch_id: str) -> None:
+        """
+        Records the logical batch ID of a draft whose shards were all submitted.
+
+        :param draft_hash: Hash identifying the draft
+        :param batch_id: Batch ID, or batch group ID, the draft was submitted as
+        """
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE drafts SET batch_id = ?, state = 'submitted' WHERE draft_hash = ?",
+                               (batch_id, draft_hash))
+
+    def reset_shards(self, draft_hash: str, indexes: List[int]) -> None:
+        """
+        Marks submitted shards as failed so they are sent again, e.g. because their batch
+        was canceled or expired. Their old batch IDs are retired, and the draft goes back
+        to 'submitting' until all of its shards are submitted again.
+
+        :param draft_hash: Hash identifying the draft
+        :param indexes: Indexes of the shards
+        """
+        with self._lock, self._conn:
+            placeholders = ", ".join("?" * len(indexes))
+            self._conn.execute(f"""
+                INSERT OR IGNORE INTO retired_batches
+                SELECT batch_id, ? FROM shards
+                WHERE draft_hash = ? AND shard_index IN ({placeholders}) AND batch_id IS NOT NULL""",
+                               (time.time(), draft_hash, *indexes))
+            self._conn.execute(f"""
+                UPDATE shards SET state = 'failed', batch_id = NULL
+                WHERE draft_hash = ? AND shard_index IN ({placeholders})""", (draft_hash, *indexes))
+            self._conn.execute("UPDATE drafts SET batch_id = NULL, state = 'submitting' WHERE draft_hash = ?",
+                               (draft_hash,))
+
+    def record_cached(self, group_id: str) -> None:
+        """
+        Journals a submission that was answered entirely from the prompt cache, as a
+        submitted draft without shards, so its batch group ID resolves after a restart.
+
+        :param group_id: ID of the (empty) batch group returned for the submission
+        """
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR IGNORE INTO drafts VALUES (?, ?, 0, 'submitted', ?)",
+                               (group_id, group_id, time.time()))
+
+    def acknowledge(self, batch_id: str) -> None:
+        """
+        Records that a submitted batch is being monitored, so recovery does not report it again.
+
+        :param batch_id: Batch ID, or batch group ID, of the draft
+        """
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE drafts SET state = 'acknowledged' WHERE batch_id = ?", (batch_id,))
+
+    def unacknowledged(self) -> List[str]:
+        """Returns the logical batch IDs of submitted drafts that are not monitored yet."""
+        with self._lock:
+            rows = self._conn.execute("SELECT batch_id FROM drafts WHERE state = 'submitted' ORDER BY created_at")
+            return [row[0] for row in rows.fetchall()]
+
+    def incomplete(self) -> List[str]:
+        """Returns the hashes of drafts that still have shards that are not submitted."""
+        with self._lock:
+            rows = self._conn.execute("SELECT draft_hash FROM drafts WHERE state = 'submitting' ORDER BY created_at")
+            return [row[0] for row in rows.fetchall()]
+
+    def groups(self) -> List[Tuple[str, str, List[str]]]:
+        """
+        Returns the submitted shards of every sharded draft, and the empty batch groups
+        of submissions answered entirely from the prompt cache.
+
+        :return: List of (draft hash, logical batch ID or None, batch IDs of the submitted shards)
+        """
+        with self._lock:
+            rows = self._conn.execute("""
+                SELECT d.draft_hash, d.batch_id, s.batch_id FROM drafts d
+                LEFT JOIN shards s ON s.draft_hash = d.draft_hash AND s.state = 'submitted'
+                WHERE d.shard_count > 1 OR d.shard_count = 0
+                ORDER BY d.created_at, s.shard_index""").fetchall()
+        groups: Dict[str, Tuple[str, str, List[str]]] = {}
+        for draft_hash, group_id, batch_id in rows:
+            if batch_id is not None:
+                groups.setdefault(draft_hash, (draft_hash, group_id, []))[2].append(batch_id)
+            elif group_id is not None and draft_hash == group_id:
+                # Answered entirely from the prompt cache: a group without members
+                groups.setdefault(draft_hash, (draft_hash, group_id, []))
+        return list(groups.values())
+
+    def pending_shards(self, size: int, since: float, until: float) -> List[Tuple[str, int]]:
+        """
+        Returns the shards of a given size whose outcome is unknown and that were attempted in a time window.
+
+        :param size: Number of requests in the shards
+        :param since: Start of the window, in seconds since the epoch
+        :param until: End of the window, in seconds since the epoch
+        :return: List of (draft hash, shard index), in the order of their attempts
+        """
+        with self._lock:
+            rows = self._conn.execute("""
+                SELECT draft_hash, shard_index FROM shards
+                WHERE state = 'pending' AND stop - start = ? AND attempted_at BETWEEN ? AND ?
+                ORDER BY attempted_at, draft_hash, shard_index""", (size, since, until)).fetchall()
+        return [(draft_hash, index) for draft_hash, index in rows]
+
+    def retire_batches(self, batch_ids: List[str]) -> None:
+        """
+        Records batches that must never be matched to a shard, e.g. because it is not
+        known which of several shards created them.
+
+        :param batch_ids: IDs of the batches
+        """
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR IGNORE INTO retired_batches VALUES (?, ?)",
+                                   ((batch_id, time.time()) for batch_id in batch_ids))
+
+    def known_batch_ids(self) -> Set[str]:
+        """Returns the IDs of all batches recorded in the journal, including retired ones."""
+        with self._lock:
+            rows = self._conn.execute("""
+                SELECT batch_id FROM shards WHERE batch_id IS NOT NULL
+                UNION SELECT batch_id FROM retired_batches""").fetchall()
+        return {row[0] for row in rows}
@@ -0,0 +1,59 @@
+from batch_drafter import BatchDrafter
+
+MODEL = "claude-3-haiku-20240307"
+
+def test_import_files_skips_unreadable_file(tmp_path):
+    first = tmp_path / "first.txt"
+    first.write_text("one\ntwo\n")
+    second = tmp_path / "second.txt"
+    second.write_text("three\n")
+    missing = tmp_path / "missing.txt"
+
+    drafter = BatchDrafter()
+    imported = drafter.import_files([str(first), str(missing), str(second)], MODEL, 100, max_workers=2)
+
+    assert imported == 3
+    assert [request["params"]["messages"][0]["content"] for request in drafter.get_batch()] == ["one", "two", "three"]
+
+def test_imported_default_custom_ids_pass_validation(tmp_path):
+    text_file = tmp_path / "my prompts.v2.txt"
+    text_file.write_text("one\ntwo\n")
+    json_file = tmp_path / "entries.json"
+    json_file.write_text('[{"content": "three"}, {"custom_id": "own", "content": "four"}]')
+    long_file = tmp_path / ("x" * 80 + ".txt")
+    long_file.write_text("five\n")
+
+    drafter = BatchDrafter()
+    for path in [text_file, json_file, long_file]:
+        assert drafter.import_batch(str(path), MODEL, 100)
+
+    custom_ids = [request["custom_id"] for request in drafter.get_batch()]
+    assert custom_ids[:4] == ["my_prompts_v2_1", "my_prompts_v2_2", "entries_1", "own"]
+    assert len(custom_ids[4]) == 64
+    report = drafter.validate_batch()
+    assert report["valid"], report["issues"]
+
+def test_view_batch_shows_content_blocks(tmp_path):
+    json_file = tmp_path / "blocks.json"
+    json_file.write_text('[{"custom_id": "text", "content": [{"type": "text", "text": "describe this"}]},'
+                         ' {"custom_id": "image", "content": [{"type": "image", "source": {"type": "url", "url": "u"}}]}]')
+    drafter = BatchDrafter()
+    assert drafter.import_batch(str(json_file), MODEL, 100) == 2
+
+    table = drafter.view_batch()
+    assert list(table.columns[4].cells) == ["describe this...", "[1 content block]"]
+
+def test_renamed_duplicate_custom_ids_stay_valid(tmp_path):
+    long_id = "x" * 64
+    paths = []
+    for name in ["first.jsonl", "second.jsonl"]:
+        path = tmp_path / name
+        path.write_text('{"custom_id": "%s", "content": "hello"}\n' % long_id)
+        paths.append(str(path))
+
+    drafter = BatchDrafter()
+    assert drafter.import_files(paths, MODEL, 100, max_workers=2) == 2
+
+    custom_ids = [request["custom_id"] for request in drafter.get_batch()]
+    assert custom_ids == [long_id, "x" * 62 + "_2"]
+    assert drafter.validate_batch()["valid"]
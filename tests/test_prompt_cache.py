@@ -0,0 +1,24 @@
+from draft_store import RecordDraftStore
+from prompt_cache import PromptCache
+
+def _request(custom_id, content):
+    return {"custom_id": custom_id, "params": {"model": "claude-3-haiku-20240307", "max_tokens": 10,
+                                               "messages": [{"role": "user", "content": content}]}}
+
+def test_repeat_of_errored_prompt_gets_its_result(tmp_path):
+    cache = PromptCache(str(tmp_path / "cache.sqlite3"))
+    batch = [_request("first", "hello"), _request("repeat", "hello"), _request("other", "bye")]
+    misses = RecordDraftStore()
+    hits, stats = cache.partition(batch, misses)
+    assert hits == {"repeat": cache.prompt_hash(batch[0])}
+
+    cache.record_submission("msgbatch_1", misses, hits)
+    error = {"type": "errored", "error": {"type": "error", "error": {"type": "overloaded_error"}}}
+    cache.record_results("msgbatch_1", [{"custom_id": "first", "result": error},
+                                        {"custom_id": "other", "result": {"type": "succeeded"}}])
+
+    assert list(cache.iter_cached_results("msgbatch_1")) == [{"custom_id": "repeat", "result": error}]
+    assert list(cache.iter_cached_results("msgbatch_1", "succeeded")) == []
+    # Errored results are not reused by later batches
+    hits, stats = cache.partition([_request("again", "hello")], RecordDraftStore())
+    assert hits == {}
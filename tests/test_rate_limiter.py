@@ -0,0 +1,9 @@
+import pytest
+
+from rate_limiter import TokenBucket
+
+def test_acquire_more_than_capacity_raises():
+    bucket = TokenBucket(rate=2, capacity=2)
+    with pytest.raises(ValueError):
+        bucket.acquire(3)
+    bucket.acquire(2)
@@ -0,0 +1,239 @@
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+from itertools import repeat
+import json
+import re
+
+from draft_store import iter_encoded_blocks
+from json_codec import get_codec
+
+# Average number of characters per token, on the low side so that estimates err high
+CHARS_PER_TOKEN = 3.5
+# Tokens added per message for role and formatting
+MESSAGE_OVERHEAD_TOKENS = 4
+# Tokens added per request
+REQUEST_OVERHEAD_TOKENS = 8
+# Approximate cost of one image content block (the API caps images at about 1,600 tokens)
+IMAGE_TOKENS = 1600
+# Maximum number of over-limit requests listed individually
+MAX_LISTED_WARNINGS = 100
+# Number of requests estimated together in one block
+ESTIMATE_BLOCK_SIZE = 4096
+
+# Encoded size of the JSON scaffolding of a request and of each message, which is not text. Compact
+# codecs leave out the spaces after ',' and ':', so counting the compact size keeps estimates on the high side
+REQUEST_JSON_BYTES = len(json.dumps({"custom_id": "", "params": {"model": "", "max_tokens": 0, "messages": []}},
+                                    separators=(",", ":")))
+MESSAGE_JSON_BYTES = len(json.dumps({"role": "user", "content": ""}, separators=(",", ":"))) + len(",")
+
+_MODEL_PATTERN = re.compile(rb'"model":\s*"([^"]*)"')
+_MAX_TOKENS_PATTERN = re.compile(rb'"max_tokens":\s*(\d+)')
+_BINARY_BLOCK_PATTERN = re.compile(rb'"(?:image|document)"')
+
+# Context window and Message Batches prices (USD per million input / output tokens)
+# by model name prefix; the longest matching prefix wins
+MODEL_SPECS: Dict[str, Tuple[int, float, float]] = {
+    "claude-opus-4-5": (200_000, 2.50, 12.50),
+    "claude-opus-4": (200_000, 7.50, 37.50),
+    "claude-sonnet-4": (200_000, 1.50, 7.50),
+    "claude-haiku-4": (200_000, 0.50, 2.50),
+    "claude-3-7-sonnet": (200_000, 1.50, 7.50),
+    "claude-3-5-sonnet": (200_000, 1.50, 7.50),
+    "claude-3-5-haiku": (200_000, 0.40, 2.00),
+    "claude-3-opus": (200_000, 7.50, 37.50),
+    "claude-3-sonnet": (200_000, 1.50, 7.50),
+    "claude-3-haiku": (200_000, 0.125, 0.625),
+}
+# Context window assumed for models not in MODEL_SPECS
+DEFAULT_CONTEXT_WINDOW = 200_000
+
+class TokenEstimator:
+    """
+    Estimates input tokens and cost of a draft locally, without calling the API.
+
+    Token counts are approximated from the length of the text in each request, which
+    is close enough for budgeting but not an exact tokenizer count. Requests are
+    estimated from their encoded JSON without decoding it: everything except the JSON
+    scaffolding counts as text, and only the model and max_tokens are extracted.
+    Requests are processed in blocks of ESTIMATE_BLOCK_SIZE, where the model and
+    max_tokens of the whole block are extracted with one pattern scan each and the
+    per-request counts are computed with map() over the block, so the per-request
+    Python work stays small. Requests with image or document blocks, whose base64
+    data is not text, are decoded and counted content block by content block instead.
+    Spooled drafts are streamed from disk, so memory use does not grow with the draft.
+    """
+    def __init__(self, model_specs: Optional[Dict[str, Tuple[int, float, float]]] = None,
+                 chars_per_token: float = CHARS_PER_TOKEN):
+        """
+        :param model_specs: Context window and batch prices by model name prefix (default: MODEL_SPECS)
+        :param chars_per_token: Average number of characters per token
+        """
+        self.model_specs = model_specs if model_specs is not None else MODEL_SPECS
+        self.chars_per_token = chars_per_token
+        self.codec = get_codec()
+        self._spec_cache: Dict[str, Tuple[int, Optional[float], Optional[float]]] = {}
+
+    def spec_for(self, model: str) -> Tuple[int, Optional[float], Optional[float]]:
+        """
+        Returns the context window and batch prices of a model.
+
+        :param model: Model name
+        :return: Tuple of (context window, input price, output price); prices are None for unknown models
+        """
+        spec = self._spec_cache.get(model)
+        if spec is None:
+            prefixes = [prefix for prefix in self.model_specs if model.startswith(prefix)]
+            if prefixes:
+                spec = self.model_specs[max(prefixes, key=len)]
+            else:
+                spec = (DEFAULT_CONTEXT_WINDOW, None, None)
+            self._spec_cache[model] = spec
+        return spec
+
+    @staticmethod
+    def _content_size(content: Any) -> Tuple[int, int]:
+        """Returns the number of text characters and image or document blocks in message content."""
+        if isinstance(content, str):
+            return len(content), 0
+        chars = 0
+        images = 0
+        for block in content or []:
+            if isinstance(block, str):
+                chars += len(block)
+            elif block.get("type") in ["image", "document"]:
+                images += 1
+            else:
+                chars += len(block.get("text") or "")
+        return chars, images
+
+    def estimate_request(self, encoded: bytes) -> Tuple[str, int, int]:
+        """
+        Returns the model, max_tokens and approximate number of input tokens of one request.
+
+        :param encoded: Encoded JSON of the request
+        :return: Tuple of (model, max_tokens, estimated input tokens)
+        """
+        if _BINARY_BLOCK_PATTERN.search(encoded):
+            return self._estimate_decoded(self.codec.loads(encoded))
+
+        model_match = _MODEL_PATTERN.search(encoded)
+        max_tokens_match = _MAX_TOKENS_PATTERN.search(encoded)
+        model = model_match.group(1).decode("utf-8") if model_match else "Unknown"
+        max_tokens = int(max_tokens_match.group(1)) if max_tokens_match else 0
+        messages = encoded.count(b'"role"')
+        # \uXXXX escapes take six bytes for one character
+        chars = (len(encoded) - REQUEST_JSON_BYTES - messages * MESSAGE_JSON_BYTES - len(model)
+                 - len(str(max_tokens)) - 5 * encoded.count(b"\\u"))
+        tokens = (int(max(chars, 0) / self.chars_per_token)
+                  + messages * MESSAGE_OVERHEAD_TOKENS + REQUEST_OVERHEAD_TOKENS)
+        return model, max_tokens, tokens
+
+    def _estimate_decoded(self, request: Dict) -> Tuple[str, int, int]:
+        """Estimates a decoded request by counting the characters of its text blocks."""
+        params = request.get("params", {})
+        chars, images = self._content_size(params.get("system") or "")
+        messages = params.get("messages", [])
+        for message in messages:
+            message_chars, message_images = self._content_size(message.get("content"))
+            chars += message_chars
+            images += message_images
+        tokens = (int(chars / self.chars_per_token) + images * IMAGE_TOKENS
+                  + len(messages) * MESSAGE_OVERHEAD_TOKENS + REQUEST_OVERHEAD_TOKENS)
+        return params.get("model", "Unknown"), params.get("max_tokens", 0), tokens
+
+    def estimate_block(self, lines: List[bytes]) -> Tuple[List[str], List[int], List[int]]:
+        """
+        Estimates a block of requests at once.
+
+        :param lines: Encoded JSON of the requests
+        :return: Tuple of parallel lists (models, max_tokens, estimated input tokens)
+        """
+        joined = b"\n".join(lines)
+        models = _MODEL_PATTERN.findall(joined)
+        max_tokens = _MAX_TOKENS_PATTERN.findall(joined)
+        if (len(models) != len(lines) or len(max_tokens) != len(lines)
+                or _BINARY_BLOCK_PATTERN.search(joined)):
+            # Not exactly one model and max_tokens per request, or binary content blocks
+            estimates = [self.estimate_request(line) for line in lines]
+            return [e[0] for e in estimates], [e[1] for e in estimates], [e[2] for e in estimates]
+
+        # Scaffolding plus the digits of max_tokens and the model name, per request
+        fixed = [REQUEST_JSON_BYTES + len(model) + len(limit) for model, limit in zip(models, max_tokens)]
+        messages = list(map(bytes.count, lines, repeat(b'"role"')))
+        if b"\\u" in joined:
+            escapes = list(map(bytes.count, lines, repeat(b"\\u")))
+        else:
+            escapes = [0] * len(lines)
+        chars_per_token = self.chars_per_token
+        tokens = [int(max(size - base - count * MESSAGE_JSON_BYTES - 5 * escaped, 0) / chars_per_token)
+                  + count * MESSAGE_OVERHEAD_TOKENS + REQUEST_OVERHEAD_TOKENS
+                  for size, base, count, escaped in zip(map(len, lines), fixed, messages, escapes)]
+        names = {model: model.decode("utf-8") for model in set(models)}
+        return [names[model] for model in models], list(map(int, max_tokens)), tokens
+
+    def estimate(self, batch: Sequence[Dict]) -> Dict:
+        """
+        Estimates the input tokens and cost of a draft.
+
+        :param batch: List of message dictionaries or a spooled draft
+        :return: Dictionary with 'requests', 'input_tokens', 'input_cost', 'max_output_cost',
+                 'models' (the same totals per model, plus 'max_output_tokens'), 'over_limit'
+                 (number of requests whose input plus max_tokens exceeds the model's context
+                 window) and 'warnings' (up to MAX_LISTED_WARNINGS of those requests, by index)
+        """
+        models: Dict[str, Dict] = {}
+        warnings: List[Dict] = []
+        over_limit = 0
+        start = 0
+        for lines in iter_encoded_blocks(batch, ESTIMATE_BLOCK_SIZE):
+            block_models, block_max_tokens, block_tokens = self.estimate_block(lines)
+            distinct_models = set(block_models)
+            for model in distinct_models:
+                totals = models.get(model)
+                if totals is None:
+                    totals = models[model] = {"requests": 0, "input_tokens": 0, "max_output_tokens": 0}
+                context_window = self.spec_for(model)[0]
+                if len(distinct_models) == 1:
+                    # The usual case: the whole block uses one model
+                    selected = range(len(lines))
+                    totals["input_tokens"] += sum(block_tokens)
+                    totals["max_output_tokens"] += sum(block_max_tokens)
+                else:
+                    selected = [i for i, name in enumerate(block_models) if name == model]
+                    totals["input_tokens"] += sum(block_tokens[i] for i in selected)
+                    totals["max_output_tokens"] += sum(block_max_tokens[i] for i in selected)
+                totals["requests"] += len(selected)
+
+                over = [i for i in selected if block_tokens[i] + block_max_tokens[i] > context_window]
+                over_limit += len(over)
+                for i in over:
+                    if len(warnings) < MAX_LISTED_WARNINGS:
+                        # Over-limit requests are rare, so only these are decoded for their custom_id
+                        warnings.append({"index": start + i, "custom_id": self.codec.loads(lines[i]).get("custom_id"),
+                                         "model": model, "input_tokens": block_tokens[i],
+                                         "max_tokens": block_max_tokens[i], "context_window": context_window})
+            start += len(lines)
+        warnings.sort(key=lambda warning: warning["index"])
+
+        input_cost: Optional[float] = 0.0
+        max_output_cost: Optional[float] = 0.0
+        for model, totals in models.items():
+            _, input_price, output_price = self.spec_for(model)
+            if input_price is None:
+                totals["input_cost"] = totals["max_output_cost"] = None
+                input_cost = max_output_cost = None
+                continue
+            totals["input_cost"] = totals["input_tokens"] * input_price / 1e6
+            totals["max_output_cost"] = totals["max_output_tokens"] * output_price / 1e6
+            if input_cost is not None:
+                input_cost += totals["input_cost"]
+                max_output_cost += totals["max_output_cost"]
+
+        return {
+            "requests": sum(totals["requests"] for totals in models.values()),
+            "input_tokens": sum(totals["input_tokens"] for totals in models.values()),
+            "input_cost": input_cost,
+            "max_output_cost": max_output_cost,
+            "models": models,
+            "over_limit": over_limit,
+            "warnings": warnings
+        }
@@ -1,9 +1,16 @@
-from rich.console import Console
 from rich.panel import Panel
-from rich.prompt import Prompt
+from rich.prompt import Prompt, Confirm
 from rich.table import Table
-from rich.layout import Layout
-from rich.text import Text
+from itertools import islice
+import shlex
+from typing import Dict
+
+from app_console import get_console
+from batch_dashboard import BatchDashboard
+from records import ResultRecord
+
+# Number of results shown when viewing the results of a batch
+RESULTS_PREVIEW_ROWS = 50
 
 class UserInterface:
     def __init__(self, batch_drafter, batch_submitter, batch_monitor, batch_manager):
@@ -11,7 +18,8 @@ class UserInterface:
         self.batch_submitter = batch_submitter
         self.batch_monitor = batch_monitor
         self.batch_manager = batch_manager
-        self.console = Console()
+        self.dashboard = BatchDashboard(batch_monitor)
+        self.console = get_console()
 
     def run(self):
         """Main loop for the user interface."""
@@ -35,18 +43,9 @@ class UserInterface:
         menu.add_row("7", "Cancel a batch")
         menu.add_row("q", "Quit")
 
-        layout = Layout()
-        
-        # Ensure batch_monitor.display_batch_statuses() returns a renderable object
-        batch_statuses = self.batch_monitor.display_batch_statuses()
-        if batch_statuses is None:
-            batch_statuses = Text("No active batches", style="yellow")
-
-        layout.split_column(
-            Layout(Panel(batch_statuses, title="Active Batches")),
-            Layout(Panel(menu, title="Menu Options"))
-        )
-        self.console.print(layout)
+        # Only a one-line summary here; the full list is in the live dashboard (option 4)
+        self.console.print(Panel(self.dashboard.summary(), title="Active Batches"))
+        self.console.print(Panel(menu, title="Menu Options"))
 
     def handle_user_input(self):
         """Processes user input and calls appropriate methods."""
@@ -70,11 +69,11 @@ class UserInterface:
         return choice
 
     def import_batch(self):
-        """Handles batch import from file."""
-        file_path = Prompt.ask("Enter the path to the file containing prompts")
+        """Handles batch import from one or more files, directories or glob patterns."""
+        paths = Prompt.ask("Enter the files, directories or glob patterns containing prompts (space-separated)")
         model = Prompt.ask("Enter model name")
         max_tokens = self.get_integer_input("Enter max tokens", default=100)
-        self.batch_drafter.import_batch(file_path, model, max_tokens)
+        self.batch_drafter.import_files(shlex.split(paths), model, max_tokens)
         self.console.print("[green]Batch import completed.[/green]")
         self.display_batch_draft()
 
@@ -108,42 +107,73 @@ class UserInterface:
     def submit_batch(self):
         """Handles batch submission."""
         batch = self.batch_drafter.get_batch()
+        estimate = self.batch_drafter.estimate_batch()
+        if not self.review_estimate(estimate):
+            self.console.print("[yellow]Batch submission cancelled.[/yellow]")
+            return
         batch_id = self.batch_submitter.submit_batch(batch)
         if batch_id:
-            self.batch_monitor.add_batch(batch_id)
+            self.batch_monitor.add_batch(batch_id, models=list(estimate["models"]))
+            self.batch_submitter.acknowledge(batch_id)
             self.console.print(f"[green]Batch submitted successfully. Batch ID: {batch_id}[/green]")
         else:
             self.console.print("[red]Batch submission failed.[/red]")
 
+    def review_estimate(self, estimate: Dict) -> bool:
+        """
+        Shows the estimated tokens and cost of the current draft and lists requests that
+        exceed their model's context window.
+
+        :param estimate: Estimate of the draft from BatchDrafter.estimate_batch
+        :return: False if the user chose not to submit a draft with over-limit requests
+        """
+        self.console.print(self.batch_drafter.format_estimate(estimate))
+        if not estimate["over_limit"]:
+            return True
+        self.console.print(f"[yellow]{estimate['over_limit']} requests exceed their model's context window "
+                           f"(input plus max_tokens):[/yellow]")
+        for warning in estimate["warnings"]:
+            self.console.print(f"[yellow]  #{warning['index']} {warning['custom_id']}: ~{warning['input_tokens']:,} "
+                               f"input + {warning['max_tokens']:,} max tokens > {warning['context_window']:,}[/yellow]")
+        return Confirm.ask("Submit anyway?", default=False)
+
     def monitor_batch(self):
-        """Handles batch monitoring."""
-        self.batch_monitor.update_all_statuses()
-        statuses = self.batch_monitor.display_batch_statuses()
-        if statuses:
-            self.console.print(statuses)
-        else:
-            self.console.print("[yellow]No active batches to monitor.[/yellow]")
+        """Shows the live dashboard of the monitored batches until Ctrl+C is pressed."""
+        self.dashboard.run()
 
     def view_batch_results(self):
         """Handles viewing batch results."""
         batch_id = Prompt.ask("Enter batch ID to view results")
-        results = self.batch_manager.retrieve_batch_results(batch_id)
+        result_type = Prompt.ask("Filter by result type", choices=["all", "succeeded", "errored", "canceled", "expired"],
+                                 default="all")
+        paths = self.batch_manager.download_batch_results(batch_id)
+        group = self.batch_manager.batch_groups.get(batch_id)
+        # A group without member batches was answered entirely from the prompt cache
+        if not paths and (group is None or group.batch_ids):
+            return
+        results = self.batch_manager.retrieve_batch_results(batch_id, None if result_type == "all" else result_type)
         table = Table(title=f"Results for Batch {batch_id}")
+        if paths:
+            table.caption = f"First {RESULTS_PREVIEW_ROWS} results, full results in {', '.join(paths)}"
+        else:
+            table.caption = f"First {RESULTS_PREVIEW_ROWS} results, all answered from the prompt cache"
         table.add_column("Custom ID", style="cyan")
         table.add_column("Status", style="magenta")
         table.add_column("Content", style="green")
-        for result in results:
+        for result in islice(results, RESULTS_PREVIEW_ROWS):
+            record = ResultRecord.from_dict(result)
             table.add_row(
-                result.get('custom_id', 'N/A'),
-                result.get('status', 'N/A'),
-                result.get('content', 'N/A')[:50] + '...'  # Truncate long content
+                record.custom_id or 'N/A',
+                record.type or 'N/A',
+                (record.text or record.error_message or result.get('content', 'N/A'))[:50] + '...'  # Truncate long content
             )
         self.console.print(table)
 
     def list_all_batches(self):
         """Handles listing all batches."""
         limit = int(Prompt.ask("Enter number of batches to list", default="20"))
-        batches = self.batch_manager.list_all_batches(limit)
+        status = Prompt.ask("Filter by status", choices=["all", "in_progress", "canceling", "ended"], default="all")
+        batches = self.batch_manager.search_batches(status=None if status == "all" else status, limit=limit)
         table = Table(title="All Batches")
         table.add_column("Batch ID", style="cyan")
         table.add_column("Status", style="magenta")